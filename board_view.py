@@ -0,0 +1,184 @@
+"""
+Board panel for games against a model.
+The board, the last move and the recent moves are pinned to the top rows of
+the terminal, and the game's messages and prompts scroll in a region below.
+Every cell of the panel, a square, a line of the move list or the status
+line, has a key such as the piece on the square and whether it is
+highlighted. After a ply only the cells whose key changed are rebuilt and
+written in place, usually the squares the last two moves touched, one line of
+the move list and the status. A ply then costs a few hundred bytes over the
+wire rather than a redraw of the whole screen. The time each update takes is
+recorded. On output that is not a terminal the panel is printed whole after
+every ply instead.
+"""
+
+import time
+
+import chess
+from rich.text import Text
+
+from metrics import percentile
+
+LIGHT_SQUARE = "on #f0d9b5"
+DARK_SQUARE = "on #b58863"
+LIGHT_HIGHLIGHT = "on #cdd26a"
+DARK_HIGHLIGHT = "on #aaa23a"
+WHITE_PIECE = "bold #ffffff"
+BLACK_PIECE = "bold #000000"
+# Filled glyphs for both sides, the colour tells them apart
+GLYPHS = {piece_type: chess.UNICODE_PIECE_SYMBOLS[symbol]
+          for piece_type, symbol in zip(chess.PIECE_TYPES, "pnbrqk")}
+
+# Full moves shown next to the board
+MOVE_ROWS = 8
+# Lines of the panel: file labels, 8 ranks, file labels, status
+PANEL_HEIGHT = 11
+
+# Escape codes used to pin the panel, see ECMA-48
+_SAVE_CURSOR = "\x1b7"
+_RESTORE_CURSOR = "\x1b8"
+_ERASE_TO_END = "\x1b[K"
+
+
+def _move_to(row: int, column: int = 1):
+    return f"\x1b[{row};{column}H"
+
+
+class BoardView:
+    """Board panel updated square by square after every ply"""
+
+    def __init__(self, console, orientation: bool = chess.WHITE):
+        self.console = console
+        self.orientation = orientation
+        # Seconds each update took and cells it wrote
+        self.render_times = []
+        self.cells_written = 0
+        self._keys = {}
+        self._pinned = False
+
+    def _files(self):
+        files = "abcdefgh" if self.orientation == chess.WHITE else "hgfedcba"
+        return Text("   " + "".join(f" {file} " for file in files), style="dim")
+
+    @staticmethod
+    def _square(square: int, piece, highlighted: bool):
+        light = (chess.square_file(square) + chess.square_rank(square)) % 2 == 1
+        if highlighted:
+            square_style = LIGHT_HIGHLIGHT if light else DARK_HIGHLIGHT
+        else:
+            square_style = LIGHT_SQUARE if light else DARK_SQUARE
+        if piece is None:
+            return Text("   ", style=square_style)
+        piece_style = WHITE_PIECE if piece.color == chess.WHITE else BLACK_PIECE
+        return Text(f" {GLYPHS[piece.piece_type]} ", style=f"{piece_style} {square_style}")
+
+    def _panel(self, board: chess.Board, san_moves):
+        """
+        Every cell of the panel.
+
+        Returns:
+            list: (row, column, key, builder) tuples, a cell is only rebuilt and
+                written when its key changes
+        """
+        last_move = board.move_stack[-1] if board.move_stack else None
+        highlight = {last_move.from_square, last_move.to_square} if last_move else set()
+
+        # The move list is shown a page of MOVE_ROWS full moves at a time, so that
+        # a new move adds one line instead of scrolling all of them
+        full_moves = (len(san_moves) + 1) // 2
+        first_move = max(0, (full_moves - 1) // MOVE_ROWS * MOVE_ROWS)
+
+        files = range(8) if self.orientation == chess.WHITE else range(7, -1, -1)
+        ranks = range(7, -1, -1) if self.orientation == chess.WHITE else range(8)
+        cells = [(0, 0, ("files", self.orientation), self._files)]
+        for row, rank in enumerate(ranks, start=1):
+            cells.append((row, 0, ("rank", rank), lambda rank=rank: Text(f" {rank + 1} ")))
+            for column, file in enumerate(files):
+                square = chess.square(file, rank)
+                key = (square, board.piece_at(square), square in highlight)
+                cells.append((row, 3 + 3 * column, key, lambda key=key: self._square(*key)))
+            number = first_move + row - 1
+            pair = tuple(san_moves[2 * number:2 * number + 2])
+            moves = f"   {number + 1}. {' '.join(pair)}" if pair else ""
+            cells.append((row, 27, ("moves", moves), lambda moves=moves: Text(moves, style="cyan")))
+        cells.append((9, 0, ("files", self.orientation), self._files))
+
+        side = "White" if board.turn == chess.WHITE else "Black"
+        status = f"{side} to move" + (", check!" if board.is_check() else "")
+        if last_move is not None and san_moves:
+            status = f"Last move: {san_moves[-1]}   {status}"
+        cells.append((10, 0, ("status", status), lambda: Text(status, style="bold")))
+        return cells
+
+    def attach(self):
+        """Clears the screen and pins the panel above a scrolling region"""
+        if not self.console.is_terminal:
+            return
+        rows = self.console.size.height
+        self.console.file.write(
+            f"\x1b[2J\x1b[{PANEL_HEIGHT + 2};{rows}r" + _move_to(PANEL_HEIGHT + 2))
+        self.console.file.flush()
+        self._keys = {}
+        self._pinned = True
+
+    def update(self, board: chess.Board, san_moves):
+        """
+        Shows a position, writing only the cells of the panel that changed.
+
+        Args:
+            board (chess.Board): Current position, its last move is highlighted
+            san_moves (list): Moves of the game in SAN
+        """
+        started = time.perf_counter()
+        cells = self._panel(board, san_moves)
+        if not self._pinned:
+            line = Text()
+            for index, (row, _, _, build) in enumerate(cells):
+                line.append_text(build())
+                if index + 1 == len(cells) or cells[index + 1][0] != row:
+                    self.console.print(line, soft_wrap=True)
+                    line = Text()
+            self.cells_written += len(cells)
+        else:
+            changed = [(row, column, build()) for row, column, key, build in cells
+                       if self._keys.get((row, column)) != key]
+            if changed:
+                line_ends = {row: column for row, column, _, _ in cells}
+                self.console.file.write(_SAVE_CURSOR)
+                for row, column, text in changed:
+                    self.console.file.write(_move_to(row + 1, column + 1))
+                    self.console.print(text, end="", soft_wrap=True)
+                    if line_ends[row] == column:
+                        # Text at the end of a line may be shorter than before
+                        self.console.file.write(_ERASE_TO_END)
+                self.console.file.write(_RESTORE_CURSOR)
+                self.console.file.flush()
+            self._keys = {(row, column): key for row, column, key, _ in cells}
+            self.cells_written += len(changed)
+        self.render_times.append(time.perf_counter() - started)
+
+    def detach(self):
+        """Releases the scrolling region, the panel stays on screen"""
+        if not self._pinned:
+            return
+        rows = self.console.size.height
+        self.console.file.write("\x1b[r" + _move_to(rows) + "\n")
+        self.console.file.flush()
+        self._pinned = False
+
+    def render_summary(self):
+        """
+        Time the updates took.
+
+        Returns:
+            dict: updates, p50, p95 and max in seconds and cells written, None before any update
+        """
+        if not self.render_times:
+            return None
+        return {
+            "updates": len(self.render_times),
+            "p50": percentile(self.render_times, 50),
+            "p95": percentile(self.render_times, 95),
+            "max": max(self.render_times),
+            "cells": self.cells_written,
+        }
@@ -0,0 +1,283 @@
+"""
+Record and replay of provider answers.
+In record mode every prompt sent to a model is stored with the answer, or
+the error, it got in a cassette: a JSON lines file with one call per line,
+keyed by the hash of the model name and the prompt. In replay mode the
+answers are served from the cassette instead of calling the provider, so a
+recorded game or tournament runs again without the network, at the speed of
+the harness, and fails where the recorded run failed. The cassette is
+indexed when it is opened, the index keeps the offset of every line by key,
+and a lookup reads one line. The same prompt recorded more than once gets
+its answers back in the order they were recorded.
+
+Games also toss a coin for the sides. The result of such a choice is stored
+in the cassette as well, so a replayed game gets the sides and with them the
+prompts of the recorded one.
+
+The interactive game uses a cassette when CHESS_CASSETTE names one, with
+CHESS_CASSETTE_MODE set to record (the default) or replay.
+
+Usage: python cassette.py calls.cassette.jsonl
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+
+from rich.console import Console
+from rich.table import Table
+
+console = Console()
+
+MODES = ("record", "replay")
+
+_default_cassette = None
+_default_cassette_loaded = False
+_default_cassette_lock = threading.Lock()
+# Exception classes standing in for the ones of the provider SDKs
+_error_types = {}
+
+
+def prompt_key(model: str, prompt_text: str):
+    """Key of a prompt in the cassette"""
+    return hashlib.sha256(f"{model}\n{prompt_text}".encode("utf-8")).hexdigest()
+
+
+def replayed_error(error: dict):
+    """
+    The exception a recorded call failed with.
+
+    Args:
+        error (dict): type, message and status_code of the recorded error
+
+    Returns:
+        Exception: Instance of a class named like the original one, carrying its
+            message and status code, so it is reported and measured the same way
+    """
+    error_type = _error_types.get(error["type"])
+    if error_type is None:
+        error_type = _error_types[error["type"]] = type(error["type"], (RuntimeError,), {})
+    exception = error_type(error["message"])
+    exception.status_code = error.get("status_code")
+    return exception
+
+
+class Cassette:
+    """Provider answers in a JSON lines file, indexed by prompt key"""
+
+    def __init__(self, path: str, mode: str = "record"):
+        if mode not in MODES:
+            raise ValueError(f"Unknown cassette mode: {mode}, choose from: {', '.join(MODES)}")
+        self.path = path
+        self.mode = mode
+        self.hits = 0
+        self.misses = 0
+        # Byte offsets of the lines of every key, and how many of them were replayed
+        self._index = {}
+        self._served = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            self._load_index()
+        if mode == "record":
+            self._file = open(path, "ab")
+        else:
+            self._file = open(path, "rb")
+
+    def _load_index(self):
+        with open(self.path, "rb") as cassette_file:
+            offset = 0
+            for line in cassette_file:
+                try:
+                    key = json.loads(line)["key"]
+                except (ValueError, KeyError):
+                    # A line cut short by a crash while recording
+                    key = None
+                if key is not None:
+                    self._index.setdefault(key, []).append(offset)
+                offset += len(line)
+
+    @property
+    def replaying(self):
+        return self.mode == "replay"
+
+    def __len__(self):
+        return sum(len(offsets) for offsets in self._index.values())
+
+    def lookup(self, key: str):
+        """
+        The next recorded entry of a key.
+
+        Args:
+            key (str): Key from prompt_key, or the name of a recorded choice
+
+        Returns:
+            dict: The recorded entry, or None if the key was never recorded. After
+                the last entry of a key it is served again.
+        """
+        with self._lock:
+            offsets = self._index.get(key)
+            if not offsets:
+                self.misses += 1
+                return None
+            served = self._served.get(key, 0)
+            self._served[key] = served + 1
+            self._file.seek(offsets[min(served, len(offsets) - 1)])
+            line = self._file.readline()
+            self.hits += 1
+        return json.loads(line)
+
+    def record(self, key: str, entry: dict):
+        """Append an entry to the cassette and the index"""
+        line = json.dumps({"key": key, "recorded": time.time(), **entry}).encode("utf-8") + b"\n"
+        with self._lock:
+            self._file.seek(0, os.SEEK_END)
+            offset = self._file.tell()
+            self._file.write(line)
+            self._file.flush()
+            self._index.setdefault(key, []).append(offset)
+
+    def choice(self, name: str, make):
+        """
+        A choice of the harness, such as the coin toss for the sides, taken the
+        same way in a replay as in the recorded run.
+
+        Args:
+            name (str): Key of the choice, distinct for every game
+            make (callable): Takes the choice when recording or if none was recorded
+
+        Returns:
+            The value of the choice, JSON serializable
+        """
+        if self.replaying:
+            entry = self.lookup(f"choice|{name}")
+            if entry is not None:
+                return entry["value"]
+            return make()
+        value = make()
+        self.record(f"choice|{name}", {"choice": name, "value": value})
+        return value
+
+    async def call(self, model: str, prompt_text: str, request, call=None):
+        """
+        Answers a prompt from the cassette when replaying, else asks the provider
+        and records the answer.
+
+        Args:
+            model (str): Model name as shown in the menus
+            prompt_text (str): Full prompt sent to the model
+            request (callable): Coroutine function asking the provider
+            call (CallMetrics): Measurements of the running call, tokens are taken
+                from it when recording and restored into it when replaying
+
+        Returns:
+            str: Raw text answer of the model
+
+        Raises:
+            LookupError: If the prompt is not in the cassette when replaying
+        """
+        key = prompt_key(model, prompt_text)
+        if self.replaying:
+            entry = self.lookup(key)
+            if entry is None:
+                raise LookupError(f"No recorded answer of {model} for prompt {key[:12]} "
+                                  f"in {self.path}")
+            if call is not None:
+                call.input_tokens = entry.get("input_tokens")
+                call.output_tokens = entry.get("output_tokens")
+            if "error" in entry:
+                raise replayed_error(entry["error"])
+            return entry["response"]
+
+        entry = {"model": model, "prompt": prompt_text}
+        started = time.perf_counter()
+        try:
+            response = await request()
+            entry["response"] = response
+            return response
+        except Exception as e:
+            entry["error"] = {"type": type(e).__name__, "message": str(e),
+                              "status_code": getattr(e, "status_code", None)}
+            raise
+        finally:
+            entry["latency"] = time.perf_counter() - started
+            if call is not None:
+                entry["input_tokens"] = call.input_tokens
+                entry["output_tokens"] = call.output_tokens
+            self.record(key, entry)
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+
+def configure_cassette(path: str = None, mode: str = "record"):
+    """
+    Records to or replays from a cassette in this process, or stops using one.
+
+    Args:
+        path (str): Cassette file, None to call the providers without a cassette
+        mode (str): "record" or "replay"
+    """
+    set_cassette(Cassette(path, mode) if path else None)
+
+
+def get_cassette():
+    """The process wide cassette, opened from CHESS_CASSETTE on first use, or None"""
+    global _default_cassette, _default_cassette_loaded
+    with _default_cassette_lock:
+        if not _default_cassette_loaded:
+            path = os.environ.get("CHESS_CASSETTE")
+            if path:
+                _default_cassette = Cassette(path, os.environ.get("CHESS_CASSETTE_MODE", "record"))
+            _default_cassette_loaded = True
+    return _default_cassette
+
+
+def set_cassette(cassette: Cassette):
+    """Replace the process wide cassette"""
+    global _default_cassette, _default_cassette_loaded
+    with _default_cassette_lock:
+        if _default_cassette is not None and _default_cassette is not cassette:
+            _default_cassette.close()
+        _default_cassette = cassette
+        _default_cassette_loaded = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show what a cassette holds")
+    parser.add_argument("path", help="Cassette file")
+    args = parser.parse_args()
+
+    table = Table(title=f"Recorded calls in {args.path}")
+    table.add_column("Model", style="cyan")
+    table.add_column("Calls", justify="right")
+    table.add_column("Distinct prompts", justify="right")
+    table.add_column("Errors", justify="right")
+    table.add_column("Latency", justify="right")
+    models = {}
+    with open(args.path, "r", encoding="utf-8") as cassette_file:
+        for line in cassette_file:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if "model" not in entry:
+                continue
+            stats = models.setdefault(entry["model"], {"calls": 0, "keys": set(), "errors": 0,
+                                                       "latency": 0.0})
+            stats["calls"] += 1
+            stats["keys"].add(entry["key"])
+            stats["errors"] += "error" in entry
+            stats["latency"] += entry.get("latency") or 0.0
+    for model, stats in sorted(models.items()):
+        table.add_row(model, str(stats["calls"]), str(len(stats["keys"])), str(stats["errors"]),
+                      f"{stats['latency']:.1f}s")
+    console.print(table)
+
+
+if __name__ == "__main__":
+    main()
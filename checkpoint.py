@@ -0,0 +1,181 @@
+"""
+Per ply checkpoints of benchmark games.
+A checkpoint is a journal next to the game record. It starts with a line
+naming the players and their sides and the opening played, and every
+completed ply appends one line: the round it finished, the transcript lines
+and provider calls it added, the state of the opening book's random
+generator if the ply used the book, and how far the record was written. The
+moves themselves are read back from the record. Appending keeps the cost of
+a ply constant however long the game gets. The journal is synced to disk
+after the record every sync_every plies. A game started again with resume
+picks up after the last ply found in both files and does not pay again for
+the answers before it.
+"""
+
+import glob
+import json
+import os
+
+import game_record
+
+CHECKPOINT_VERSION = 2
+
+
+class Checkpoint:
+    """Writer for the journal of one game, usable as a context manager"""
+
+    def __init__(self, record_path: str, header: dict = None, resume_at: int = None,
+                 sync_every: int = 1):
+        """
+        Opens a journal for writing.
+
+        Args:
+            record_path (str): Record file of the game
+            header (dict): JSON serializable description of a new game, written first
+            resume_at (int): Size of the journal returned by load_checkpoint to continue
+                it at, anything after it is dropped
+            sync_every (int): Plies between syncs of the record and the journal to disk
+        """
+        self.path = game_record.checkpoint_path(record_path)
+        self.sync_every = max(1, sync_every)
+        self._unsynced = 0
+        if resume_at is not None:
+            with open(self.path, "r+b") as journal_file:
+                journal_file.truncate(resume_at)
+            self._file = open(self.path, "a", encoding="utf-8")
+        else:
+            self._file = open(self.path, "w", encoding="utf-8")
+            self._write({"type": "header", "version": CHECKPOINT_VERSION, **(header or {})})
+            self._file.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _write(self, entry: dict):
+        self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def add_ply(self, record, **entry):
+        """
+        Appends a completed ply.
+
+        Args:
+            record (GameRecord): Record of the game, written up to and including the ply
+            **entry: JSON serializable fields of the ply, see play_benchmark_game_async
+        """
+        self._unsynced += 1
+        durable = self._unsynced >= self.sync_every
+        # The record goes to disk first, the journal never points past it
+        offset = record.sync(durable)
+        self._write({"type": "ply", "record_offset": offset, "record_plies": record.plies,
+                     **entry})
+        self._file.flush()
+        if durable:
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+
+def load_checkpoint(record_path: str):
+    """
+    The journal of a game, read back as one state.
+
+    Args:
+        record_path (str): Record file of the game
+
+    Returns:
+        dict: The header fields, with the transcript lines and calls of every ply
+            appended, the round, round_plies, book_plies, record_offset and
+            record_plies of the last ply, the last saved book_rng, the number of
+            plies journaled and journal_offset, the size to continue the journal at.
+            None if there is no journal or it cannot be used.
+    """
+    try:
+        with open(game_record.checkpoint_path(record_path), "rb") as journal_file:
+            lines = journal_file.readlines()
+    except OSError:
+        return None
+    if not os.path.exists(record_path):
+        return None
+    record_size = os.path.getsize(record_path)
+
+    data, offset = None, 0
+    for line in lines:
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            # A line cut short by a crash, everything after it is lost as well
+            break
+        if data is None:
+            if entry.get("type") != "header" or entry.get("version") != CHECKPOINT_VERSION:
+                return None
+            data = {**entry, "calls": list(entry.get("calls", [])), "plies": 0}
+        elif entry["record_offset"] > record_size:
+            # The record lost this ply in a crash before it reached the disk
+            break
+        else:
+            data["transcript"].extend(entry["transcript"])
+            data["calls"].extend(entry["calls"])
+            for name in ("round", "round_plies", "book_plies", "record_offset",
+                         "record_plies"):
+                data[name] = entry[name]
+            if entry.get("book_rng") is not None:
+                data["book_rng"] = entry["book_rng"]
+            data["plies"] += 1
+        offset += len(line)
+    if data is None:
+        return None
+    data["journal_offset"] = offset
+    return data
+
+
+def remove_checkpoint(record_path: str):
+    """Deletes the checkpoint of a finished game"""
+    try:
+        os.remove(game_record.checkpoint_path(record_path))
+    except FileNotFoundError:
+        pass
+
+
+def encode_random_state(state):
+    """random.Random.getstate() as JSON"""
+    version, internal, gauss = state
+    return [version, list(internal), gauss]
+
+
+def decode_random_state(state):
+    """Inverse of encode_random_state, for random.Random.setstate()"""
+    version, internal, gauss = state
+    return version, tuple(internal), gauss
+
+
+def is_finished(record_path: str):
+    """True if the record of a game ends with its result"""
+    if not os.path.exists(record_path):
+        return False
+    return game_record.read_record(record_path)[2] is not None
+
+
+def unfinished_games(directory: str = ".", pattern: str = "benchmark_*.checkpoint.json"):
+    """
+    Games with a checkpoint that can be resumed.
+
+    Args:
+        directory (str): Directory searched for checkpoints
+        pattern (str): Glob pattern of the checkpoint files
+
+    Returns:
+        list: (record path, checkpoint dict) tuples, the most recent first
+    """
+    games = []
+    for path in glob.glob(os.path.join(directory, pattern)):
+        record_path = path[:-len(".checkpoint.json")] + ".jsonl"
+        data = load_checkpoint(record_path)
+        if data is not None and not is_finished(record_path):
+            games.append((record_path, data))
+    return sorted(games, key=lambda game: os.path.getmtime(game[0]), reverse=True)
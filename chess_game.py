@@ -1,144 +1,181 @@
-from modelPrompt import CHAT_GPT_PROMPT, CLAUDE_SONNET_4_PROMPT, GEMINI_2_5_FLASH_PROMPT, DEEPSEEK_R1_PROMPT
+import asyncio
+import chess
+import os
 import random
-import anthropic
-import rich
 from rich.console import Console
 from rich.panel import Panel
-from google import genai
-from openai import OpenAI
+from rich.prompt import Confirm
 import chess_move_validator
-
-
-def gpt_move(move: str, prompt_text: str, api_key: str):
-    console = Console()
-
-    # If prompt_text is not provided, build it from scratch
+import move_cache
+import providers
+import game_record
+import checkpoint
+import cassette
+import speculation
+import hedging
+import provider_registry
+import metrics
+import move_parser
+import prompt_strategies
+import opening_book
+import terminal_ui
+from board_view import BoardView
+from game_state import GameState, MoveReply, Player
+import time
+import uuid
+
+
+def build_provider_prompt(move: str, prompt_text: str, state: GameState = None):
+    """
+    Build the full prompt from scratch unless it has already been built.
+
+    Args:
+        move (str): Last move played, shown as the state of the board
+        prompt_text (str): Model prompt, or a prompt built before, which is sent as is
+        state (GameState): Game whose transcript is sent. Without it the transcript is read
+            from logger.txt, as the blocking provider calls always did.
+    """
     if not prompt_text.startswith("here is your prompt"):
-        game_state = open("logger.txt", "r").read()
+        if state is not None:
+            game_state = state.transcript()
+        else:
+            try:
+                with open("logger.txt", "r") as logger:
+                    game_state = logger.read()
+            except FileNotFoundError:
+                game_state = ""
         prompt_text = f"here is your prompt: {prompt_text}\n\n"
         prompt_text += f"here is the current state of the board: {move}\n\n"
         prompt_text += f"here is the current state of the game: {game_state}\n\n"
+    return prompt_text
 
-    console.print(f"[bold green]GPT is thinking...[/bold green]")
-    client = OpenAI(api_key=api_key)
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[{"role": "user", "content": prompt_text}],
-        max_tokens=50  # Limit tokens to encourage brief responses
-    )
-    return response.choices[0].message.content
 
+# Blocking calls of one provider, state is optional and replaces the transcript in logger.txt
+def gpt_move(move: str, prompt_text: str, api_key: str, state: GameState = None):
+    return providers.run_blocking(providers.request_move(
+        "gpt 4o", build_provider_prompt(move, prompt_text, state), api_key))
 
-def gemini_move(move: str, prompt_text: str, api_key: str):
-    console = Console()
 
-    # If prompt_text is not provided, build it from scratch
-    if not prompt_text.startswith("here is your prompt"):
-        game_state = open("logger.txt", "r").read()
-        prompt_text = f"here is your prompt: {prompt_text}\n\n"
-        prompt_text += f"here is the current state of the board: {move}\n\n"
-        prompt_text += f"here is the current state of the game: {game_state}\n\n"
+def gemini_move(move: str, prompt_text: str, api_key: str, state: GameState = None):
+    return providers.run_blocking(providers.request_move(
+        "gemini 2.5 flash", build_provider_prompt(move, prompt_text, state), api_key))
 
-    console.print(f"[bold green]Gemini is thinking...[/bold green]")
-    client = genai.Client(api_key=api_key)
-    response = client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=prompt_text,
-        # Limit tokens for brief responses
-        generation_config={"max_output_tokens": 50}
-    )
-    return response.text
 
+def claude_move(move: str, prompt_text: str, api_key: str, state: GameState = None):
+    return providers.run_blocking(providers.request_move(
+        "claude sonnet 4", build_provider_prompt(move, prompt_text, state), api_key))
 
-def claude_move(move: str, prompt_text: str, api_key: str):
-    console = Console()
 
-    # If prompt_text is not provided, build it from scratch
-    if not prompt_text.startswith("here is your prompt"):
-        game_state = open("logger.txt", "r").read()
-        prompt_text = f"here is your prompt: {prompt_text}\n\n"
-        prompt_text += f"here is the current state of the board: {move}\n\n"
-        prompt_text += f"here is the current state of the game: {game_state}\n\n"
+def model_move_benchmark(model: str, move_list, prompt: str, api_key: str,
+                         state: GameState, console=None, use_cache: bool = True):
+    return providers.run_blocking(model_move_benchmark_async(
+        model, move_list, prompt, api_key, state, console, use_cache))
 
-    console.print(f"[bold green]Claude is thinking...[/bold green]")
-    client = anthropic.Anthropic(api_key=api_key)
 
-    try:
-        response = client.messages.create(
-            model="claude-3-7-sonnet-latest",
-            messages=[{"role": "user", "content": prompt_text}],
-            max_tokens=50  # Limit tokens to encourage brief responses
-        )
-        return response.content[0].text
-    except Exception as e:
-        console.print(f"[bold red]Claude API error: {str(e)}[/bold red]")
-        console.print("[yellow]Returning default move...[/yellow]")
-        return "e4"  # Return a default opening move as last resort
+async def model_move_benchmark_async(model: str, move_list, prompt: str, api_key: str,
+                                     state: GameState, console=None, use_cache: bool = True):
+    reply = await request_benchmark_move(
+        model, move_list, prompt, api_key, state, console, use_cache)
+    if reply.cache_key is not None and not reply.cached and reply.raw:
+        move_cache.get_cache().put(reply.cache_key, reply.raw)
+    return reply.move
 
 
-def model_move_benchmark(model: str, move_list, prompt: str, api_key: str):
-    console = Console()
+def extract_move(response: str):
+    """Extract just the move from a model response"""
+    return move_parser.extract_move(response)
 
-    # Convert the move list to a string if it's a list
-    if isinstance(move_list, list):
-        if not move_list:  # If the list is empty
-            move_str = "Starting position"
-        else:
-            # Filter out None values and convert all items to strings
-            valid_moves = [str(move) for move in move_list if move is not None]
-            if valid_moves:
-                move_str = ", ".join(valid_moves)  # Join moves with commas
-            else:
-                move_str = "Starting position"  # If all moves were None
-    else:
-        move_str = str(
-            move_list) if move_list is not None else "Starting position"
 
-    game_state = open("logger.txt", "r").read()
+async def request_benchmark_move(model: str, move_list, prompt: str, api_key: str,
+                                 state: GameState, console=None, use_cache: bool = True,
+                                 retry_note: str = None,
+                                 prompt_strategy: str = prompt_strategies.DEFAULT_STRATEGY):
+    """
+    Asks a model for its next benchmark move.
+    Cached answers are looked up here but only stored by the caller once the move
+    turned out to be legal. With a hedging policy configured the prompt may be sent
+    more than once, see hedging.
+
+    Args:
+        model (str): Model name
+        move_list (list): Moves of the opponent so far
+        prompt (str): System prompt of the model
+        api_key (str): API key for the model
+        state (GameState): State of the game
+        console (Console): Rich console used for output
+        use_cache (bool): Look the answer up in the move cache first
+        retry_note (str): Explanation added to the prompt when asking again after an illegal move
+        prompt_strategy (str): Name of the prompt strategy building the prompt text
+
+    Returns:
+        MoveReply: The extracted move ("error" if the provider failed) and details of the answer
+    """
+    console = console or Console()
 
-    # Create a more explicit prompt for the benchmark mode
-    prompt_text = f"here is your prompt: {prompt}\n\n"
-    prompt_text += f"You are playing chess in a benchmark. Please make a valid chess move.\n\n"
-    prompt_text += f"Previous moves: {move_str}\n\n"
-    prompt_text += f"Game state: {game_state}\n\n"
-    prompt_text += f"Respond ONLY with your next chess move in standard notation (e.g., 'e4', 'Nf3', etc.).\n"
-    prompt_text += f"Do not include any explanations or additional text. Just the move."
+    prompt_text = prompt_strategies.build_prompt(
+        prompt_strategy, prompt, state, move_list, retry_note)
 
     # Debug output to see what's being sent to the model
     console.print(f"[dim]Sending prompt to {model}...[/dim]")
 
+    # Answers are reused for the same position, model and prompt
+    # A retry must not be answered with the same cached move again.
+    # With a cassette every answer goes through it, so a replay asks for the same prompts.
+    cache_key = None
+    position = state.position()
+    if (use_cache and position is not None and not retry_note
+            and cassette.get_cassette() is None):
+        cache_key = move_cache.cache_key(
+            position, model, move_cache.prompt_version(prompt, prompt_strategy))
+
     response = None
+    reply = MoveReply(None, cache_key=cache_key)
     try:
-        match model:
-            case "claude sonnet 4":
-                response = claude_move(move_str, prompt_text, api_key)
-            case "gemini 2.5 flash":
-                response = gemini_move(move_str, prompt_text, api_key)
-            case "chatgpt 4o":
-                response = gpt_move(move_str, prompt_text, api_key)
-            case "gpt 4o":
-                response = gpt_move(move_str, prompt_text, api_key)
-
-        # Clean up the response - extract just the move
-        if response:
-            # Strip whitespace and extract only the first word (likely the move)
-            response = response.strip()
-            # If response contains multiple words/lines, take just the first word
-            if ' ' in response or '\n' in response:
-                response = response.split()[0]
-
-            console.print(f"[dim]Raw response: {response}[/dim]")
-
-        return response
+        if cache_key is not None:
+            response = move_cache.get_cache().get(cache_key)
+
+        if response is not None:
+            reply.cached = True
+            console.print(f"[dim]Using cached response for {model}[/dim]")
+        elif hedging.config.mode != "off":
+            def move_key(answer):
+                move = state.parse(extract_move(answer) or "")
+                return move.uci() if move is not None else None
+
+            response, reply.metrics, _ = await hedging.request(
+                model, lambda: providers.request_move(model, prompt_text, api_key, state.board),
+                move_key)
+            if reply.metrics is not None:
+                reply.metrics.strategy = prompt_strategy
+                reply.latency = reply.metrics.total
+                reply.tokens = reply.metrics.tokens()
+        else:
+            with metrics.capture() as calls:
+                try:
+                    response = await providers.request_move(
+                        model, prompt_text, api_key, state.board)
+                finally:
+                    if calls:
+                        reply.metrics = calls[-1]
+                        reply.metrics.strategy = prompt_strategy
+                        reply.latency = reply.metrics.total
+                        reply.tokens = reply.metrics.tokens()
+
+        reply.raw = response
+        reply.move = extract_move(response)
+        if reply.move:
+            console.print(f"[dim]Raw response: {reply.move}[/dim]")
+        return reply
     except Exception as e:
         console.print(
             f"[bold red]Error getting move from {model}: {str(e)}[/bold red]")
-        return "error"
+        reply.move = "error"
+        return reply
 
 
-def model_move(model: str, move: str, prompt: str, api_key: str):
-    # Create a more explicit prompt for chess moves
-    game_state = open("logger.txt", "r").read()
+def build_move_prompt(move: str, prompt: str, state: GameState, retry_note: str = None):
+    """Create a more explicit prompt for chess moves"""
+    game_state = state.transcript()
 
     enhanced_prompt = f"here is your prompt: {prompt}\n\n"
     enhanced_prompt += f"You are playing chess. Please make a valid chess move.\n\n"
@@ -146,33 +183,73 @@ def model_move(model: str, move: str, prompt: str, api_key: str):
     enhanced_prompt += f"Game state: {game_state}\n\n"
     enhanced_prompt += f"Respond ONLY with your next chess move in standard notation (e.g., 'e4', 'Nf3', etc.).\n"
     enhanced_prompt += f"Do not include any explanations or additional text. Just the move."
+    if retry_note:
+        enhanced_prompt += f"\n\n{retry_note}"
+    return enhanced_prompt
+
+
+def model_move(model: str, move: str, prompt: str, api_key: str, state: GameState):
+    enhanced_prompt = build_move_prompt(move, prompt, state)
+    return providers.run_blocking(providers.request_move(
+        model, enhanced_prompt, api_key, state.board))
+
+
+async def model_move_async(model: str, move: str, prompt: str, api_key: str, state: GameState,
+                           retry_note: str = None):
+    enhanced_prompt = build_move_prompt(move, prompt, state, retry_note)
+    return await providers.request_move(model, enhanced_prompt, api_key, state.board)
+
+
+async def request_legal_move(player: Player, state: GameState, request, max_retries: int = 2,
+                             console=None, on_attempt=None):
+    """
+    Asks a model for moves until one of them is legal on the board.
+
+    Args:
+        player (Player): Player to move
+        state (GameState): State of the game, not changed here
+        request: Coroutine function taking a retry note (None on the first try) and returning a MoveReply
+        max_retries (int): Number of extra tries after an illegal answer
+        console (Console): Rich console used for output
+        on_attempt: Optional callback(attempt, reply, move) called for every answer,
+            move being the parsed chess.Move or None if the answer was illegal
+
+    Returns:
+        tuple: (MoveReply of the last answer, SAN of the legal move or None if every try failed)
+    """
+    console = console or Console()
+    retry_note = None
+
+    for attempt in range(max_retries + 1):
+        reply = await request(retry_note)
+        if reply.move == "error":
+            return reply, None
+
+        move = state.parse(reply.move)
+        if on_attempt:
+            on_attempt(attempt, reply, move)
+        if move is not None:
+            return reply, state.board.san(move)
 
-    match model:
-        case "gpt 4o":
-            return gpt_move(move, enhanced_prompt, api_key)
-        case "claude sonnet 4":
-            return claude_move(move, enhanced_prompt, api_key)
-        case "gemini 2.5 flash":
-            return gemini_move(move, enhanced_prompt, api_key)
-        case "chatgpt 4o":
-            return gpt_move(move, enhanced_prompt, api_key)
-        # case "deepseek":
-        #     return deepseek_move(move, enhanced_prompt)
+        console.print(
+            f"[bold red]{player.label} answered with an illegal move: {reply.move}[/bold red]")
+        retry_note = (f"Your previous answer '{reply.move}' is not a legal move in this position. "
+                      f"Please answer with a different, legal move.")
 
+    return reply, None
 
-def chess_match(name: str, model: str, api_key: str):
-    console = Console()
+
+def chess_match(name: str, model: str, api_key: str, max_retries: int = 2,
+                speculation_settings: speculation.SpeculationSettings = None):
+    console = terminal_ui.get_screen().console
+    speculation_settings = speculation_settings or speculation.config
     game_over = False
 
-    match model:
-        case "gpt 4o":
-            prompt = CHAT_GPT_PROMPT
-        case "claude sonnet 4":
-            prompt = CLAUDE_SONNET_4_PROMPT
-        case "gemini 2.5 flash":
-            prompt = GEMINI_2_5_FLASH_PROMPT
-        case "deepseek":
-            prompt = DEEPSEEK_R1_PROMPT
+    prompt = get_model_prompt(model)
+
+    # The board stays pinned above the game's messages and is updated after every ply
+    view = BoardView(console)
+    view.attach()
 
     console.print(
         f"[bold blue]Let's play chess with:[/bold blue] [bold green]{model}[/bold green]")
@@ -180,10 +257,21 @@ def chess_match(name: str, model: str, api_key: str):
     console.print("[yellow]Tossing coin to see who gets white...[/yellow]")
 
     if random.choice([True, False]):
+        human_side = "white"
         console.print("[bold green]You got the white side![/bold green]")
     else:
+        human_side = "black"
         console.print("[bold green]You got the black side![/bold green]")
 
+    human = Player(1, name, human_side)
+    computer = Player(2, model, "black" if human_side == "white" else "white",
+                      model=model, api_key=api_key, prompt=prompt)
+    state = GameState([human, computer])
+    # Asks the model about the likely human moves while the human thinks
+    speculator = None
+    if speculation_settings.enabled:
+        speculator = speculation.Speculator(state, human, computer, speculation_settings)
+
     # Create a logger file to track the chess match
     log_filename = f"chess_match_{name}_{model.replace(' ', '_')}.txt"
 
@@ -197,48 +285,123 @@ def chess_match(name: str, model: str, api_key: str):
     console.print(
         Panel("[bold green]The board is set up[/bold green]", border_style="green"))
 
-    # Create a logger.txt file for tracking game state
-    with open("logger.txt", "w") as game_logger:
-        game_logger.write("Game started\n")
+    state.log("Game started")
+    last_move = "none"
 
-    while not game_over:
-        console.print("[bold blue]What is your move?[/bold blue]")
-        move = console.input("[bold cyan]> [/bold cyan]")
+    view.orientation = chess.WHITE if human_side == "white" else chess.BLACK
+    view.update(state.board, state.san_moves)
 
-        # Open the log file in append mode
-        with open(log_filename, "a") as logger:
-            logger.write(f"You played: {move}\n")
-
-        console.print(f"[bold cyan]You played:[/bold cyan] {move}")
+    speculative = None
 
+    async def computer_reply(retry_note):
+        nonlocal speculative
+        console.print(f"[bold green]{model} is thinking...[/bold green]")
         try:
-            computer_move = model_move(model, move, prompt, api_key)
-
-            if computer_move == "checkmate":
-                console.print("[bold red]You lost![/bold red]")
-                game_over = True
-                break
-
-            with open(log_filename, "a") as logger:
-                logger.write(f"The computer played: {computer_move}\n")
-
-            # Update the game state logger
-            with open("logger.txt", "a") as game_logger:
-                game_logger.write(f"Your move: {move}\n")
-                game_logger.write(f"Computer move: {computer_move}\n")
-
-            console.print(
-                f"[bold green]Computer played:[/bold green] {computer_move}")
-
+            response = None
+            if speculative is not None and retry_note is None:
+                response = await speculator.answer(speculative)
+            speculative = None
+            if response is None:
+                response = await model_move_async(
+                    model, last_move, prompt, api_key, state, retry_note)
         except Exception as e:
             console.print(f"[bold red]Error: {str(e)}[/bold red]")
+            return MoveReply("error")
+        return MoveReply(extract_move(response), raw=response)
+
+    try:
+        while not game_over:
+            for player in state.turn_order():
+                if player is human:
+                    if speculator is not None:
+                        speculator.predict()
+                    console.print("[bold blue]What is your move?[/bold blue]")
+                    move = console.input("[bold cyan]> [/bold cyan]").strip()
+
+                    # Keep asking until the move can be played on the board or the human resigns
+                    parsed = state.parse(move)
+                    while parsed is None and move.lower() not in ("resign", "quit"):
+                        console.print(
+                            f"[bold red]{move or 'That'} is not a legal move here, try again.[/bold red]")
+                        move = console.input("[bold cyan]> [/bold cyan]").strip()
+                        parsed = state.parse(move)
+
+                    if parsed is None:
+                        console.print("[bold red]You resigned![/bold red]")
+                        game_over = True
+                        break
+
+                    # The model sees the move in SAN, as in the speculative prompts
+                    move = state.board.san(parsed)
+                    if speculator is not None:
+                        speculative = speculator.claim(parsed)
+
+                    # Open the log file in append mode
+                    with open(log_filename, "a") as logger:
+                        logger.write(f"You played: {move}\n")
+
+                    console.print(f"[bold cyan]You played:[/bold cyan] {move}")
+                    state.play(human, move)
+                    view.update(state.board, state.san_moves)
+                    state.log(f"Your move: {move}")
+                    last_move = move
+                else:
+                    reply, san = providers.run_blocking(request_legal_move(
+                        computer, state, computer_reply, max_retries, console))
+
+                    if reply.move == "error":
+                        console.print(
+                            "[yellow]Please try again or restart the game.[/yellow]")
+                        game_over = True
+                        break
+                    if san is None:
+                        console.print(
+                            "[bold green]The computer could not find a legal move. You win![/bold green]")
+                        game_over = True
+                        break
+
+                    with open(log_filename, "a") as logger:
+                        logger.write(f"The computer played: {reply.move}\n")
+
+                    state.play(computer, reply.move)
+                    view.update(state.board, state.san_moves)
+                    state.log(f"Computer move: {reply.move}")
+                    console.print(
+                        f"[bold green]Computer played:[/bold green] {reply.move}")
+
+                # The game ends on the board, not on what the players claim
+                outcome = state.outcome()
+                if outcome is not None:
+                    if state.loser() == computer.number:
+                        console.print("[bold green]You won![/bold green]")
+                    elif state.loser() == human.number:
+                        console.print("[bold red]You lost![/bold red]")
+                    else:
+                        console.print(
+                            f"[bold yellow]Draw by {outcome.termination.name.lower().replace('_', ' ')}.[/bold yellow]")
+                    game_over = True
+                    break
+    finally:
+        view.detach()
+        render = view.render_summary()
+        console.print(
+            f"[dim]Board updates: p50 {render['p50'] * 1000:.2f} ms, "
+            f"max {render['max'] * 1000:.2f} ms over {render['updates']} updates, "
+            f"{render['cells']} squares and lines written[/dim]")
+        if speculator is not None:
+            speculator.close()
+            spent = speculator.summary()
             console.print(
-                "[yellow]Please try again or restart the game.[/yellow]")
+                f"[dim]Speculation: {spent['hits']} of {spent['turns']} moves predicted "
+                f"({spent['hit_rate']:.0%}), {spent['saved']:.1f}s of waiting saved, "
+                f"{spent['calls']} calls ({spent['wasted']} unused, "
+                f"~{spent['tokens']} tokens)[/dim]")
 
 
 def get_second_model(first_model):
     """Get a random model that is different from the first model"""
-    models = ["gpt 4o", "claude sonnet 4", "gemini 2.5 flash"]
+    models = [model for model in provider_registry.model_names()
+              if not provider_registry.is_local(model)]
     # Remove the first model from the list
     if first_model in models:
         models.remove(first_model)
@@ -246,9 +409,20 @@ def get_second_model(first_model):
     return random.choice(models)
 
 
+def get_model_prompt(model: str):
+    """Get the system prompt for the given model"""
+    return provider_registry.get_model(model).prompt
+
+
+def benchmark_log_filename(model1: str, model2: str, game_id: str = None):
+    """Build a benchmark log filename that is unique for every game"""
+    if game_id is None:
+        game_id = f"{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+    return f"benchmark_{model1.replace(' ', '_')}_vs_{model2.replace(' ', '_')}_{game_id}.jsonl"
+
+
 def chessmatch_benchmark(model1: str = None, api_key1: str = None):
     console = Console()
-    game_over = False
 
     # We should already have the first model from main.py
     # Just display information about the first model
@@ -266,59 +440,133 @@ def chessmatch_benchmark(model1: str = None, api_key1: str = None):
                 "[bold red]No API key provided for the first model. Exiting benchmark.[/bold red]")
             return
 
-    # Let the user select which model they want to face against
-    console.print(
-        "[bold blue]Select the second AI model to face against:[/bold blue]")
+    # A game of this model that crashed can be continued from its last ply
+    log_filename = None
+    model2 = None
+    for record_path, saved in checkpoint.unfinished_games():
+        if saved["players"][0]["model"] != model1:
+            continue
+        opponent = saved["players"][1]["model"]
+        if Confirm.ask(f"Resume the unfinished game against {opponent} from {record_path} "
+                       f"after {len(saved['seed_line']) + saved['plies']} plies?", console=console):
+            log_filename, model2 = record_path, opponent
+        break
+
+    if model2 is None:
+        # Let the user select which model they want to face against
+        console.print(
+            "[bold blue]Select the second AI model to face against:[/bold blue]")
 
-    # Create a list of available models excluding the first model
-    available_models = ["gpt 4o", "claude sonnet 4", "gemini 2.5 flash"]
-    if model1 in available_models:
-        available_models.remove(model1)
+        # Create a list of available models excluding the first model
+        available_models = provider_registry.model_names()
+        if model1 in available_models:
+            available_models.remove(model1)
 
-    for i, model_name in enumerate(available_models, 1):
-        console.print(f"[{i}] {model_name.title()}")
+        for i, model_name in enumerate(available_models, 1):
+            console.print(f"[{i}] {model_name.title()}")
 
-    choice = console.input(
-        f"[bold cyan]Enter your choice (1-{len(available_models)}): [/bold cyan]")
+        choice = console.input(
+            f"[bold cyan]Enter your choice (1-{len(available_models)}): [/bold cyan]")
 
-    try:
-        model2 = available_models[int(choice) - 1]
-        console.print(
-            f"[bold blue]Second AI model:[/bold blue] [bold green]{model2}[/bold green]")
-    except (ValueError, IndexError):
-        # If invalid choice, pick randomly
-        model2 = get_second_model(model1)
-        console.print(
-            f"[bold red]Invalid choice. Randomly selected:[/bold red] [bold green]{model2}[/bold green]")
+        try:
+            model2 = available_models[int(choice) - 1]
+            console.print(
+                f"[bold blue]Second AI model:[/bold blue] [bold green]{model2}[/bold green]")
+        except (ValueError, IndexError):
+            # If invalid choice, pick randomly
+            model2 = get_second_model(model1)
+            console.print(
+                f"[bold red]Invalid choice. Randomly selected:[/bold red] [bold green]{model2}[/bold green]")
 
-    # Get API key for the second model
+    # Get API key for the second model, the local stand-in models need none
     from key_handler import get_key
-    api_key2 = get_key(model2, "AI Benchmark - Second Model")
+    if provider_registry.is_local(model2):
+        api_key2 = "local"
+    else:
+        api_key2 = get_key(model2, "AI Benchmark - Second Model")
     if not api_key2:
         console.print(
             "[bold red]No API key provided for the second model. Exiting benchmark.[/bold red]")
         return
 
-    # Get prompts for both models
-    match model1:
-        case "gpt 4o":
-            prompt1 = CHAT_GPT_PROMPT
-        case "claude sonnet 4":
-            prompt1 = CLAUDE_SONNET_4_PROMPT
-        case "gemini 2.5 flash":
-            prompt1 = GEMINI_2_5_FLASH_PROMPT
-        case "deepseek":
-            prompt1 = DEEPSEEK_R1_PROMPT
-
-    match model2:
-        case "gpt 4o":
-            prompt2 = CHAT_GPT_PROMPT
-        case "claude sonnet 4":
-            prompt2 = CLAUDE_SONNET_4_PROMPT
-        case "gemini 2.5 flash":
-            prompt2 = GEMINI_2_5_FLASH_PROMPT
-        case "deepseek":
-            prompt2 = DEEPSEEK_R1_PROMPT
+    # The hedging table after the game shows this game only
+    hedging.stats.reset()
+    result = play_benchmark_game(
+        model1, api_key1, model2, api_key2, log_filename=log_filename, console=console,
+        resume=log_filename is not None)
+
+    console.print(
+        Panel("[bold yellow]Benchmark Complete![/bold yellow]", border_style="yellow"))
+    console.print(f"[dim]Full record available in: {result['log_file']}[/dim]")
+    console.print(f"[dim]PGN available in: {result['pgn_file']}[/dim]")
+    if result["calls"]:
+        console.print(metrics.metrics_table(result["calls"]))
+        console.print(metrics.prompt_size_table(result["calls"]))
+    hedged = hedging.hedging_table()
+    if hedged is not None:
+        console.print(hedged)
+    console.print(f"[dim]Call metrics available in: {result['metrics_file']}[/dim]")
+
+    # analysing the game
+    chess_move_validator.analyze_game(result["log_file"])
+
+
+def play_benchmark_game(model1: str, api_key1: str, model2: str, api_key2: str,
+                        log_filename: str = None, max_rounds: int = None,
+                        round_delay: float = 1, console=None, use_cache: bool = True,
+                        max_retries: int = 2,
+                        prompt_strategy: str = prompt_strategies.DEFAULT_STRATEGY,
+                        opening: opening_book.OpeningSettings = None, resume: bool = False,
+                        checkpoint_every: int = 1):
+    """Blocking wrapper around play_benchmark_game_async"""
+    return providers.run_blocking(play_benchmark_game_async(
+        model1, api_key1, model2, api_key2, log_filename,
+        max_rounds, round_delay, console, use_cache, max_retries, prompt_strategy, opening,
+        resume, checkpoint_every))
+
+
+async def play_benchmark_game_async(model1: str, api_key1: str, model2: str, api_key2: str,
+                                    log_filename: str = None, max_rounds: int = None,
+                                    round_delay: float = 1, console=None, use_cache: bool = True,
+                                    max_retries: int = 2,
+                                    prompt_strategy: str = prompt_strategies.DEFAULT_STRATEGY,
+                                    opening: opening_book.OpeningSettings = None,
+                                    resume: bool = False, checkpoint_every: int = 1):
+    """
+    Plays one AI vs AI benchmark game without any user interaction.
+    A checkpoint is written after every ply. If the game fails, or a provider
+    still fails after the retries of the scheduler, the game gets no result, its
+    checkpoint is kept, and playing it again with resume goes on after the last
+    completed ply.
+
+    Args:
+        model1 (str): Model name of player 1
+        api_key1 (str): API key for player 1
+        model2 (str): Model name of player 2
+        api_key2 (str): API key for player 2
+        log_filename (str): Game record to write, a unique name is generated if omitted
+        max_rounds (int): Optional cap on the number of rounds, the game is a draw when reached.
+            Without it the game runs until it is over on the board.
+        round_delay (float): Seconds to wait between rounds, 0 for headless runs
+        console (Console): Rich console used for output
+        use_cache (bool): Reuse cached answers for known positions, False for fresh samples
+        max_retries (int): Extra tries a model gets after an illegal move before it forfeits
+        prompt_strategy (str): Name of the prompt strategy used for both models
+        opening (OpeningSettings): Optional use of the opening book, to start from a random
+            book line or to let the models take book moves instead of being asked
+        resume (bool): Go on from the checkpoint of log_filename if it has one for these models
+        checkpoint_every (int): Plies between syncs of the record and the checkpoint to disk.
+            Every ply is still journaled, a crash of the machine loses at most this many plies.
+
+    Returns:
+        dict: Summary of the game (record, PGN and metrics file, provider calls, plies taken
+            from the book, players, sides, rounds played, how it ended, whether it was
+            resumed and the checkpoint left behind if it can be resumed)
+    """
+    console = console or Console()
+    game_over = False
+    result = "unfinished"
+    loser = None
 
     console.print(
         Panel(f"[bold yellow]AI vs AI BENCHMARK[/bold yellow]", border_style="yellow"))
@@ -327,111 +575,245 @@ def chessmatch_benchmark(model1: str = None, api_key1: str = None):
     console.print(
         f"[bold blue]Player 2:[/bold blue] [bold green]{model2}[/bold green]")
 
-    player1_side = random.choice([True, False])
-    player1_side = "white" if player1_side else "black"
+    # Named by the models and, if given, the record, so a replay gets the same sides
+    toss = f"sides|{model1}|{model2}|{os.path.basename(log_filename or '')}"
 
-    console.print(
-        f"[yellow]{model1} (Player 1) will play as:[/yellow] [bold]{player1_side}[/bold]")
-    console.print(
-        f"[yellow]{model2} (Player 2) will play as:[/yellow] [bold]{'black' if player1_side == 'white' else 'white'}[/bold]")
+    # Create the game record for the benchmark
+    if log_filename is None:
+        log_filename = benchmark_log_filename(model1, model2)
 
-    # Create a logger file for the benchmark
-    log_filename = f"benchmark_{model1.replace(' ', '_')}_vs_{model2.replace(' ', '_')}.txt"
+    saved = checkpoint.load_checkpoint(log_filename) if resume else None
+    if saved is not None and [player["model"] for player in saved["players"]] != [model1, model2]:
+        saved = None
 
-    try:
-        with open(log_filename, "w") as logger:
-            logger.write(f"Player 1 ({model1}): {player1_side}\n")
-            logger.write(
-                f"Player 2 ({model2}): {'black' if player1_side == 'white' else 'white'}\n")
-            logger.write(f"Starting benchmark...\n\n")
-        console.print(f"[dim]Created benchmark log file: {log_filename}[/dim]")
-    except Exception as e:
-        console.print(
-            f"[bold red]Error creating benchmark log file: {e}[/bold red]")
+    if saved is not None:
+        player1_side = saved["players"][0]["side"]
+    else:
+        recorder = cassette.get_cassette()
+        if recorder is not None:
+            player1_side = recorder.choice(toss, lambda: random.choice([True, False]))
+        else:
+            player1_side = random.choice([True, False])
+        player1_side = "white" if player1_side else "black"
+    player2_side = "black" if player1_side == "white" else "white"
 
-    # Create a logger.txt file for tracking game state
-    with open("logger.txt", "w") as game_logger:
-        game_logger.write("Benchmark started\n")
-        game_logger.write(f"Player 1: {model1} ({player1_side})\n")
-        game_logger.write(
-            f"Player 2: {model2} ({'black' if player1_side == 'white' else 'white'})\n")
+    state = GameState([
+        Player(1, model1, player1_side, model=model1, api_key=api_key1,
+               prompt=get_model_prompt(model1)),
+        Player(2, model2, player2_side, model=model2, api_key=api_key2,
+               prompt=get_model_prompt(model2)),
+    ])
+
+    console.print(
+        f"[yellow]{model1} (Player 1) will play as:[/yellow] [bold]{player1_side}[/bold]")
+    console.print(
+        f"[yellow]{model2} (Player 2) will play as:[/yellow] [bold]{player2_side}[/bold]")
+
+    # Book moves are answered without asking the models
+    book = None
+    seed_line = []
+    if opening is not None:
+        book = opening_book.get_book(opening.book_path)
+        book_rng = random.Random(opening.seed)
+        if saved is None:
+            seed_line = book.random_line(2 * opening.seed_moves, book_rng)
+            # Whole moves only, white moves first in every round
+            seed_line = seed_line[:len(seed_line) - len(seed_line) % 2]
+        elif saved["book_rng"] is not None:
+            book_rng.setstate(checkpoint.decode_random_state(saved["book_rng"]))
+
+    stop_file = game_record.stop_path(log_filename)
+    if os.path.exists(stop_file):
+        # Left over from an earlier game written to the same record
+        os.remove(stop_file)
+
+    # Measurements of every provider call of the game
+    calls = []
+
+    if saved is not None:
+        # Lines written after the checkpoint belong to a ply that never completed
+        record = game_record.GameRecord(log_filename, resume_at=saved["record_offset"],
+                                        plies=saved["record_plies"])
+        # The moves played are the legal answers in the record
+        _, plies, _ = game_record.read_record(log_filename)
+        state.restore({"moves": [(ply["player"], ply["move"]) for ply in plies if ply["legal"]],
+                       "transcript": saved["transcript"]})
+        seed_line = saved["seed_line"]
+        book_plies = game_record.book_plies(plies)
+        calls = [metrics.CallMetrics(**call) for call in saved["calls"]]
+        round_count, round_plies = saved["round"], saved["round_plies"]
+        journal = checkpoint.Checkpoint(log_filename, resume_at=saved["journal_offset"],
+                                        sync_every=checkpoint_every)
+        console.print(f"[dim]Resuming {log_filename} in round {round_count} after "
+                      f"{len(state.moves)} plies[/dim]")
+    else:
+        record = game_record.GameRecord(log_filename)
+        record.write_header(state.players, max_rounds=max_rounds,
+                            prompt_strategy=prompt_strategy, opening=seed_line)
+        console.print(f"[dim]Created benchmark record: {log_filename}[/dim]")
+
+        state.log("Benchmark started")
+        state.log(f"Player 1: {model1} ({player1_side})")
+        state.log(f"Player 2: {model2} ({player2_side})")
+
+        # The seeded opening is recorded as round 0
+        for san in seed_line:
+            player = state.turn_order()[len(state.san_moves) % 2]
+            move = state.parse(san)
+            record.write_ply(0, player, san, san=san, uci=move.uci(), latency=0.0,
+                             attempt=0, legal=True, book=True)
+            state.play(player, san)
+            state.log(f"Player {player.number} move: {san}")
+        if seed_line:
+            console.print(f"[dim]Starting from book line: {' '.join(seed_line)}[/dim]")
+        # Counted as game_record.book_plies counts them in a record
+        book_plies = len(seed_line)
+        round_count, round_plies = 1, 0
+        journal = checkpoint.Checkpoint(log_filename, {
+            "players": [{"number": player.number, "model": player.model, "side": player.side}
+                        for player in state.players],
+            "seed_line": seed_line,
+            "transcript": state.transcript_lines(),
+            "round": round_count,
+            "round_plies": round_plies,
+            "book_plies": book_plies,
+            "book_rng": (checkpoint.encode_random_state(book_rng.getstate())
+                         if book is not None else None),
+            "record_offset": record.sync(),
+            "record_plies": record.plies,
+        }, sync_every=checkpoint_every)
+
+    # Rounds in which a model was asked, a game may end in the middle of a round
+    rounds_played = round_count if round_plies else round_count - 1
+    journaled_lines, journaled_calls = len(state.transcript_lines()), len(calls)
+
+    def save_checkpoint(next_round, next_round_plies, used_book):
+        """Appends the ply just played to the journal"""
+        nonlocal journaled_lines, journaled_calls
+        journal.add_ply(
+            record,
+            round=next_round,
+            round_plies=next_round_plies,
+            book_plies=book_plies,
+            book_rng=(checkpoint.encode_random_state(book_rng.getstate())
+                      if used_book else None),
+            transcript=state.transcript_lines(journaled_lines),
+            calls=[call.to_dict() for call in calls[journaled_calls:]])
+        journaled_lines, journaled_calls = len(state.transcript_lines()), len(calls)
 
     console.print(
         Panel("[bold green]The board is set up for benchmark[/bold green]", border_style="green"))
     console.print("[bold cyan]Starting AI vs AI match...[/bold cyan]")
 
-    round_count = 1
-
-    # Initialize move history for both players
-    move_player1 = []
-    move_player2 = []
-
-    while not game_over and round_count <= 40:  # Add a maximum round limit to prevent infinite games
+    while not game_over and (max_rounds is None or round_count <= max_rounds):
         console.print(f"\n[bold magenta]Round {round_count}[/bold magenta]")
-        console.print(
-            f"[bold blue]{model1} (Player 1) is thinking...[/bold blue]")
 
         try:
-            computer_1_move = model_move_benchmark(
-                model1, move_player2, prompt1, api_key1)
-
-            if computer_1_move == "checkmate":
+            # White moves first in every round, a resumed round skips the plies already played
+            for turn, player in enumerate(state.turn_order()):
+                if turn < round_plies:
+                    continue
+                # A validator following the record can ask for the game to end
+                if os.path.exists(stop_file):
+                    console.print(
+                        "[bold yellow]Stop requested by the validator. Ending game.[/bold yellow]")
+                    result = "stopped"
+                    game_over = True
+                    break
+
+                rounds_played = round_count
+                opponent = state.opponent(player)
                 console.print(
-                    f"[bold red]Player 1 ({model1}) lost![/bold red]")
-                game_over = True
-                break
-            elif computer_1_move == "error":
+                    f"[bold blue]{player.model} (Player {player.number}) is thinking...[/bold blue]")
+
+                async def request(retry_note, player=player, opponent=opponent):
+                    reply = await request_benchmark_move(
+                        player.model, state.moves_by(opponent), player.prompt, player.api_key,
+                        state, console, use_cache, retry_note, prompt_strategy)
+                    if reply.metrics is not None:
+                        calls.append(reply.metrics)
+                    return reply
+
+                # The record is output only, the game state lives in memory.
+                # Every answer is recorded, illegal ones included.
+                def write_attempt(attempt, reply, move, player=player, round_number=round_count):
+                    call = reply.metrics
+                    record.write_ply(
+                        round_number, player, reply.move, raw=reply.raw,
+                        san=state.board.san(move) if move else None,
+                        uci=move.uci() if move else None,
+                        latency=reply.latency, tokens=reply.tokens, cached=reply.cached,
+                        attempt=attempt, legal=move is not None, book=reply.book,
+                        queue_wait=call.queue_wait if call else None,
+                        ttfb=call.ttfb if call else None,
+                        http_retries=call.retries if call else None,
+                        prompt_chars=call.prompt_chars if call else None)
+                    record.flush()
+
+                book_move = None
+                used_book = (book is not None
+                             and len(state.moves_by(player)) < opening.plies_for(player.model))
+                if used_book:
+                    book_move = book.choose(state.board, book_rng)
+
+                if book_move is not None:
+                    reply = MoveReply(state.board.san(book_move), latency=0.0, book=True)
+                    san = reply.move
+                    write_attempt(0, reply, book_move)
+                    book_plies += 1
+                else:
+                    reply, san = await request_legal_move(
+                        player, state, request, max_retries, console, write_attempt)
+                computer_move = reply.move
+
+                if computer_move == "error":
+                    # The provider still failed after the retries of the scheduler, the
+                    # game stops unfinished so it can be resumed once the provider is back
+                    console.print(
+                        f"[bold red]{player.label} could not be reached. Stopping game.[/bold red]")
+                    result = "error"
+                    game_over = True
+                    break
+                elif san is None:
+                    console.print(
+                        f"[bold red]{player.label} made no legal move in {max_retries + 1} tries and forfeits![/bold red]")
+                    result, loser = "forfeit", player.number
+                    game_over = True
+                    break
+
+                # Only answers that turned out legal are worth caching
+                if reply.cache_key is not None and not reply.cached:
+                    move_cache.get_cache().put(reply.cache_key, reply.raw)
+
+                state.play(player, computer_move)
                 console.print(
-                    f"[bold red]Player 1 ({model1}) made an error. Ending game.[/bold red]")
-                game_over = True
+                    f"[bold green]{player.label} move:[/bold green] {san}")
+
+                state.log(f"Player {player.number} move: {computer_move}")
+                if turn == 0:
+                    save_checkpoint(round_count, 1, used_book)
+                else:
+                    save_checkpoint(round_count + 1, 0, used_book)
+
+                # The game ends on the board: checkmate, stalemate or a draw
+                outcome = state.outcome()
+                if outcome is not None:
+                    result = outcome.termination.name.lower()
+                    loser = state.loser()
+                    console.print(
+                        f"[bold yellow]Game over: {result.replace('_', ' ')} ({outcome.result()})[/bold yellow]")
+                    game_over = True
+                    break
+
+            if game_over:
                 break
 
-            move_player1.append(computer_1_move)
-            console.print(
-                f"[bold green]Player 1 ({model1}) move:[/bold green] {computer_1_move}")
-
-            with open(log_filename, "a") as logger:
-                logger.write(
-                    f"Round {round_count} - Player 1 ({model1}) move: {computer_1_move}\n")
-
-            # After Player 1's move
-            with open("logger.txt", "a") as game_logger:
-                game_logger.write(f"Player 1 move: {computer_1_move}\n")
-
-            console.print(
-                f"[bold blue]{model2} (Player 2) is thinking...[/bold blue]")
-
-            computer_2_move = model_move_benchmark(
-                model2, move_player1, prompt2, api_key2)
-
-            if computer_2_move == "checkmate":
-                console.print(
-                    f"[bold red]Player 2 ({model2}) lost![/bold red]")
-                game_over = True
-                break
-            elif computer_2_move == "error":
-                console.print(
-                    f"[bold red]Player 2 ({model2}) made an error. Ending game.[/bold red]")
-                game_over = True
-                break
-
-            move_player2.append(computer_2_move)
-            console.print(
-                f"[bold green]Player 2 ({model2}) move:[/bold green] {computer_2_move}")
-
-            with open(log_filename, "a") as logger:
-                logger.write(
-                    f"Round {round_count} - Player 2 ({model2}) move: {computer_2_move}\n\n")
-
-            # After Player 2's move
-            with open("logger.txt", "a") as game_logger:
-                game_logger.write(f"Player 2 move: {computer_2_move}\n")
-
             round_count += 1
+            round_plies = 0
 
             # Add a small delay between rounds for readability
-            import time
-            time.sleep(1)
+            if round_delay:
+                await asyncio.sleep(round_delay)
 
         except Exception as e:
             console.print(
@@ -448,18 +830,47 @@ def chessmatch_benchmark(model1: str = None, api_key1: str = None):
             except Exception as log_error:
                 console.print(
                     f"[bold red]Failed to log error: {str(log_error)}[/bold red]")
+            result = "exception"
             game_over = True
 
     # If we reached the maximum number of rounds
-    if round_count > 40:
+    if max_rounds is not None and round_count > max_rounds:
         console.print(
             "[bold yellow]Maximum number of rounds reached. Game ended in a draw.[/bold yellow]")
-        with open(log_filename, "a") as logger:
-            logger.write("Game ended in a draw after 40 rounds.\n")
-
-    console.print(
-        Panel("[bold yellow]Benchmark Complete![/bold yellow]", border_style="yellow"))
-    console.print(f"[dim]Full log available in: {log_filename}[/dim]")
-
-    # analysing the game
-    chess_move_validator.analyze_game(log_filename)
+        result = "max_rounds"
+
+    final_result = game_record.pgn_result(state, result, loser)
+    checkpoint_file = None
+    if result in ("exception", "error"):
+        # The record stays open ended and the checkpoint is kept for a resume
+        checkpoint_file = game_record.checkpoint_path(log_filename)
+        console.print(f"[yellow]Play the game again with resume to continue from "
+                      f"{checkpoint_file}[/yellow]")
+    else:
+        record.write_result(result, loser, final_result, rounds=rounds_played)
+    journal.close()
+    if checkpoint_file is None:
+        checkpoint.remove_checkpoint(log_filename)
+    # The answers cached in this game are committed off the event loop
+    await asyncio.to_thread(move_cache.flush_cache)
+    record.close()
+    pgn_file = game_record.pgn_path(log_filename)
+    game_record.export_pgn(state, pgn_file, final_result)
+    metrics_file = game_record.metrics_path(log_filename)
+    metrics.export_metrics(calls, metrics_file, record=log_filename)
+
+    return {
+        "log_file": log_filename,
+        "pgn_file": pgn_file,
+        "metrics_file": metrics_file,
+        "calls": calls,
+        "book_plies": book_plies,
+        "player1": model1,
+        "player2": model2,
+        "player1_side": player1_side,
+        "rounds": rounds_played,
+        "result": result,
+        "loser": loser,
+        "resumed": saved is not None,
+        "checkpoint_file": checkpoint_file,
+    }
@@ -1,28 +1,125 @@
 import chess
+import glob
+import json
+import os
 import re
+import time
+import game_record
+from position_index import PositionIndex, position_key
 from rich.console import Console
 from rich.table import Table
 from rich.panel import Panel
+from rich.live import Live
 from rich import print as rprint
 
 # Initialize Rich console
 console = Console()
 
 
-def validate_chess_moves(benchmark_file):
+def read_benchmark_moves(benchmark_file):
+    """
+    Reads the players and moves of a benchmark game.
+    Game records (.jsonl) are read directly, older text logs are parsed with a regex.
+
+    Args:
+        benchmark_file (str): Path to the benchmark file
+
+    Returns:
+        tuple: (list of (round_number, player, move) tuples, player1_name, player2_name)
+    """
+    if benchmark_file.endswith(".jsonl"):
+        header, plies, _ = game_record.read_record(benchmark_file)
+        names = {str(player["number"]): player["name"]
+                 for player in header.get("players", [])}
+        moves = [(str(ply["round"]), str(ply["player"]), ply["move"] or "")
+                 for ply in plies]
+        return moves, names.get("1", "Player 1"), names.get("2", "Player 2")
+
+    with open(benchmark_file, 'r') as f:
+        content = f.read()
+
+    # Extract player information
+    player1_match = re.search(r"Player 1 \((.+?)\)", content)
+    player2_match = re.search(r"Player 2 \((.+?)\)", content)
+
+    player1_name = player1_match.group(1) if player1_match else "Player 1"
+    player2_name = player2_match.group(1) if player2_match else "Player 2"
+
+    # Extract moves using regex - handle different formats
+    move_pattern = r"Round (\d+) - Player (\d+).*?move: (.+?)(?=\n|$)"
+    moves = re.findall(move_pattern, content)
+    return moves, player1_name, player2_name
+
+
+def validate_move(board, round_num, player, move_text):
+    """
+    Validates one move against the board and plays it if it is legal.
+
+    Args:
+        board (chess.Board): Board of the game, updated in place
+        round_num (str): Round the move belongs to
+        player (str): Player number
+        move_text (str): Move as written in the benchmark file
+
+    Returns:
+        tuple: (round_number, player, move, is_legal, reason)
+    """
+    if board.is_checkmate() or board.is_stalemate():
+        return (round_num, player, move_text, False, "Game already ended")
+
+    # Clean up the move text (remove any extra text)
+    clean_move = move_text.strip()
+
+    # Handle special notation like checkmate
+    if clean_move.endswith('#'):
+        # Remove the # for parsing
+        clean_move = clean_move[:-1]
+
+    # Get the first word only if there are multiple words
+    if ' ' in clean_move:
+        clean_move = clean_move.split()[0]
+
+    # Skip moves that are clearly comments or explanations (the longest SAN is 7 characters, e.g. exd8=Q+)
+    if len(clean_move) > 7 or clean_move.lower() in ["checkmate", "stalemate", "draw"]:
+        return (round_num, player, move_text, False,
+                "Not a valid chess move notation")
+
+    try:
+        # Try to parse the move
+        move = board.parse_san(clean_move)
+
+        # Check if the move is legal
+        if move in board.legal_moves:
+            board.push(move)
+
+            # Check if this move results in checkmate
+            if board.is_checkmate():
+                return (round_num, player, move_text, True, "Legal move - Checkmate")
+            elif board.is_stalemate():
+                return (round_num, player, move_text, True, "Legal move - Stalemate")
+            return (round_num, player, move_text, True, "Legal move")
+        return (round_num, player, move_text, False, "Illegal move")
+    except ValueError as e:
+        return (round_num, player, move_text, False, f"Invalid notation: {str(e)}")
+    except Exception as e:
+        return (round_num, player, move_text, False, f"Error: {str(e)}")
+
+
+def validate_chess_moves(benchmark_file, index=None):
     """
     Validates if the chess moves in the benchmark file are legal.
 
     Args:
         benchmark_file (str): Path to the benchmark file
+        index (PositionIndex): Optional position index. Answers it already judged
+            are not validated again, and the answers of a game are added to it once
 
     Returns:
         list: List of tuples containing (round_number, player, move, is_legal, reason)
     """
     # Read the benchmark file
     try:
-        with open(benchmark_file, 'r') as f:
-            content = f.read()
+        moves, player1_name, player2_name = read_benchmark_moves(benchmark_file)
     except FileNotFoundError:
         console.print(
             f"[bold red]Error: File {benchmark_file} not found![/bold red]")
@@ -34,75 +131,35 @@ def validate_chess_moves(benchmark_file):
     # Create a chess board
     board = chess.Board()
 
-    # Extract player information
-    player1_match = re.search(r"Player 1 \((.+?)\)", content)
-    player2_match = re.search(r"Player 2 \((.+?)\)", content)
-
-    player1_name = player1_match.group(1) if player1_match else "Player 1"
-    player2_name = player2_match.group(1) if player2_match else "Player 2"
-
-    # Extract moves using regex - handle different formats
-    move_pattern = r"Round (\d+) - Player (\d+).*?move: (.+?)(?=\n|$)"
-    moves = re.findall(move_pattern, content)
-
     results = []
-    game_ended = False
+    if index is None:
+        for round_num, player, move_text in moves:
+            results.append(validate_move(board, round_num, player, move_text))
+        return results, player1_name, player2_name
 
+    count_answers = not index.is_indexed(benchmark_file)
+    names = {"1": player1_name, "2": player2_name}
     for round_num, player, move_text in moves:
-        if game_ended:
-            results.append((round_num, player, move_text,
-                           False, "Game already ended"))
-            continue
-
-        # Clean up the move text (remove any extra text)
-        clean_move = move_text.strip()
-
-        # Handle special notation like checkmate
-        is_checkmate = False
-        if clean_move.endswith('#'):
-            is_checkmate = True
-            # Remove the # for parsing
-            clean_move = clean_move[:-1]
-
-        # Get the first word only if there are multiple words
-        if ' ' in clean_move:
-            clean_move = clean_move.split()[0]
-
-        # Skip moves that are clearly comments or explanations
-        if len(clean_move) > 5 or clean_move.lower() in ["checkmate", "stalemate", "draw"]:
-            results.append((round_num, player, move_text, False,
-                           "Not a valid chess move notation"))
-            continue
-
-        try:
-            # Try to parse the move
-            move = board.parse_san(clean_move)
-
-            # Check if the move is legal
-            if move in board.legal_moves:
-                board.push(move)
-
-                # Check if this move results in checkmate
-                if board.is_checkmate():
-                    results.append((round_num, player, move_text,
-                                   True, "Legal move - Checkmate"))
-                    game_ended = True
-                elif board.is_stalemate():
-                    results.append((round_num, player, move_text,
-                                   True, "Legal move - Stalemate"))
-                    game_ended = True
-                else:
-                    results.append(
-                        (round_num, player, move_text, True, "Legal move"))
-            else:
-                results.append(
-                    (round_num, player, move_text, False, "Illegal move"))
-        except ValueError as e:
-            results.append((round_num, player, move_text, False,
-                           f"Invalid notation: {str(e)}"))
-        except Exception as e:
-            results.append((round_num, player, move_text,
-                           False, f"Error: {str(e)}"))
+        key = position_key(board)
+        if count_answers:
+            index.add_response(key, board, names.get(str(player), str(player)), move_text)
+        verdict = index.verdict(key, move_text)
+        if verdict is None:
+            result = validate_move(board, round_num, player, move_text)
+            index.add_verdict(key, move_text, result[3], result[4],
+                              board.peek().uci() if result[3] else None)
+        else:
+            is_legal, reason, uci = verdict
+            if is_legal:
+                board.push_uci(uci)
+            result = (round_num, player, move_text, is_legal, reason)
+        if count_answers and result[3]:
+            # Retries in the same position are answers, not visits
+            index.add_visit(key)
+        results.append(result)
+    if count_answers:
+        index.mark_indexed(benchmark_file)
+    index.flush()
 
     return results, player1_name, player2_name
 
@@ -133,12 +190,13 @@ def print_validation_results(results, player1_name, player2_name):
     console.print(table)
 
 
-def analyze_game(benchmark_file):
+def analyze_game(benchmark_file, index=None):
     """
     Analyzes the chess game in the benchmark file and prints a detailed report.
 
     Args:
         benchmark_file (str): Path to the benchmark file
+        index (PositionIndex): Optional position index consulted before validating
     """
     console = Console()
     console.print(
@@ -146,7 +204,7 @@ def analyze_game(benchmark_file):
 
     with console.status("[bold green]Validating chess moves...[/bold green]") as status:
         results, player1_name, player2_name = validate_chess_moves(
-            benchmark_file)
+            benchmark_file, index)
 
     if not results:
         console.print("[bold red]No valid moves found to analyze![/bold red]")
@@ -195,18 +253,183 @@ def analyze_game(benchmark_file):
             f"[bold yellow]Game did not end with a clear result.[/bold yellow]")
 
 
-if __name__ == "__main__":
-    import sys
+class GameFollower:
+    """Follows one benchmark record as it grows and validates only the new plies"""
+
+    def __init__(self, benchmark_file):
+        self.benchmark_file = benchmark_file
+        self.board = chess.Board()
+        self.results = []
+        self.player_names = {"1": "Player 1", "2": "Player 2"}
+        self.finished = False
+        self.stop_requested = False
+        self._offset = 0
 
-    if len(sys.argv) > 1:
-        benchmark_file = sys.argv[1]
+    def poll(self):
+        """
+        Reads the lines appended since the last poll and validates their moves.
+
+        Returns:
+            list: Validation results of the new moves
+        """
+        try:
+            with open(self.benchmark_file, "rb") as f:
+                f.seek(self._offset)
+                data = f.read()
+        except FileNotFoundError:
+            return []
+
+        # Leave a line that is still being written for the next poll
+        complete = data[:data.rfind(b"\n") + 1]
+        self._offset += len(complete)
+
+        new_results = []
+        for line in complete.decode("utf-8").splitlines():
+            move = self._parse_line(line)
+            if move is not None:
+                new_results.append(validate_move(self.board, *move))
+        self.results.extend(new_results)
+        return new_results
+
+    def _parse_line(self, line):
+        """Get (round_number, player, move) from a record or text log line, or None"""
+        if not line.strip():
+            return None
+        if not self.benchmark_file.endswith(".jsonl"):
+            match = re.match(r"Round (\d+) - Player (\d+).*?move: (.+)", line)
+            return match.groups() if match else None
+
+        entry = json.loads(line)
+        if entry["type"] == "header":
+            for player in entry["players"]:
+                self.player_names[str(player["number"])] = player["name"]
+        elif entry["type"] == "ply":
+            return str(entry["round"]), str(entry["player"]), entry["move"] or ""
+        elif entry["type"] == "result":
+            self.finished = True
+        return None
+
+    def illegal_streak(self):
+        """Number of illegal moves in a row at the end of the game so far"""
+        streak = 0
+        for result in reversed(self.results):
+            if result[3]:
+                break
+            streak += 1
+        return streak
+
+    def request_stop(self):
+        """Ask the benchmark writing this record to end the game"""
+        with open(game_record.stop_path(self.benchmark_file), "w") as f:
+            f.write("stopped by chess_move_validator --follow\n")
+        self.stop_requested = True
+
+
+def build_follow_table(followers):
+    """Build the live legality table for the followed games"""
+    table = Table(title="Live Chess Move Validation")
+
+    table.add_column("Game", style="cyan")
+    table.add_column("Players", style="magenta")
+    table.add_column("Moves", style="yellow")
+    table.add_column("Legal", style="green")
+    table.add_column("Last move", style="blue")
+    table.add_column("Status")
+
+    for follower in followers:
+        results = follower.results
+        legal = sum(1 for result in results if result[3])
+        accuracy = legal / len(results) * 100 if results else 0
+        last = results[-1] if results else None
+
+        if follower.finished:
+            status = "[dim]finished[/dim]"
+        elif follower.stop_requested:
+            status = "[bold red]stop requested[/bold red]"
+        elif last and not last[3]:
+            status = f"[red]{follower.illegal_streak()} illegal in a row[/red]"
+        else:
+            status = "[green]running[/green]"
+
+        table.add_row(
+            os.path.basename(follower.benchmark_file),
+            f"{follower.player_names['1']} vs {follower.player_names['2']}",
+            str(len(results)),
+            f"{legal} ({accuracy:.1f}%)",
+            f"{last[2]} ({'✓' if last[3] else '✗'})" if last else "-",
+            status)
+
+    return table
+
+
+def follow_games(benchmark_files=None, pattern="benchmark_*.jsonl", interval=1.0, stop_after=None):
+    """
+    Validates benchmark records while their games are still running.
+    Shows a live legality table until every followed game has finished.
+
+    Args:
+        benchmark_files (list): Records to follow, or None to follow every file matching pattern
+        pattern (str): Glob pattern picking up new records when no files are given
+        interval (float): Seconds between polls
+        stop_after (int): Ask a game to stop after this many illegal moves in a row
+    """
+    followers = {}
+
+    def refresh():
+        paths = benchmark_files or glob.glob(pattern)
+        for path in paths:
+            if path not in followers:
+                followers[path] = GameFollower(path)
+        for follower in followers.values():
+            if follower.finished:
+                continue
+            follower.poll()
+            if (stop_after and not follower.stop_requested and not follower.finished
+                    and follower.illegal_streak() >= stop_after):
+                follower.request_stop()
+        return build_follow_table(list(followers.values()))
+
+    try:
+        with Live(refresh(), console=console, auto_refresh=False) as live:
+            while True:
+                time.sleep(interval)
+                live.update(refresh(), refresh=True)
+                if benchmark_files and all(f.finished for f in followers.values()):
+                    break
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Validate the chess moves of benchmark games")
+    parser.add_argument("files", nargs="*", help="Benchmark records or logs")
+    parser.add_argument("--follow", action="store_true",
+                        help="Validate games while they are being played")
+    parser.add_argument("--interval", type=float, default=1.0,
+                        help="Seconds between polls in follow mode")
+    parser.add_argument("--stop-after", type=int,
+                        help="In follow mode, stop a game after this many illegal moves in a row")
+    parser.add_argument("--index", metavar="PATH",
+                        help="Position index to look answers up in and add the games to")
+    args = parser.parse_args()
+    index = PositionIndex(args.index) if args.index else None
+
+    if args.follow:
+        follow_games(args.files or None, interval=args.interval,
+                     stop_after=args.stop_after)
+    elif args.files:
+        for benchmark_file in args.files:
+            analyze_game(benchmark_file, index)
     else:
         # Look for benchmark files in the current directory
-        import glob
-        benchmark_files = glob.glob("benchmark_*.txt")
+        benchmark_files = glob.glob("benchmark_*.jsonl") + glob.glob("benchmark_*.txt")
 
         if benchmark_files:
-            benchmark_file = "benchmark_claude_sonnet_4_vs_gpt_4o.txt"
+            # Benchmark logs carry a unique suffix, pick the most recent one
+            benchmark_file = max(benchmark_files, key=os.path.getmtime)
             console.print(
                 f"[yellow]No file specified, using: {benchmark_file}[/yellow]")
         else:
@@ -214,4 +437,4 @@ if __name__ == "__main__":
             console.print(
                 f"[yellow]No benchmark files found, defaulting to: {benchmark_file}[/yellow]")
 
-    analyze_game(benchmark_file)
+        analyze_game(benchmark_file, index)
@@ -0,0 +1,128 @@
+"""
+Registry of provider SDK clients shared by all games and turns.
+Clients are created once per (provider, api_key) and reused, so every move
+goes over an already open connection pool instead of a new TLS handshake.
+Async clients are bound to the event loop that uses them, so the registry
+keeps one set of clients per running loop. The SDKs do not retry on their own,
+retries are left to the scheduler. SDKs are imported through the provider
+registry when their first client is created.
+"""
+
+import asyncio
+import threading
+import weakref
+
+import metrics
+from provider_registry import import_sdk
+
+# Base URL of the OpenAI compatible DeepSeek API
+DEEPSEEK_BASE_URL = "https://api.deepseek.com"
+
+# Connection pool settings applied to newly created clients
+POOL_SETTINGS = {
+    "max_connections": 100,
+    "max_keepalive_connections": 20,
+    "keepalive_expiry": 60.0,
+    "timeout": 60.0,
+}
+
+_clients = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+def configure_clients(max_connections: int = None, max_keepalive_connections: int = None,
+                      keepalive_expiry: float = None, timeout: float = None):
+    """
+    Changes the connection pool settings used for new clients.
+
+    Args:
+        max_connections (int): Maximum number of open connections per client
+        max_keepalive_connections (int): Maximum number of idle connections kept open
+        keepalive_expiry (float): Seconds an idle connection is kept open
+        timeout (float): Request timeout in seconds
+    """
+    settings = {
+        "max_connections": max_connections,
+        "max_keepalive_connections": max_keepalive_connections,
+        "keepalive_expiry": keepalive_expiry,
+        "timeout": timeout,
+    }
+    POOL_SETTINGS.update(
+        {name: value for name, value in settings.items() if value is not None})
+
+
+def _limits():
+    import httpx
+
+    return httpx.Limits(
+        max_connections=POOL_SETTINGS["max_connections"],
+        max_keepalive_connections=POOL_SETTINGS["max_keepalive_connections"],
+        keepalive_expiry=POOL_SETTINGS["keepalive_expiry"])
+
+
+def _http_client(sdk):
+    """Create a pooled HTTP client of the kind the given SDK expects"""
+    import httpx
+
+    # Older SDK releases have no default client class and take a plain httpx one
+    client_class = getattr(sdk, "DefaultAsyncHttpxClient", httpx.AsyncClient)
+    return client_class(limits=_limits(), timeout=POOL_SETTINGS["timeout"],
+                        event_hooks=metrics.EVENT_HOOKS)
+
+
+def _create_client(provider: str, api_key: str):
+    """Create a new async client for the given provider"""
+    sdk = import_sdk(provider)
+    match provider:
+        case "openai":
+            return sdk.AsyncOpenAI(api_key=api_key, http_client=_http_client(sdk), max_retries=0)
+        case "deepseek":
+            return sdk.AsyncOpenAI(api_key=api_key, base_url=DEEPSEEK_BASE_URL,
+                                   http_client=_http_client(sdk), max_retries=0)
+        case "anthropic":
+            return sdk.AsyncAnthropic(api_key=api_key, http_client=_http_client(sdk),
+                                      max_retries=0)
+        case "gemini":
+            # The SDK applies its own timeout to every request, given in milliseconds
+            timeout = POOL_SETTINGS["timeout"]
+            return sdk.Client(
+                api_key=api_key,
+                http_options={
+                    "timeout": int(timeout * 1000) if timeout is not None else None,
+                    "async_client_args": {
+                        "limits": _limits(), "event_hooks": metrics.EVENT_HOOKS}})
+    raise ValueError(f"Unknown provider: {provider}")
+
+
+def get_client(provider: str, api_key: str):
+    """
+    Gets the shared client for a provider and API key, creating it on first use.
+    Must be called from a coroutine running on the event loop that will use the client.
+
+    Args:
+        provider (str): Provider name, one of "openai", "deepseek", "anthropic" or "gemini"
+        api_key (str): API key for the provider
+
+    Returns:
+        The provider's async client
+    """
+    loop = asyncio.get_running_loop()
+    with _lock:
+        loop_clients = _clients.setdefault(loop, {})
+        client = loop_clients.get((provider, api_key))
+        if client is None:
+            client = _create_client(provider, api_key)
+            loop_clients[(provider, api_key)] = client
+    return client
+
+
+async def close_clients():
+    """Close every client created for the running event loop"""
+    with _lock:
+        loop_clients = _clients.pop(asyncio.get_running_loop(), {})
+    for (provider, _), client in loop_clients.items():
+        if provider != "gemini":
+            await client.close()
+        elif hasattr(client.aio, "aclose"):
+            # Older google-genai releases have no way to close the async client
+            await client.aio.aclose()
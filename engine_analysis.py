@@ -0,0 +1,405 @@
+"""
+Move quality analysis of benchmark games with a local UCI engine.
+Every position reached in a game is evaluated once, and the centipawn loss
+of a ply is how much worse the position got for the side that moved. The
+engines are a pool of long-lived processes, one per core by default, shared
+by all games of an analysis. Evaluations are kept in a SQLite cache, so
+positions seen before, like the openings most games share, are not
+evaluated again.
+
+Usage: python engine_analysis.py tournament/ --depth 14
+The engine is found through --engine, the STOCKFISH_PATH environment
+variable or a "stockfish" executable on the PATH.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sqlite3
+import threading
+from dataclasses import dataclass
+
+import chess
+import chess.engine
+from rich.console import Console
+from rich.table import Table
+
+import game_record
+from move_cache import normalized_fen
+from position_index import PositionIndex, position_key
+from providers import run_blocking
+from ratings import record_paths
+
+console = Console()
+
+DEFAULT_DEPTH = 12
+DEFAULT_EVAL_CACHE_PATH = "engine_evals.sqlite3"
+# Score of a forced mate, evaluations are capped at EVAL_CAP before losses are taken
+# so that a mate in 3 instead of a mate in 2 is not counted as a blunder
+MATE_SCORE = 100000
+EVAL_CAP = 1000
+# Centipawn losses from which a move counts as an inaccuracy, a mistake or a blunder
+INACCURACY_CP = 50
+MISTAKE_CP = 100
+BLUNDER_CP = 300
+
+
+@dataclass
+class EngineSettings:
+    """Engine used for the analysis and how long it looks at each position"""
+    # Engine executable, found through STOCKFISH_PATH or the PATH if None
+    path: str = None
+    # Search depth or seconds per position, depth DEFAULT_DEPTH if neither is set
+    depth: int = None
+    time: float = None
+    # Engine processes in the pool, one per core if None
+    processes: int = None
+    threads: int = 1
+    hash_mb: int = 16
+    # SQLite file of the evaluation cache, only kept in memory if None
+    cache_path: str = DEFAULT_EVAL_CACHE_PATH
+
+    def engine_path(self):
+        path = self.path or os.environ.get("STOCKFISH_PATH") or shutil.which("stockfish")
+        if not path:
+            raise ValueError("No UCI engine found, give its path or set STOCKFISH_PATH")
+        return path
+
+    def limit(self):
+        if self.depth is None and self.time is None:
+            return chess.engine.Limit(depth=DEFAULT_DEPTH)
+        return chess.engine.Limit(depth=self.depth, time=self.time)
+
+    def limit_key(self):
+        """Part of the cache key, evaluations made with other limits are not reused"""
+        limit = self.limit()
+        return f"depth={limit.depth}|time={limit.time}"
+
+
+class EvalCache:
+    """Engine evaluations by position, engine and limit, in memory and in SQLite"""
+
+    def __init__(self, path: str = DEFAULT_EVAL_CACHE_PATH, commit_every: int = 500):
+        self.hits = 0
+        self.misses = 0
+        self.commit_every = commit_every
+        self._memory = {}
+        self._uncommitted = 0
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS evals (key TEXT PRIMARY KEY, score INTEGER NOT NULL)")
+            self._db.commit()
+
+    def get(self, key: str):
+        """Get the cached score for a key, or None"""
+        with self._lock:
+            score = self._memory.get(key)
+            if score is None and self._db is not None:
+                row = self._db.execute("SELECT score FROM evals WHERE key = ?", (key,)).fetchone()
+                if row:
+                    score = self._memory[key] = row[0]
+            if score is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return score
+
+    def put(self, key: str, score: int):
+        """Store a score, written to SQLite in batches"""
+        with self._lock:
+            self._memory[key] = score
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO evals (key, score) VALUES (?, ?)", (key, score))
+                self._uncommitted += 1
+                if self._uncommitted >= self.commit_every:
+                    self._db.commit()
+                    self._uncommitted = 0
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.commit()
+                self._db.close()
+                self._db = None
+
+
+class EnginePool:
+    """Long-lived UCI engine processes handing out evaluations"""
+
+    def __init__(self, settings: EngineSettings, cache: EvalCache = None,
+                 index: PositionIndex = None):
+        self.settings = settings
+        self.cache = cache or EvalCache(settings.cache_path)
+        # Position index consulted before the cache and kept up to date, if given
+        self.index = index
+        self.engine_name = None
+        # Positions the engines were asked about and positions found in the index or cache
+        self.evaluated = 0
+        self.reused = 0
+        self._engines = []
+        self._idle = None
+        self._pending = {}
+
+    async def start(self):
+        """Start the engine processes"""
+        self._idle = asyncio.Queue()
+        for _ in range(self.settings.processes or os.cpu_count() or 1):
+            engine = await self._open_engine()
+            self._engines.append(engine)
+            self._idle.put_nowait(engine)
+        self.engine_name = self._engines[0].id.get("name", os.path.basename(
+            self.settings.engine_path()))
+
+    async def _open_engine(self):
+        _, engine = await chess.engine.popen_uci(self.settings.engine_path())
+        options = {"Threads": self.settings.threads, "Hash": self.settings.hash_mb}
+        await engine.configure({name: value for name, value in options.items()
+                                if name in engine.options})
+        return engine
+
+    async def evaluate(self, board: chess.Board):
+        """
+        Evaluates a position.
+
+        Args:
+            board (chess.Board): Position to evaluate
+
+        Returns:
+            int: Centipawns from the point of view of the side to move,
+                +/-MATE_SCORE for a mate
+        """
+        outcome = board.outcome()
+        if outcome is not None:
+            return -MATE_SCORE if outcome.termination == chess.Termination.CHECKMATE else 0
+
+        eval_key = f"{self.engine_name}|{self.settings.limit_key()}"
+        if self.index is not None:
+            score = self.index.evaluation(position_key(board), eval_key)
+            if score is not None:
+                self.reused += 1
+                return score
+        key = f"{normalized_fen(board)}|{eval_key}"
+        score = self.cache.get(key)
+        if score is not None:
+            self.reused += 1
+            if self.index is not None:
+                self.index.add_evaluation(position_key(board), eval_key, score)
+            return score
+        # The same position reached in several games at once is evaluated once
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = self._pending[key] = asyncio.ensure_future(self._analyse(board.copy()))
+            pending.add_done_callback(lambda _: self._pending.pop(key, None))
+        score = await asyncio.shield(pending)
+        self.cache.put(key, score)
+        if self.index is not None:
+            self.index.add_evaluation(position_key(board), eval_key, score)
+        return score
+
+    async def _analyse(self, board: chess.Board):
+        engine = await self._idle.get()
+        self.evaluated += 1
+        try:
+            try:
+                info = await engine.analyse(board, self.settings.limit())
+            except chess.engine.EngineTerminatedError:
+                # Replace a crashed engine and try once more
+                self._engines.remove(engine)
+                engine = await self._open_engine()
+                self._engines.append(engine)
+                info = await engine.analyse(board, self.settings.limit())
+        finally:
+            self._idle.put_nowait(engine)
+        return info["score"].pov(board.turn).score(mate_score=MATE_SCORE)
+
+    async def close(self):
+        for engine in self._engines:
+            try:
+                await engine.quit()
+            except chess.engine.EngineError:
+                pass
+        self._engines = []
+        self.cache.close()
+
+
+def _game_positions(path: str):
+    """
+    Replays the legal plies of a game record.
+
+    Returns:
+        tuple: (header, list of positions before every ply plus the final one,
+            list of ply dicts in the same order)
+    """
+    header, plies, _ = game_record.read_record(path)
+    board = chess.Board()
+    positions, played = [], []
+    for ply in plies:
+        if not ply.get("legal", ply.get("san") is not None) or not ply.get("uci"):
+            continue
+        positions.append(board.copy(stack=False))
+        played.append(ply)
+        board.push_uci(ply["uci"])
+    positions.append(board)
+    return header, positions, played
+
+
+async def analyze_game_async(pool: EnginePool, path: str):
+    """
+    Scores every legal ply of one game record.
+
+    Args:
+        pool (EnginePool): Started engine pool
+        path (str): Game record (.jsonl)
+
+    Returns:
+        list: One dict per ply with model, round, san, book and centipawn loss
+    """
+    _, positions, played = _game_positions(path)
+    scores = await asyncio.gather(*(pool.evaluate(board) for board in positions))
+    capped = [max(-EVAL_CAP, min(EVAL_CAP, score)) for score in scores]
+
+    evaluations = []
+    for index, ply in enumerate(played):
+        # The score after the move is from the opponent's side, so it is negated
+        loss = max(0, capped[index] + capped[index + 1])
+        evaluations.append({
+            "model": ply["model"],
+            "round": ply["round"],
+            "san": ply.get("san"),
+            "book": bool(ply.get("book")),
+            "eval_before": scores[index],
+            "eval_after": -scores[index + 1],
+            "cp_loss": loss,
+        })
+    return evaluations
+
+
+def summarize(games: dict):
+    """
+    Move quality per model, book moves left out.
+
+    Args:
+        games (dict): Ply evaluations per game record, as returned by analyze_games
+
+    Returns:
+        dict: Per model the moves, average centipawn loss, inaccuracies, mistakes and blunders
+    """
+    losses = {}
+    for evaluations in games.values():
+        for ply in evaluations:
+            if not ply["book"]:
+                losses.setdefault(ply["model"], []).append(ply["cp_loss"])
+
+    summary = {}
+    for model, model_losses in losses.items():
+        summary[model] = {
+            "moves": len(model_losses),
+            "acpl": sum(model_losses) / len(model_losses),
+            "inaccuracies": sum(1 for loss in model_losses if INACCURACY_CP <= loss < MISTAKE_CP),
+            "mistakes": sum(1 for loss in model_losses if MISTAKE_CP <= loss < BLUNDER_CP),
+            "blunders": sum(1 for loss in model_losses if loss >= BLUNDER_CP),
+        }
+    return summary
+
+
+async def analyze_games_async(paths, settings: EngineSettings = None,
+                              index: PositionIndex = None):
+    """Scores the games of the given records, directories or globs with one engine pool"""
+    settings = settings or EngineSettings()
+    pool = EnginePool(settings, index=index)
+    await pool.start()
+    try:
+        files = record_paths(paths)
+        # Bound the games in flight, the pool bounds the positions being evaluated
+        semaphore = asyncio.Semaphore(2 * len(pool._engines))
+
+        async def analyze(path):
+            async with semaphore:
+                return path, await analyze_game_async(pool, path)
+
+        results = await asyncio.gather(*(analyze(path) for path in files))
+        return dict(results), pool.evaluated, pool.reused
+    finally:
+        await pool.close()
+        if index is not None:
+            index.flush()
+
+
+def analyze_games(paths, settings: EngineSettings = None, index: PositionIndex = None):
+    """
+    Scores every legal ply of the given games.
+
+    Args:
+        paths (list): Game records, directories or glob patterns
+        settings (EngineSettings): Engine, limits and pool size
+        index (PositionIndex): Position index holding evaluations of earlier analyses
+
+    Returns:
+        tuple: (ply evaluations per game record, positions evaluated by the engines,
+            positions taken from the index or the cache)
+    """
+    return run_blocking(analyze_games_async(paths, settings, index))
+
+
+def quality_table(summary: dict):
+    """Rich table of the per model summary"""
+    table = Table(title="Move quality (centipawn loss)")
+    table.add_column("Model", style="cyan")
+    table.add_column("Moves", justify="right")
+    table.add_column("ACPL", justify="right", style="bold")
+    table.add_column("Inaccuracies", justify="right")
+    table.add_column("Mistakes", justify="right")
+    table.add_column("Blunders", justify="right", style="red")
+    for model, stats in sorted(summary.items(), key=lambda item: item[1]["acpl"]):
+        table.add_row(model, str(stats["moves"]), f"{stats['acpl']:.1f}",
+                      str(stats["inaccuracies"]), str(stats["mistakes"]),
+                      str(stats["blunders"]))
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Score the moves of benchmark games with a UCI engine")
+    parser.add_argument("paths", nargs="+",
+                        help="Game records (.jsonl), directories or glob patterns")
+    parser.add_argument("--engine", help="Path of the UCI engine executable")
+    parser.add_argument("--depth", type=int, help=f"Search depth per position "
+                                                  f"(default {DEFAULT_DEPTH})")
+    parser.add_argument("--time", type=float, help="Seconds per position instead of a depth")
+    parser.add_argument("--processes", type=int, help="Engine processes, one per core by default")
+    parser.add_argument("--hash", type=int, default=16, help="Hash table of each engine in MB")
+    parser.add_argument("--cache-path", default=DEFAULT_EVAL_CACHE_PATH,
+                        help="SQLite file of the evaluation cache")
+    parser.add_argument("--index", metavar="PATH",
+                        help="Position index to look evaluations up in and add them to")
+    parser.add_argument("--json", metavar="PATH",
+                        help="Also write every ply evaluation and the summary to this JSON file")
+    args = parser.parse_args()
+
+    settings = EngineSettings(path=args.engine, depth=args.depth, time=args.time,
+                              processes=args.processes, hash_mb=args.hash,
+                              cache_path=args.cache_path)
+    try:
+        index = PositionIndex(args.index) if args.index else None
+        games, evaluated, reused = analyze_games(args.paths, settings, index)
+    except (ValueError, FileNotFoundError, chess.engine.EngineError) as e:
+        console.print(f"[bold red]Error: {str(e)}[/bold red]")
+        raise SystemExit(1)
+
+    summary = summarize(games)
+    console.print(quality_table(summary))
+    console.print(f"[dim]{len(games)} games, {evaluated} positions evaluated, "
+                  f"{reused} taken from the index or the cache[/dim]")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as json_file:
+            json.dump({"summary": summary, "games": games}, json_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
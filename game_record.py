@@ -0,0 +1,217 @@
+"""
+Structured, append-only record of a benchmark game.
+A record is a JSON lines file written through one buffered handle: a header
+line, one line per ply and a closing result line. At the end of the game the
+moves are also exported as PGN next to the record.
+"""
+
+import json
+import os
+import time
+
+import chess
+import chess.pgn
+
+# Size of the write buffer of a record file
+BUFFER_SIZE = 64 * 1024
+
+
+def pgn_path(record_path: str):
+    """Path of the PGN export belonging to a record file"""
+    return os.path.splitext(record_path)[0] + ".pgn"
+
+
+def metrics_path(record_path: str):
+    """Path of the provider call metrics belonging to a record file"""
+    return os.path.splitext(record_path)[0] + ".metrics.json"
+
+
+def stop_path(record_path: str):
+    """Path of the file asking the game writing a record to stop"""
+    return os.path.splitext(record_path)[0] + ".stop"
+
+
+def checkpoint_path(record_path: str):
+    """Path of the checkpoint a game writes after every ply"""
+    return os.path.splitext(record_path)[0] + ".checkpoint.json"
+
+
+class GameRecord:
+    """Writer for one game record, usable as a context manager"""
+
+    def __init__(self, path: str, resume_at: int = None, plies: int = 0):
+        """
+        Opens a record for writing.
+
+        Args:
+            path (str): Record file
+            resume_at (int): Byte offset returned by sync to continue an existing record at,
+                lines written after it are dropped. A new record is started if None.
+            plies (int): Plies written up to resume_at
+        """
+        self.path = path
+        self.plies = plies if resume_at is not None else 0
+        if resume_at is not None:
+            with open(path, "r+b") as record_file:
+                record_file.truncate(resume_at)
+        self._file = open(path, "a" if resume_at is not None else "w",
+                          encoding="utf-8", buffering=BUFFER_SIZE)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _write(self, entry: dict):
+        self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def write_header(self, players, **metadata):
+        """
+        Writes the header line describing the game.
+
+        Args:
+            players (list): Players of the game
+            **metadata: Any further fields stored in the header
+        """
+        self._write({
+            "type": "header",
+            "started": time.time(),
+            "players": [
+                {"number": player.number, "name": player.name,
+                 "side": player.side, "model": player.model}
+                for player in players
+            ],
+            **metadata,
+        })
+
+    def write_ply(self, round_number: int, player, move: str, raw: str = None,
+                  san: str = None, uci: str = None, latency: float = None,
+                  tokens: dict = None, **extra):
+        """
+        Writes one ply.
+
+        Args:
+            round_number (int): Round the ply belongs to
+            player (Player): Player who made the move
+            move (str): Move as extracted from the answer
+            raw (str): Full raw answer of the model
+            san (str): Move in SAN if it could be played on the board, else None
+            uci (str): Move in UCI if it could be played on the board, else None
+            latency (float): Seconds the model took to answer
+            tokens (dict): Input and output token counts if known
+            **extra: Any further fields stored with the ply
+        """
+        self.plies += 1
+        self._write({
+            "type": "ply",
+            "ply": self.plies,
+            "round": round_number,
+            "player": player.number,
+            "model": player.model,
+            "move": move,
+            "raw": raw,
+            "san": san,
+            "uci": uci,
+            "latency": latency,
+            "tokens": tokens,
+            **extra,
+        })
+
+    def write_result(self, result: str, loser: int = None, pgn_result: str = "*", **extra):
+        """Writes the closing result line"""
+        self._write({
+            "type": "result",
+            "result": result,
+            "loser": loser,
+            "pgn_result": pgn_result,
+            "plies": self.plies,
+            "finished": time.time(),
+            **extra,
+        })
+
+    def flush(self):
+        """Make the lines written so far visible to readers following the record"""
+        self._file.flush()
+
+    def sync(self, durable: bool = True):
+        """
+        Writes the lines so far through to the operating system, and to the disk if durable.
+
+        Returns:
+            int: Size of the record in bytes, where a resumed record continues
+        """
+        self._file.flush()
+        if durable:
+            os.fsync(self._file.fileno())
+        return os.fstat(self._file.fileno()).st_size
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+
+def export_pgn(state, path: str, pgn_result: str = "*", event: str = "AI vs AI benchmark"):
+    """
+    Exports the moves played on the board of a game as PGN.
+
+    Args:
+        state (GameState): State of the finished game
+        path (str): PGN file to write
+        pgn_result (str): Result tag, e.g. "1-0", "0-1", "1/2-1/2" or "*"
+        event (str): Event tag
+    """
+    game = chess.pgn.Game.from_board(state.board)
+    game.headers["Event"] = event
+    game.headers["Date"] = time.strftime("%Y.%m.%d")
+    for player in state.players:
+        game.headers["White" if player.side == "white" else "Black"] = player.name
+    game.headers["Result"] = pgn_result
+    with open(path, "w", encoding="utf-8") as pgn_file:
+        pgn_file.write(str(game) + "\n")
+
+
+def pgn_result(state, result: str, loser: int = None):
+    """PGN result tag for a finished game"""
+    outcome = state.outcome()
+    if outcome is not None:
+        return outcome.result()
+    if result in ("checkmate", "forfeit") and loser is not None:
+        return "0-1" if state.player(loser).side == "white" else "1-0"
+    if result == "max_rounds":
+        return "1/2-1/2"
+    return "*"
+
+
+def book_plies(plies):
+    """Number of plies taken from the opening book, the seeded opening included"""
+    return sum(1 for ply in plies if ply.get("book"))
+
+
+def read_record(path: str):
+    """
+    Reads a game record.
+
+    Args:
+        path (str): Path of the record file
+
+    Returns:
+        tuple: (header dict, list of ply dicts, result dict or None)
+    """
+    header, plies, result = {}, [], None
+    with open(path, "r", encoding="utf-8") as record_file:
+        for line in record_file:
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # A line cut short by a crash or by a writer that is still running
+                continue
+            if entry["type"] == "header":
+                header = entry
+            elif entry["type"] == "ply":
+                plies.append(entry)
+            elif entry["type"] == "result":
+                result = entry
+    return header, plies, result
@@ -0,0 +1,161 @@
+"""
+In-memory state of a chess game.
+Holds the board, the move history and the player metadata, and keeps the
+game transcript sent to the models, so nothing has to be read back from disk
+while the game is running. Every game gets its own GameState, which lets
+several games run in the same process.
+"""
+
+from dataclasses import dataclass, field
+
+import chess
+
+from move_cache import normalized_fen
+
+
+@dataclass
+class Player:
+    """One side of a game, either a human or an AI model"""
+    number: int
+    name: str
+    side: str
+    model: str = None
+    api_key: str = field(default=None, repr=False)
+    prompt: str = field(default=None, repr=False)
+
+    @property
+    def label(self):
+        return f"Player {self.number} ({self.name})"
+
+
+@dataclass
+class MoveReply:
+    """Answer of a model for one ply"""
+    move: str
+    raw: str = None
+    latency: float = None
+    tokens: dict = None
+    cached: bool = False
+    cache_key: str = None
+    # Taken from the opening book, the model was not asked
+    book: bool = False
+    # metrics.CallMetrics of the provider call, None for cached answers
+    metrics: object = field(default=None, repr=False)
+
+
+@dataclass
+class GameState:
+    """Board, move history and players of a single game"""
+    players: list
+    board: chess.Board = field(default_factory=chess.Board)
+    # (player number, move text) for every move in playing order
+    moves: list = field(default_factory=list)
+    # Moves played on the board in normalized SAN
+    san_moves: list = field(default_factory=list)
+    # False once a move could not be played on the board
+    in_sync: bool = True
+    _transcript: list = field(default_factory=list, repr=False)
+
+    def player(self, number: int):
+        """Get a player by number"""
+        return next(player for player in self.players if player.number == number)
+
+    def opponent(self, player: Player):
+        """Get the other player"""
+        return next(other for other in self.players if other is not player)
+
+    def turn_order(self):
+        """Players in the order they move, white first"""
+        return sorted(self.players, key=lambda player: player.side != "white")
+
+    def moves_by(self, player: Player):
+        """Moves played by the given player so far"""
+        return [move for number, move in self.moves if number == player.number]
+
+    def play(self, player: Player, move: str):
+        """
+        Records a move and plays it on the board.
+
+        Args:
+            player (Player): Player who made the move
+            move (str): Move in standard algebraic notation
+
+        Returns:
+            str: The move in normalized SAN if it could be played on the board, else None
+        """
+        self.moves.append((player.number, move))
+        if self.in_sync:
+            parsed = self.parse(move)
+            if parsed is None:
+                self.in_sync = False
+                return None
+            san = self.board.san(parsed)
+            self.board.push(parsed)
+            self.san_moves.append(san)
+            return san
+        return None
+
+    def parse(self, move: str):
+        """
+        Parses a move in SAN or UCI without playing it.
+
+        Args:
+            move (str): Move as given by a player, trailing punctuation is ignored
+
+        Returns:
+            chess.Move: The move if it is legal in the current position, else None
+        """
+        text = move.strip().rstrip(".,;:!?") if move else ""
+        if not text or not self.in_sync:
+            return None
+        for parse in (self.board.parse_san, self.board.parse_uci):
+            try:
+                parsed = parse(text)
+            except ValueError:
+                continue
+            # "--", "0000" and "Z0" parse as the null move, which passes the turn
+            return None if parsed == chess.Move.null() else parsed
+        return None
+
+    def outcome(self):
+        """chess.Outcome once the game is over, counting claimable draws, else None"""
+        # A draw can only be claimed after 7 reversible plies, checking for one
+        # replays the move stack, so it is skipped while no claim is possible
+        if self.board.halfmove_clock < 7:
+            return self.board.outcome()
+        return self.board.outcome(claim_draw=True)
+
+    def loser(self):
+        """Number of the player who lost on the board, or None"""
+        outcome = self.outcome()
+        if outcome is None or outcome.winner is None:
+            return None
+        losing_side = "black" if outcome.winner == chess.WHITE else "white"
+        return next(player.number for player in self.players if player.side == losing_side)
+
+    def position(self):
+        """Normalized FEN of the current position, or None once the board is out of sync"""
+        return normalized_fen(self.board) if self.in_sync else None
+
+    def log(self, line: str):
+        """Add a line to the game transcript"""
+        self._transcript.append(line)
+
+    def transcript(self):
+        """Game transcript as sent to the models"""
+        return "".join(f"{line}\n" for line in self._transcript)
+
+    def transcript_lines(self, start: int = 0):
+        """Lines of the transcript from the given one on"""
+        return self._transcript[start:]
+
+    def snapshot(self):
+        """Moves and transcript of the game, enough to rebuild it with restore"""
+        return {"moves": [list(move) for move in self.moves],
+                "transcript": list(self._transcript)}
+
+    def restore(self, snapshot: dict):
+        """Replays the moves of a snapshot on a fresh state and takes over its transcript"""
+        for number, move in snapshot["moves"]:
+            self.play(self.player(number), move)
+        self._transcript = list(snapshot["transcript"])
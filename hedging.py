@@ -0,0 +1,241 @@
+"""
+Hedged requests for benchmark moves.
+A single slow answer holds up a whole benchmark game. With hedging, a second
+request with the same prompt is sent when the first has not answered within
+the p90 latency the model showed so far. With fan-out, several samples are
+requested at once. The first legal answer wins, or with voting the move most
+of the legal answers agree on, and the requests still running are
+cancelled. Every move records whether it was hedged, how many requests it
+took and how long it took, so the hedge rate and the tail latency with and
+without hedging can be compared.
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+
+from rich.table import Table
+
+import metrics
+
+MODES = ("off", "hedge", "fanout")
+
+
+@dataclass
+class HedgingSettings:
+    """How benchmark moves are requested"""
+    # off: one request, hedge: a second one after a delay, fanout: samples at once
+    mode: str = "off"
+    # Latency percentile of the model after which the hedge is sent
+    quantile: float = 90
+    # Hedge delay in seconds until min_samples latencies of the model are known
+    delay: float = 5.0
+    min_samples: int = 20
+    # Requests sent at once in fanout mode
+    samples: int = 3
+    # Decide by majority vote over the legal answers instead of taking the first
+    vote: bool = False
+
+
+config = HedgingSettings()
+
+
+def configure_hedging(**settings):
+    """
+    Changes how benchmark moves are requested.
+
+    Args:
+        **settings: Any field of HedgingSettings, e.g. mode="hedge" or samples=5
+    """
+    global config
+    new_config = HedgingSettings(**{**config.__dict__, **settings})
+    if new_config.mode not in MODES:
+        raise ValueError(f"Unknown hedging mode: {new_config.mode}, "
+                         f"choose from: {', '.join(MODES)}")
+    if new_config.vote and (new_config.mode != "fanout" or new_config.samples < 2):
+        raise ValueError("Voting needs fanout mode with 2 or more samples")
+    config = new_config
+
+
+class HedgeStats:
+    """Latencies of the models and what hedging did for every move"""
+
+    def __init__(self, window: int = 500):
+        self.window = window
+        self._latencies = {}
+        self._moves = {}
+        self._lock = threading.Lock()
+
+    def reset(self):
+        """Forget the latencies and moves of earlier runs"""
+        with self._lock:
+            self._latencies = {}
+            self._moves = {}
+
+    def add_latency(self, model: str, seconds: float):
+        with self._lock:
+            self._latencies.setdefault(model, deque(maxlen=self.window)).append(seconds)
+
+    def hedge_delay(self, model: str, settings: HedgingSettings):
+        """Seconds to wait for the first answer before sending a hedge"""
+        with self._lock:
+            latencies = list(self._latencies.get(model, ()))
+        if len(latencies) < settings.min_samples:
+            return settings.delay
+        return metrics.percentile(latencies, settings.quantile)
+
+    def add_move(self, model: str, requests: int, hedged: bool, hedge_won: bool,
+                 latency: float, first_latency: float):
+        """Record one move, first_latency is how long the first request ran"""
+        with self._lock:
+            self._moves.setdefault(model, []).append(
+                (requests, hedged, hedge_won, latency, first_latency))
+
+    def summary(self):
+        """
+        What hedging did per model.
+
+        Returns:
+            dict: Per model: moves, hedged moves, hedge_rate, requests, hedge_wins and
+                p50/p99 of the move latency and of the first requests. A first request
+                cancelled because another answer won counts with the time it ran, so
+                its p99 is a lower bound of the latency without hedging.
+        """
+        with self._lock:
+            moves = {model: list(entries) for model, entries in self._moves.items()}
+        summary = {}
+        for model, entries in moves.items():
+            latencies = [entry[3] for entry in entries]
+            first_latencies = [entry[4] for entry in entries if entry[4] is not None]
+            hedged = sum(1 for entry in entries if entry[1])
+            summary[model] = {
+                "moves": len(entries),
+                "hedged": hedged,
+                "hedge_rate": hedged / len(entries),
+                "requests": sum(entry[0] for entry in entries),
+                "hedge_wins": sum(1 for entry in entries if entry[2]),
+                "p50": metrics.percentile(latencies, 50),
+                "p99": metrics.percentile(latencies, 99),
+                "first_p50": metrics.percentile(first_latencies, 50),
+                "first_p99": metrics.percentile(first_latencies, 99),
+            }
+        return summary
+
+
+stats = HedgeStats()
+
+
+async def request(model: str, send, move_key, settings: HedgingSettings = None):
+    """
+    Requests a move with hedging or fan-out.
+
+    Args:
+        model (str): Model name as shown in the menus
+        send (callable): Coroutine function making one provider call and returning its text
+        move_key (callable): Takes an answer, returns the move it plays if it is legal
+            (answers playing the same move get the same key), else None
+        settings (HedgingSettings): The policy, the configured one if None
+
+    Returns:
+        tuple: (answer, CallMetrics of the answer or None, number of requests sent).
+            Without a legal answer the first answer received is returned.
+
+    Raises:
+        Exception: The error of the first request if no request answered
+    """
+    settings = settings or config
+    started = time.perf_counter()
+    attempts = []
+
+    async def attempt(measured):
+        with metrics.capture() as calls:
+            try:
+                return await send()
+            finally:
+                if calls:
+                    measured.append(calls[-1])
+
+    def launch():
+        measured = []
+        attempts.append((asyncio.create_task(attempt(measured)), measured))
+
+    launch()
+    if settings.mode == "fanout":
+        for _ in range(settings.samples - 1):
+            launch()
+    hedge_at = None
+    if settings.mode == "hedge":
+        hedge_at = started + stats.hedge_delay(model, settings)
+
+    needed = len(attempts) // 2 + 1 if settings.vote else 1
+    votes, first_answer, winner, errors = {}, None, None, []
+    pending = {task for task, _ in attempts}
+    while pending and winner is None:
+        timeout = None
+        if hedge_at is not None and len(attempts) == 1:
+            timeout = max(0.0, hedge_at - time.perf_counter())
+        done, pending = await asyncio.wait(pending, timeout=timeout,
+                                           return_when=asyncio.FIRST_COMPLETED)
+        if not done:
+            # The first request is slower than usual, send the hedge
+            launch()
+            pending.add(attempts[-1][0])
+            continue
+        for index, (task, measured) in enumerate(attempts):
+            if task not in done:
+                continue
+            if task.exception() is not None:
+                errors.append(task.exception())
+                continue
+            answer = (task.result(), measured[-1] if measured else None, index)
+            if answer[1] is not None and answer[1].total is not None:
+                stats.add_latency(model, answer[1].total)
+            first_answer = first_answer or answer
+            key = move_key(answer[0])
+            if key is None:
+                continue
+            votes.setdefault(key, []).append(answer)
+            if len(votes[key]) >= needed and winner is None:
+                winner = votes[key][0]
+
+    if winner is None and votes:
+        # No majority, the move with the most votes wins, the earliest on a tie
+        winner = max(votes.values(), key=len)[0]
+    winner = winner or first_answer
+
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+
+    first_measured = attempts[0][1]
+    stats.add_move(model, len(attempts), settings.mode == "hedge" and len(attempts) > 1,
+                   winner is not None and winner[2] > 0, time.perf_counter() - started,
+                   first_measured[-1].total if first_measured else None)
+    if winner is None:
+        raise errors[0]
+    return winner[0], winner[1], len(attempts)
+
+
+def hedging_table(title: str = "Hedged requests"):
+    """Rich table of stats.summary(), or None if no move was hedged or fanned out"""
+    summary = stats.summary()
+    if not summary:
+        return None
+    table = Table(title=f"{title} (seconds)")
+    table.add_column("Model", style="cyan")
+    table.add_column("Moves", justify="right")
+    table.add_column("Hedged", justify="right")
+    table.add_column("Requests", justify="right")
+    table.add_column("Won by extra", justify="right")
+    table.add_column("Move p50/p99", justify="right")
+    table.add_column("First request p50/p99", justify="right")
+    for model, row in sorted(summary.items()):
+        table.add_row(
+            model, str(row["moves"]), f"{row['hedged']} ({row['hedge_rate']:.0%})",
+            str(row["requests"]), str(row["hedge_wins"]),
+            f"{row['p50']:.2f}/{row['p99']:.2f}",
+            "-" if row["first_p50"] is None
+            else f"{row['first_p50']:.2f}/{row['first_p99']:.2f}")
+    return table
@@ -1,27 +1,29 @@
 import rich
-from rich.console import Console
 from rich.prompt import Prompt
-import keyboard
 import os
-from rich.panel import Panel
+import cassette
+import provider_registry
+import terminal_ui
 
 
 def display_screen_for_key(title_content, additional_content=None):
     """Display the screen with title and additional content"""
-    os.system('cls' if os.name == 'nt' else 'clear')
-    console = Console()
+    terminal_ui.get_screen().page(title_content, additional_content)
 
-    # Display title
-    console.print(Panel(title_content, border_style="green", expand=False))
 
-    # Display additional content if provided
-    if additional_content:
-        console.print(additional_content)
+def get_key(model, title_content):
+    """Ask user for API key based on model selection, unless it is set in the environment"""
+    console = terminal_ui.get_screen().console
 
+    # Replayed answers come from the cassette, the key is never sent
+    recorder = cassette.get_cassette()
+    if recorder is not None and recorder.replaying:
+        return "replay"
 
-def get_key(model, title_content):
-    """Ask user for API key based on model selection"""
-    console = Console()
+    # The same environment variables as the unattended runner
+    env_name = provider_registry.get_model(model).key_env
+    if env_name and os.environ.get(env_name):
+        return os.environ[env_name]
 
     # Display the API key question
     display_screen_for_key(
@@ -53,5 +55,6 @@ def get_key(model, title_content):
 
         # Wait for any key to exit
         console.print("\n[italic]Press any key to exit...[/italic]")
+        import keyboard
         keyboard.read_event(suppress=True)
         return None
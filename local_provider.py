@@ -0,0 +1,118 @@
+"""
+Local stand-in provider for offline load testing of the harness.
+Answers from the python-chess legal moves of the current position instead of
+calling an API: a random legal move, or the next move of a scripted line.
+A configurable share of answers is illegal or garbled and every answer waits
+for a simulated, log-normally distributed latency.
+"""
+
+import asyncio
+import math
+import random
+from dataclasses import dataclass, field
+
+import chess
+
+# Model names served by the local provider
+LOCAL_MODELS = ["local random", "local scripted"]
+
+GARBLED_ANSWERS = [
+    "I think the best move here is to develop my pieces.",
+    "As an AI language model I cannot see the board.",
+    "1... ??",
+    "",
+    "Move: <unknown>",
+]
+
+
+@dataclass
+class LocalProviderConfig:
+    """Behaviour of the local provider"""
+    # Share of answers that are a well formed but illegal move
+    illegal_rate: float = 0.0
+    # Share of answers that are not a move at all
+    garbled_rate: float = 0.0
+    # Mean and spread (log-normal sigma) of the simulated latency in seconds
+    latency_mean: float = 0.0
+    latency_sigma: float = 0.5
+    # Moves of both sides in SAN, played by "local scripted" while they are legal
+    script: list = field(default_factory=list)
+    seed: int = None
+
+
+config = LocalProviderConfig()
+_rng = random.Random()
+
+
+def configure_local_provider(**settings):
+    """
+    Changes the behaviour of the local provider.
+
+    Args:
+        **settings: Any field of LocalProviderConfig, e.g. illegal_rate=0.1 or latency_mean=0.5
+    """
+    global config
+    config = LocalProviderConfig(**{**config.__dict__, **settings})
+    _rng.seed(config.seed)
+
+
+def simulated_latency():
+    """Draw one latency from the configured log-normal distribution"""
+    if config.latency_mean <= 0:
+        return 0.0
+    sigma = config.latency_sigma
+    mu = math.log(config.latency_mean) - sigma * sigma / 2
+    return _rng.lognormvariate(mu, sigma)
+
+
+def _illegal_move(board: chess.Board):
+    """A move in valid notation that cannot be played in the position"""
+    # A legal move of the side not to move is almost never legal for the side to move
+    flipped = board.copy(stack=False)
+    flipped.turn = not board.turn
+    for move in _rng.sample(list(flipped.legal_moves), flipped.legal_moves.count()):
+        san = flipped.san(move)
+        try:
+            board.parse_san(san)
+        except ValueError:
+            return san
+    return "Ke9"
+
+
+def choose_move(model: str, board: chess.Board):
+    """
+    Picks the answer of a local model for the given position.
+
+    Args:
+        model (str): One of LOCAL_MODELS
+        board (chess.Board): Current position
+
+    Returns:
+        str: The answer text
+    """
+    roll = _rng.random()
+    if roll < config.garbled_rate:
+        return _rng.choice(GARBLED_ANSWERS)
+    if roll < config.garbled_rate + config.illegal_rate:
+        return _illegal_move(board)
+
+    if model == "local scripted":
+        ply = len(board.move_stack)
+        if ply < len(config.script):
+            try:
+                return board.san(board.parse_san(config.script[ply]))
+            except ValueError:
+                pass
+
+    legal_moves = list(board.legal_moves)
+    if not legal_moves:
+        return "checkmate" if board.is_checkmate() else "stalemate"
+    return board.san(_rng.choice(legal_moves))
+
+
+async def local_move_async(model: str, prompt_text: str, board: chess.Board = None):
+    """Answer like a remote provider would, after the simulated latency"""
+    delay = simulated_latency()
+    if delay:
+        await asyncio.sleep(delay)
+    return choose_move(model, board if board is not None else chess.Board())
@@ -1,11 +1,8 @@
-from rich.console import Console
 from rich.prompt import Prompt
-from rich.panel import Panel
 from rich import print
 from rich.prompt import Confirm
-import os
-import sys
-import keyboard
+import provider_registry
+import terminal_ui
 
 
 def get_title_content():
@@ -14,44 +11,38 @@ def get_title_content():
         with open("title.txt", "r", encoding="utf-8") as f:
             return f.read()
     except FileNotFoundError:
-        console = Console()
+        console = terminal_ui.get_screen().console
         console.print("[bold red]Error: title.txt not found![/bold red]")
         exit(1)
 
 
 def display_screen(title_content, additional_content=None):
     """Display the screen with title and additional content"""
-    os.system('cls' if os.name == 'nt' else 'clear')
-    console = Console()
-
-    # Display title
-    console.print(Panel(title_content, border_style="green", expand=False))
-
-    # Display additional content if provided
-    if additional_content:
-        console.print(additional_content)
+    terminal_ui.get_screen().page(title_content, additional_content)
 
 
 def select_from_menu(options, prompt_text, title_content):
     """Create a custom selection menu where user navigates with arrow keys and selects with space"""
-    console = Console()
-    selected_index = 0
+    # Imported here so that the unattended runner works without the keyboard module
+    import keyboard
 
-    def print_menu():
-        # Display screen with title and menu
-        display_screen(title_content)
-        console.print(prompt_text)
+    screen = terminal_ui.get_screen()
+    selected_index = 0
 
+    def render_menu():
+        lines = [prompt_text]
         for i, option in enumerate(options):
             if i == selected_index:
-                console.print(f"[bold green]> {option} <[/bold green]")
+                lines.append(f"[bold green]> {option} <[/bold green]")
             else:
-                console.print(f"  {option}  ")
-
-        console.print(
+                lines.append(f"  {option}  ")
+        lines.append(
             "\n[italic]Use arrow keys to navigate and press SPACE to select[/italic]")
+        return "\n".join(lines)
 
-    print_menu()
+    # The title stays on screen, only the menu below it is redrawn on key presses
+    display_screen(title_content)
+    screen.live(render_menu())
 
     while True:
         key_event = keyboard.read_event(suppress=True)
@@ -59,17 +50,18 @@ def select_from_menu(options, prompt_text, title_content):
         if key_event.event_type == keyboard.KEY_DOWN:
             if key_event.name == "down" and selected_index < len(options) - 1:
                 selected_index += 1
-                print_menu()
+                screen.update(render_menu(), since=key_event.time)
             elif key_event.name == "up" and selected_index > 0:
                 selected_index -= 1
-                print_menu()
+                screen.update(render_menu(), since=key_event.time)
             elif key_event.name == "space":
+                screen.stop()
                 return options[selected_index]
 
 
 def get_user_input(title_content):
     """Get user name and model selection"""
-    console = Console()
+    console = terminal_ui.get_screen().console
 
     # Ask for name
     display_screen(
@@ -77,8 +69,7 @@ def get_user_input(title_content):
     name = Prompt.ask("")
 
     # Model selection using custom menu
-    model_choices = ["gpt 4o", "claude sonnet 4",
-                     "gemini 2.5 flash", "deepseek"]
+    model_choices = provider_registry.model_names()
     model = select_from_menu(
         model_choices, "[bold blue]Select a model:[/bold blue]", title_content)
 
@@ -87,7 +78,7 @@ def get_user_input(title_content):
 
 def main():
     """Main function to run the application"""
-    console = Console()
+    console = terminal_ui.get_screen().console
     title_content = get_title_content()
     display_screen(title_content)
     name, model = get_user_input(title_content)
@@ -100,8 +91,12 @@ def main():
     console.print(f"[bold green]Name:[/bold green] {name}")
     console.print(f"[bold green]Model:[/bold green] {model}")
 
-    from key_handler import get_key
-    api_key = get_key(model, title_content)
+    # The local stand-in models run offline and need no API key
+    if provider_registry.is_local(model):
+        api_key = "local"
+    else:
+        from key_handler import get_key
+        api_key = get_key(model, title_content)
 
     # If API key was provided, output it to terminal
     if api_key:
@@ -122,6 +117,7 @@ def main():
         choice = console.input(
             "[bold cyan]Enter your choice (1/2): [/bold cyan]")
 
+        import keyboard
         from chess_game import chess_match, chessmatch_benchmark
 
         if choice == "1":
@@ -150,6 +146,12 @@ def main():
             main()
         else:
             print("Thanks for playing!")
+            latency = terminal_ui.get_screen().latency_summary()
+            if latency:
+                console.print(
+                    f"[dim]Menu redraw latency over {latency['keystrokes']} keystrokes: "
+                    f"p50 {latency['p50'] * 1000:.1f} ms, p95 {latency['p95'] * 1000:.1f} ms, "
+                    f"max {latency['max'] * 1000:.1f} ms[/dim]")
             exit(0)
 
 
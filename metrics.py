@@ -0,0 +1,288 @@
+"""
+Instrumentation of provider calls.
+Every call to a model is measured while it runs: time spent waiting before
+the request is sent, time to the first response byte, total time, token
+counts from the SDK usage fields, HTTP retries done by the SDK and the class
+of the error if it failed. Finished calls are collected by every enclosing
+capture() block and can be summarized as p50/p95/p99 per model.
+"""
+
+import contextvars
+import json
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field, fields
+
+from rich.table import Table
+
+# Percentiles reported for every timing
+PERCENTILES = (50, 95, 99)
+
+_current_call = contextvars.ContextVar("current_call", default=None)
+_captures = contextvars.ContextVar("captures", default=())
+
+
+@dataclass
+class CallMetrics:
+    """Measurements of a single provider call"""
+    model: str
+    provider: str = None
+    # Prompt strategy and size of the prompt text
+    strategy: str = None
+    prompt_chars: int = None
+    queue_wait: float = None
+    ttfb: float = None
+    total: float = None
+    input_tokens: int = None
+    output_tokens: int = None
+    # Streamed answer, and whether reading stopped early once the move was complete
+    streamed: bool = False
+    cut_off: bool = False
+    # HTTP requests sent by the SDK beyond the first one
+    retries: int = 0
+    error: str = None
+    status_code: int = None
+    started: float = field(default_factory=time.time)
+    _start: float = field(default_factory=time.perf_counter, repr=False)
+    _sent: float = field(default=None, repr=False)
+    _requests: int = field(default=0, repr=False)
+
+    def tokens(self):
+        """Token counts as stored with a ply, or None if the provider reported none"""
+        if self.input_tokens is None and self.output_tokens is None:
+            return None
+        return {"input": self.input_tokens, "output": self.output_tokens}
+
+    def to_dict(self):
+        # Every field is a plain value, asdict would deep copy each of them
+        return {attribute.name: getattr(self, attribute.name) for attribute in fields(self)
+                if not attribute.name.startswith("_")}
+
+
+@contextmanager
+def capture():
+    """
+    Collects the calls finished inside the block, including calls made by
+    tasks started inside it.
+
+    Returns:
+        list: The CallMetrics of the calls, filled in as they finish
+    """
+    calls = []
+    token = _captures.set(_captures.get() + (calls,))
+    try:
+        yield calls
+    finally:
+        _captures.reset(token)
+
+
+@contextmanager
+def measure(model: str, provider: str = None):
+    """
+    Measures one provider call made inside the block.
+
+    Args:
+        model (str): Model name as shown in the menus
+        provider (str): Provider serving the model
+
+    Returns:
+        CallMetrics: The measurements, complete once the block is left
+    """
+    call = CallMetrics(model, provider)
+    token = _current_call.set(call)
+    try:
+        yield call
+    except BaseException as e:
+        call.error = type(e).__name__
+        call.status_code = getattr(e, "status_code", None)
+        raise
+    finally:
+        _current_call.reset(token)
+        call.total = time.perf_counter() - call._start
+        call.retries = max(call._requests - 1, 0)
+        for calls in _captures.get():
+            calls.append(call)
+
+
+def current_call():
+    """CallMetrics of the call running in this context, or None"""
+    return _current_call.get()
+
+
+def mark_sent():
+    """Ends the queue wait of the running call, called right before the request is sent"""
+    call = _current_call.get()
+    if call is not None and call._sent is None:
+        call._sent = time.perf_counter()
+        call.queue_wait = call._sent - call._start
+
+
+def mark_first_byte():
+    """Records the time to the first response byte of the running call"""
+    call = _current_call.get()
+    if call is not None and call.ttfb is None:
+        call.ttfb = time.perf_counter() - (call._sent or call._start)
+
+
+def record_usage(input_tokens: int = None, output_tokens: int = None):
+    """Stores the token counts reported by the provider for the running call"""
+    call = _current_call.get()
+    if call is not None:
+        call.input_tokens = input_tokens
+        call.output_tokens = output_tokens
+
+
+async def on_request(request):
+    """httpx event hook counting the requests sent for the running call"""
+    call = _current_call.get()
+    if call is None:
+        return
+    call._requests += 1
+    if call._sent is None:
+        mark_sent()
+    else:
+        # A retry of the SDK, the time to first byte is taken from the answered request
+        call._sent = time.perf_counter()
+        call.ttfb = None
+
+
+async def on_response(response):
+    """httpx event hook, runs as soon as the response headers arrived"""
+    mark_first_byte()
+
+
+# Event hooks to install on the HTTP clients of the provider SDKs
+EVENT_HOOKS = {"request": [on_request], "response": [on_response]}
+
+
+def percentile(values, q: float):
+    """Linearly interpolated q-th percentile of a list of numbers, or None if it is empty"""
+    values = sorted(values)
+    if not values:
+        return None
+    rank = (len(values) - 1) * q / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (rank - lower)
+
+
+def _distribution(values):
+    values = [value for value in values if value is not None]
+    return {f"p{q}": percentile(values, q) for q in PERCENTILES}
+
+
+def summarize(calls):
+    """
+    Aggregates calls per model.
+
+    Args:
+        calls (list): CallMetrics of finished calls
+
+    Returns:
+        dict: Per model the number of calls, errors by class, retries, token totals
+            and p50/p95/p99 of queue wait, time to first byte and total time
+    """
+    by_model = {}
+    for call in calls:
+        by_model.setdefault(call.model, []).append(call)
+
+    summary = {}
+    for model, model_calls in by_model.items():
+        errors = {}
+        for call in model_calls:
+            if call.error:
+                errors[call.error] = errors.get(call.error, 0) + 1
+        summary[model] = {
+            "calls": len(model_calls),
+            "errors": errors,
+            "retries": sum(call.retries for call in model_calls),
+            "cut_off": sum(call.cut_off for call in model_calls),
+            "input_tokens": sum(call.input_tokens or 0 for call in model_calls),
+            "output_tokens": sum(call.output_tokens or 0 for call in model_calls),
+            "queue_wait": _distribution(call.queue_wait for call in model_calls),
+            "ttfb": _distribution(call.ttfb for call in model_calls),
+            "total": _distribution(call.total for call in model_calls),
+            "prompts": _prompt_sizes(model_calls),
+        }
+    return summary
+
+
+def _prompt_sizes(calls):
+    """Prompt size distribution per prompt strategy"""
+    by_strategy = {}
+    for call in calls:
+        by_strategy.setdefault(call.strategy or "unknown", []).append(call)
+    return {
+        strategy: {
+            "calls": len(strategy_calls),
+            "prompt_chars": _distribution(call.prompt_chars for call in strategy_calls),
+            "input_tokens": _distribution(call.input_tokens for call in strategy_calls),
+        }
+        for strategy, strategy_calls in by_strategy.items()
+    }
+
+
+def export_metrics(calls, path: str, **metadata):
+    """
+    Writes the per model summary and every single call as JSON.
+
+    Args:
+        calls (list): CallMetrics of finished calls
+        path (str): JSON file to write
+        **metadata: Any further fields stored at the top level
+    """
+    with open(path, "w", encoding="utf-8") as metrics_file:
+        json.dump({
+            **metadata,
+            "summary": summarize(calls),
+            "calls": [call.to_dict() for call in calls],
+        }, metrics_file, indent=2)
+
+
+def load_calls(path: str):
+    """The calls of a file written by export_metrics, as CallMetrics"""
+    with open(path, "r", encoding="utf-8") as metrics_file:
+        return [CallMetrics(**call) for call in json.load(metrics_file)["calls"]]
+
+
+def metrics_table(calls, title: str = "Provider calls"):
+    """Rich table with the per model percentiles of the given calls"""
+    table = Table(title=f"{title} (seconds, p50/p95/p99)")
+    table.add_column("Model", style="cyan")
+    table.add_column("Calls", justify="right")
+    table.add_column("Errors", justify="right")
+    table.add_column("Retries", justify="right")
+    table.add_column("Tokens in/out", justify="right")
+    for name in ("Queue", "TTFB", "Total"):
+        table.add_column(name, justify="right")
+
+    def timings(distribution):
+        return "/".join("-" if distribution[f"p{q}"] is None else f"{distribution[f'p{q}']:.2f}"
+                        for q in PERCENTILES)
+
+    for model, stats in summarize(calls).items():
+        table.add_row(
+            model, str(stats["calls"]), str(sum(stats["errors"].values())),
+            str(stats["retries"]), f"{stats['input_tokens']}/{stats['output_tokens']}",
+            timings(stats["queue_wait"]), timings(stats["ttfb"]), timings(stats["total"]))
+    return table
+
+
+def prompt_size_table(calls, title: str = "Prompt sizes"):
+    """Rich table with the prompt size per model and prompt strategy of the given calls"""
+    table = Table(title=f"{title} (p50/p95/p99)")
+    table.add_column("Model", style="cyan")
+    table.add_column("Strategy", style="magenta")
+    table.add_column("Calls", justify="right")
+    table.add_column("Characters", justify="right")
+    table.add_column("Input tokens", justify="right")
+
+    def sizes(distribution):
+        return "/".join("-" if distribution[f"p{q}"] is None else f"{distribution[f'p{q}']:.0f}"
+                        for q in PERCENTILES)
+
+    for model, stats in summarize(calls).items():
+        for strategy, prompts in stats["prompts"].items():
+            table.add_row(model, strategy, str(prompts["calls"]),
+                          sizes(prompts["prompt_chars"]), sizes(prompts["input_tokens"]))
+    return table
@@ -42,3 +42,9 @@ if no move was made, take that as if its the beginning of the game and play the
 you are not required to explain your move, just respond with the move.
 response example: e4
 """
+
+LOCAL_MODEL_PROMPT = """
+You are a local stand-in chess engine used to test the game without any API.
+Respond with a move in standard algebraic notation.
+response example: e4
+"""
@@ -0,0 +1,140 @@
+"""
+Position keyed cache for model moves.
+Answers are keyed by the normalized position, the model name and the prompt
+version. A bounded in-memory LRU tier sits in front of a SQLite file that
+survives restarts. Writes to SQLite are committed in batches of
+commit_every answers, and when the cache is flushed or closed, so storing an
+answer does not wait for the disk.
+"""
+
+import atexit
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import chess
+
+# Bump whenever the benchmark prompt layout changes so old answers are not reused
+PROMPT_FORMAT_VERSION = 2
+
+DEFAULT_CACHE_PATH = "move_cache.sqlite3"
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def normalized_fen(board: chess.Board):
+    """FEN of the position without the move counters, so transpositions share a key"""
+    return " ".join(board.fen().split()[:4])
+
+
+def prompt_version(prompt: str, strategy: str = "full"):
+    """Short fingerprint of a model prompt, the prompt strategy and the prompt layout version"""
+    digest = hashlib.sha256(f"{PROMPT_FORMAT_VERSION}\n{strategy}\n{prompt}".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def cache_key(position: str, model: str, version: str):
+    """Key of one cache entry"""
+    return hashlib.sha256(f"{position}|{model}|{version}".encode("utf-8")).hexdigest()
+
+
+class MoveCache:
+    """Two tier cache of model answers: in-memory LRU backed by SQLite"""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_entries: int = 10000,
+                 commit_every: int = 100):
+        self.max_entries = max_entries
+        self.commit_every = commit_every
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._uncommitted = 0
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS moves (key TEXT PRIMARY KEY, response TEXT NOT NULL)")
+            self._db.commit()
+
+    def get(self, key: str):
+        """Get the cached answer for a key, or None"""
+        with self._lock:
+            response = self._memory.get(key)
+            if response is not None:
+                self._memory.move_to_end(key)
+            elif self._db is not None:
+                row = self._db.execute(
+                    "SELECT response FROM moves WHERE key = ?", (key,)).fetchone()
+                if row:
+                    response = row[0]
+                    self._remember(key, response)
+
+            if response is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return response
+
+    def put(self, key: str, response: str):
+        """Store an answer in both tiers"""
+        with self._lock:
+            self._remember(key, response)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO moves (key, response) VALUES (?, ?)", (key, response))
+                self._uncommitted += 1
+                if self._uncommitted >= self.commit_every:
+                    self._db.commit()
+                    self._uncommitted = 0
+
+    def _remember(self, key, response):
+        self._memory[key] = response
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def flush(self):
+        """Commit the answers stored since the last commit"""
+        with self._lock:
+            if self._db is not None and self._uncommitted:
+                self._db.commit()
+                self._uncommitted = 0
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.commit()
+                self._db.close()
+                self._db = None
+
+
+def get_cache():
+    """Get the process wide move cache, opening it on first use"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = MoveCache()
+    return _default_cache
+
+
+def set_cache(cache: MoveCache):
+    """Replace the process wide move cache, e.g. to use another file or size"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is not None and _default_cache is not cache:
+            _default_cache.close()
+        _default_cache = cache
+
+
+def flush_cache():
+    """Commit the process wide move cache if it was opened"""
+    with _default_cache_lock:
+        cache = _default_cache
+    if cache is not None:
+        cache.flush()
+
+
+atexit.register(flush_cache)
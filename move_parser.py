@@ -0,0 +1,86 @@
+"""
+Incremental move parser for model answers.
+Finds the first word of an answer that looks like a move in SAN or UCI, or
+"checkmate"/"stalemate", while the answer is still arriving. A word only
+counts once something that cannot be part of a move follows it, so "e2" is
+not mistaken for a move while "e2e4" is still being streamed.
+"""
+
+import re
+
+# Moves in SAN, castling written with letters or zeros, or in UCI
+MOVE_PATTERN = re.compile(
+    r"(O-O(-O)?|0-0(-0)?|[KQRBN]?[a-h]?[1-8]?x?[a-h][1-8](=?[QRBN])?|[a-h][1-8][a-h][1-8][qrbn]?)[+#]?")
+
+# Words ending the game that are answers in their own right
+GAME_END_WORDS = ("checkmate", "stalemate")
+
+# Everything else ends a word
+_WORD = re.compile(r"[A-Za-z0-9=+#-]+")
+
+
+class MoveParser:
+    """Feeds an answer chunk by chunk and reports the move as soon as it is complete"""
+
+    def __init__(self):
+        self.text = ""
+        self.move = None
+        self._scanned = 0
+
+    def feed(self, chunk: str):
+        """
+        Adds the next chunk of the answer.
+
+        Args:
+            chunk (str): Next piece of text, may end in the middle of a word
+
+        Returns:
+            str: The move once one is complete, else None
+        """
+        if chunk:
+            self.text += chunk
+        if self.move is None:
+            self._scan(final=False)
+        return self.move
+
+    def finish(self):
+        """Ends the answer, a word at the very end now counts as complete"""
+        if self.move is None:
+            self._scan(final=True)
+        return self.move
+
+    def _scan(self, final: bool):
+        for word in _WORD.finditer(self.text, self._scanned):
+            if word.end() == len(self.text) and not final:
+                # The word may still go on in the next chunk
+                return
+            self._scanned = word.end()
+            if is_move(word.group()):
+                self.move = word.group()
+                return
+
+
+def is_move(word: str):
+    """True if a word looks like a move or ends the game"""
+    return word.lower() in GAME_END_WORDS or MOVE_PATTERN.fullmatch(word) is not None
+
+
+def extract_move(response: str):
+    """
+    Extracts the move from a complete answer.
+
+    Args:
+        response (str): Full answer of a model
+
+    Returns:
+        str: The first word that looks like a move, or the first word of the answer
+            if none does, so that illegal answers are still recorded as given
+    """
+    if not response:
+        return response
+    parser = MoveParser()
+    parser.feed(response)
+    move = parser.finish()
+    if move is not None:
+        return move
+    return response.split()[0] if response.strip() else response.strip()
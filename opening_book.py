@@ -0,0 +1,160 @@
+"""
+Opening book consulted before asking a model for a move.
+Positions reached in the first plies of a game are standard, so the book can
+answer them without a provider call: either every model plays book moves for
+its first plies, or a random book line is played before the game starts so
+games begin from varied positions. The book is a Polyglot .bin file or, by
+default, a small table of main line openings bundled here.
+"""
+
+import random
+from dataclasses import dataclass, field
+
+import chess
+import chess.polyglot
+
+from move_cache import normalized_fen
+
+# Main line openings in SAN, every line adds its moves to the bundled book
+BOOK_LINES = [
+    # Ruy Lopez
+    "e4 e5 Nf3 Nc6 Bb5 a6 Ba4 Nf6 O-O Be7 Re1 b5 Bb3 d6",
+    "e4 e5 Nf3 Nc6 Bb5 Nf6 O-O Nxe4 d4 Nd6 Bxc6 dxc6 dxe5 Nf5",
+    # Italian game
+    "e4 e5 Nf3 Nc6 Bc4 Bc5 c3 Nf6 d3 d6 O-O O-O",
+    "e4 e5 Nf3 Nc6 Bc4 Nf6 d3 Be7 O-O O-O Re1 d6",
+    # Scotch game
+    "e4 e5 Nf3 Nc6 d4 exd4 Nxd4 Nf6 Nxc6 bxc6 e5 Qe7",
+    # Petrov defence
+    "e4 e5 Nf3 Nf6 Nxe5 d6 Nf3 Nxe4 d4 d5 Bd3 Nc6",
+    # Sicilian defence
+    "e4 c5 Nf3 d6 d4 cxd4 Nxd4 Nf6 Nc3 a6 Be3 e5",
+    "e4 c5 Nf3 Nc6 d4 cxd4 Nxd4 Nf6 Nc3 e5 Ndb5 d6",
+    "e4 c5 Nf3 e6 d4 cxd4 Nxd4 Nc6 Nc3 Qc7 Be3 a6",
+    "e4 c5 Nc3 Nc6 g3 g6 Bg2 Bg7 d3 d6",
+    # French defence
+    "e4 e6 d4 d5 Nc3 Nf6 Bg5 Be7 e5 Nfd7 Bxe7 Qxe7",
+    "e4 e6 d4 d5 Nd2 Nf6 e5 Nfd7 Bd3 c5 c3 Nc6",
+    # Caro-Kann defence
+    "e4 c6 d4 d5 Nc3 dxe4 Nxe4 Bf5 Ng3 Bg6 h4 h6",
+    "e4 c6 d4 d5 e5 Bf5 Nf3 e6 Be2 c5 Be3 Nd7",
+    # Scandinavian defence
+    "e4 d5 exd5 Qxd5 Nc3 Qa5 d4 Nf6 Nf3 c6",
+    # Queen's gambit
+    "d4 d5 c4 e6 Nc3 Nf6 Bg5 Be7 e3 O-O Nf3 h6",
+    "d4 d5 c4 c6 Nf3 Nf6 Nc3 dxc4 a4 Bf5 e3 e6",
+    "d4 d5 c4 dxc4 Nf3 Nf6 e3 e6 Bxc4 c5 O-O a6",
+    # Indian defences
+    "d4 Nf6 c4 e6 Nc3 Bb4 e3 O-O Bd3 d5 Nf3 c5",
+    "d4 Nf6 c4 g6 Nc3 Bg7 e4 d6 Nf3 O-O Be2 e5",
+    "d4 Nf6 c4 e6 Nf3 b6 g3 Ba6 b3 Bb4+ Bd2 Be7",
+    "d4 Nf6 c4 g6 Nc3 d5 cxd5 Nxd5 e4 Nxc3 bxc3 Bg7",
+    # London system
+    "d4 d5 Bf4 Nf6 e3 c5 c3 Nc6 Nd2 e6 Ngf3 Bd6",
+    # English opening
+    "c4 e5 Nc3 Nf6 Nf3 Nc6 g3 d5 cxd5 Nxd5 Bg2 Nb6",
+    "c4 Nf6 Nc3 e6 e4 d5 e5 d4 exf6 dxc3 bxc3 Qxf6",
+    # Reti opening
+    "Nf3 d5 g3 Nf6 Bg2 e6 O-O Be7 d3 O-O",
+]
+
+
+@dataclass
+class OpeningSettings:
+    """How the opening book is used in a benchmark game"""
+    # Plies each model takes from the book before it is asked, overridden per model
+    book_plies: int = 0
+    model_book_plies: dict = field(default_factory=dict)
+    # Full moves of a random book line played before the game starts
+    seed_moves: int = 0
+    # Polyglot .bin file, the bundled table is used if None
+    book_path: str = None
+    # Seed of the book choices, games are reproducible when it is set
+    seed: int = None
+
+    def plies_for(self, model: str):
+        """Number of own plies the given model takes from the book"""
+        return self.model_book_plies.get(model, self.book_plies)
+
+
+class OpeningBook:
+    """Book moves for known positions, from a Polyglot file or the bundled table"""
+
+    def __init__(self, path: str = None, lines=None):
+        self.path = path
+        self._reader = chess.polyglot.open_reader(path) if path else None
+        self._table = {} if path else _build_table(lines or BOOK_LINES)
+
+    def moves(self, board: chess.Board):
+        """
+        Book moves of a position.
+
+        Args:
+            board (chess.Board): Current position
+
+        Returns:
+            list: (chess.Move, weight) tuples, empty if the position is not in the book
+        """
+        if self._reader is not None:
+            return [(entry.move, entry.weight) for entry in self._reader.find_all(board)]
+        return [(chess.Move.from_uci(uci), weight)
+                for uci, weight in self._table.get(normalized_fen(board), {}).items()]
+
+    def choose(self, board: chess.Board, rng: random.Random = None):
+        """Pick a book move weighted by how often it is played, or None out of book"""
+        moves = self.moves(board)
+        if not moves:
+            return None
+        rng = rng or random
+        return rng.choices([move for move, _ in moves],
+                           weights=[weight or 1 for _, weight in moves])[0]
+
+    def random_line(self, plies: int, rng: random.Random = None):
+        """
+        Plays a random line out of the book from the starting position.
+
+        Args:
+            plies (int): Maximum number of plies of the line
+            rng (random.Random): Source of the choices
+
+        Returns:
+            list: The moves of the line in SAN, shorter if the book runs out
+        """
+        board = chess.Board()
+        line = []
+        while len(line) < plies:
+            move = self.choose(board, rng)
+            if move is None:
+                break
+            line.append(board.san(move))
+            board.push(move)
+        return line
+
+    def close(self):
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+
+
+def _build_table(lines):
+    """Map every position of the given lines to its continuations and their frequency"""
+    table = {}
+    for line in lines:
+        board = chess.Board()
+        for san in line.split():
+            move = board.parse_san(san)
+            continuations = table.setdefault(normalized_fen(board), {})
+            continuations[move.uci()] = continuations.get(move.uci(), 0) + 1
+            board.push(move)
+    return table
+
+
+_books = {}
+
+
+def get_book(path: str = None):
+    """Get the opening book for a Polyglot file, or the bundled one, loading it on first use"""
+    book = _books.get(path)
+    if book is None:
+        book = _books[path] = OpeningBook(path)
+    return book
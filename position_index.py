@@ -0,0 +1,258 @@
+"""
+Index of the positions reached across benchmark games.
+Positions are keyed by their Zobrist hash. For every position the index
+keeps how often a game got past it, what each model answered there, whether
+each answer was legal, and any engine evaluations. Validators and analyzers
+look positions up before redoing their work. The index lives in SQLite,
+with a bounded in-memory LRU tier in front of it, so it grows past the size
+of RAM. A game file is only counted once, unless it changed since it was
+indexed.
+
+Usage: python position_index.py tournament/ [--top 20]
+"""
+
+import argparse
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import chess
+import chess.polyglot
+from rich.console import Console
+from rich.table import Table
+
+console = Console()
+
+DEFAULT_INDEX_PATH = "position_index.sqlite3"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS positions (
+    key INTEGER PRIMARY KEY, fen TEXT NOT NULL, visits INTEGER NOT NULL DEFAULT 0);
+CREATE TABLE IF NOT EXISTS verdicts (
+    key INTEGER, move TEXT, legal INTEGER NOT NULL, reason TEXT NOT NULL, uci TEXT,
+    PRIMARY KEY (key, move));
+CREATE TABLE IF NOT EXISTS responses (
+    key INTEGER, model TEXT, move TEXT, count INTEGER NOT NULL,
+    PRIMARY KEY (key, model, move));
+CREATE TABLE IF NOT EXISTS evaluations (
+    key INTEGER, eval_key TEXT, score INTEGER NOT NULL, PRIMARY KEY (key, eval_key));
+CREATE TABLE IF NOT EXISTS games (path TEXT PRIMARY KEY, size INTEGER, mtime REAL);
+"""
+
+
+def position_key(board: chess.Board):
+    """Zobrist hash of a position, as a signed 64 bit integer so SQLite can store it"""
+    key = chess.polyglot.zobrist_hash(board)
+    return key - (1 << 64) if key >= 1 << 63 else key
+
+
+class PositionIndex:
+    """Per position aggregates of many games, in memory and in SQLite"""
+
+    def __init__(self, path: str = DEFAULT_INDEX_PATH, max_entries: int = 100000,
+                 commit_every: int = 1000):
+        self.path = path
+        self.max_entries = max_entries
+        self.commit_every = commit_every
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._uncommitted = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+        self._db.commit()
+
+    def _lookup(self, memory_key, query, params):
+        """Answer from the LRU tier or SQLite, counted as a hit or a miss"""
+        with self._lock:
+            value = self._memory.get(memory_key)
+            if value is not None:
+                self._memory.move_to_end(memory_key)
+            else:
+                value = self._db.execute(query, params).fetchone()
+                if value is not None:
+                    self._remember(memory_key, value)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def _store(self, memory_key, value, query, params):
+        with self._lock:
+            if memory_key is not None:
+                self._remember(memory_key, value)
+            self._db.execute(query, params)
+            self._uncommitted += 1
+            if self._uncommitted >= self.commit_every:
+                self._db.commit()
+                self._uncommitted = 0
+
+    def _remember(self, memory_key, value):
+        self._memory[memory_key] = value
+        self._memory.move_to_end(memory_key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def verdict(self, key: int, move: str):
+        """
+        Looks up whether an answer was legal in a position.
+
+        Args:
+            key (int): Position key from position_key
+            move (str): Answer as written in the game record
+
+        Returns:
+            tuple: (is_legal, reason, uci of the move or None), or None if not indexed
+        """
+        row = self._lookup(("verdict", key, move),
+                           "SELECT legal, reason, uci FROM verdicts WHERE key = ? AND move = ?",
+                           (key, move))
+        return None if row is None else (bool(row[0]), row[1], row[2])
+
+    def add_verdict(self, key: int, move: str, legal: bool, reason: str, uci: str = None):
+        """Store whether an answer was legal in a position"""
+        self._store(("verdict", key, move), (int(legal), reason, uci),
+                    "INSERT OR REPLACE INTO verdicts (key, move, legal, reason, uci) "
+                    "VALUES (?, ?, ?, ?, ?)", (key, move, int(legal), reason, uci))
+
+    def add_visit(self, key: int):
+        """Count a position being reached, once per ply accepted there, after add_response"""
+        self._store(None, None, "UPDATE positions SET visits = visits + 1 WHERE key = ?", (key,))
+
+    def add_response(self, key: int, board: chess.Board, model: str, move: str):
+        """Count a model's answer in a position, retries and illegal answers included"""
+        self._store(None, None,
+                    "INSERT INTO positions (key, fen, visits) VALUES (?, ?, 0) "
+                    "ON CONFLICT (key) DO NOTHING", (key, board.fen()))
+        self._store(None, None,
+                    "INSERT INTO responses (key, model, move, count) VALUES (?, ?, ?, 1) "
+                    "ON CONFLICT (key, model, move) DO UPDATE SET count = count + 1",
+                    (key, model, move))
+
+    def evaluation(self, key: int, eval_key: str):
+        """Stored engine score of a position for an engine and limit, or None"""
+        row = self._lookup(("evaluation", key, eval_key),
+                           "SELECT score FROM evaluations WHERE key = ? AND eval_key = ?",
+                           (key, eval_key))
+        return None if row is None else row[0]
+
+    def add_evaluation(self, key: int, eval_key: str, score: int):
+        """Store an engine score of a position"""
+        self._store(("evaluation", key, eval_key), (score,),
+                    "INSERT OR REPLACE INTO evaluations (key, eval_key, score) VALUES (?, ?, ?)",
+                    (key, eval_key, score))
+
+    def is_indexed(self, path: str):
+        """True if the answers of a game file were counted and it has not changed since"""
+        stat = os.stat(path)
+        with self._lock:
+            row = self._db.execute("SELECT size, mtime FROM games WHERE path = ?",
+                                   (os.path.abspath(path),)).fetchone()
+        return row is not None and row == (stat.st_size, stat.st_mtime)
+
+    def mark_indexed(self, path: str):
+        """Remember that the answers of a game file were counted"""
+        stat = os.stat(path)
+        self._store(None, None, "INSERT OR REPLACE INTO games (path, size, mtime) VALUES (?, ?, ?)",
+                    (os.path.abspath(path), stat.st_size, stat.st_mtime))
+
+    def position(self, board: chess.Board):
+        """
+        Everything known about a position.
+
+        Args:
+            board (chess.Board): The position
+
+        Returns:
+            dict: visits, answers per model, verdict per answer and evaluations,
+                or None if the position was never reached
+        """
+        key = position_key(board)
+        with self._lock:
+            row = self._db.execute("SELECT fen, visits FROM positions WHERE key = ?",
+                                   (key,)).fetchone()
+            if row is None:
+                return None
+            responses = self._db.execute(
+                "SELECT model, move, count FROM responses WHERE key = ?", (key,)).fetchall()
+            verdicts = self._db.execute(
+                "SELECT move, legal, reason FROM verdicts WHERE key = ?", (key,)).fetchall()
+            evaluations = self._db.execute(
+                "SELECT eval_key, score FROM evaluations WHERE key = ?", (key,)).fetchall()
+        answers = {}
+        for model, move, count in responses:
+            answers.setdefault(model, {})[move] = count
+        return {
+            "fen": row[0],
+            "visits": row[1],
+            "answers": answers,
+            "verdicts": {move: (bool(legal), reason) for move, legal, reason in verdicts},
+            "evaluations": dict(evaluations),
+        }
+
+    def most_visited(self, limit: int = 20):
+        """
+        The positions reached most often.
+
+        Returns:
+            list: (fen, visits, number of answers, share of legal answers) tuples
+        """
+        with self._lock:
+            return self._db.execute(
+                "SELECT p.fen, p.visits, SUM(r.count), "
+                "       SUM(r.count * COALESCE(v.legal, 0)) * 1.0 / SUM(r.count) "
+                "FROM positions p JOIN responses r ON r.key = p.key "
+                "LEFT JOIN verdicts v ON v.key = r.key AND v.move = r.move "
+                "GROUP BY p.key ORDER BY p.visits DESC LIMIT ?", (limit,)).fetchall()
+
+    def flush(self):
+        with self._lock:
+            self._db.commit()
+            self._uncommitted = 0
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.commit()
+                self._db.close()
+                self._db = None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Index the positions of benchmark games and show the most common ones")
+    parser.add_argument("paths", nargs="+",
+                        help="Game records (.jsonl), directories or glob patterns")
+    parser.add_argument("--index", default=DEFAULT_INDEX_PATH,
+                        help="SQLite file of the position index")
+    parser.add_argument("--top", type=int, default=20,
+                        help="Number of positions to show")
+    args = parser.parse_args()
+
+    # Validating a game fills the index with its positions and answers
+    from chess_move_validator import validate_chess_moves
+    from ratings import record_paths
+
+    index = PositionIndex(args.index)
+    files = record_paths(args.paths)
+    for path in files:
+        validate_chess_moves(path, index)
+    console.print(f"[dim]{len(files)} games validated, {index.hits} answers found in the "
+                  f"index, {index.misses} checked[/dim]")
+
+    table = Table(title="Most visited positions")
+    table.add_column("FEN", style="cyan")
+    table.add_column("Visits", justify="right")
+    table.add_column("Answers", justify="right")
+    table.add_column("Legal", justify="right")
+    for fen, visits, answers, legal_rate in index.most_visited(args.top):
+        table.add_row(fen, str(visits), str(answers), f"{legal_rate:.1%}")
+    console.print(table)
+    index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Prompt strategies for the benchmark mode.
+A strategy turns the model prompt from modelPrompt.py and the state of the
+game into the text sent to the model. "full" sends the opponent's moves and
+the whole game transcript and grows with every ply. "compact" and "fen" send
+the position as FEN, so the prompt stays the same size for the whole game.
+"""
+
+from functools import partial
+
+import chess
+
+# Number of most recent plies in SAN sent by the compact strategy
+COMPACT_HISTORY = 6
+
+DEFAULT_STRATEGY = "full"
+
+
+def full_prompt(prompt: str, state, move_list=None, retry_note: str = None):
+    """Opponent's moves and the full game transcript"""
+    # Convert the move list to a string if it's a list
+    if isinstance(move_list, list):
+        # Filter out None values and convert all items to strings
+        valid_moves = [str(move) for move in move_list if move is not None]
+        move_str = ", ".join(valid_moves) if valid_moves else "Starting position"
+    else:
+        move_str = str(move_list) if move_list is not None else "Starting position"
+
+    prompt_text = f"here is your prompt: {prompt}\n\n"
+    prompt_text += f"You are playing chess in a benchmark. Please make a valid chess move.\n\n"
+    prompt_text += f"Previous moves: {move_str}\n\n"
+    prompt_text += f"Game state: {state.transcript()}\n\n"
+    prompt_text += f"Respond ONLY with your next chess move in standard notation (e.g., 'e4', 'Nf3', etc.).\n"
+    prompt_text += f"Do not include any explanations or additional text. Just the move."
+    if retry_note:
+        prompt_text += f"\n\n{retry_note}"
+    return prompt_text
+
+
+def compact_prompt(prompt: str, state, move_list=None, retry_note: str = None,
+                   history: int = COMPACT_HISTORY):
+    """Position as FEN, side to move and the last few moves in SAN"""
+    board = state.board
+    side = "White" if board.turn == chess.WHITE else "Black"
+
+    prompt_text = f"here is your prompt: {prompt}\n\n"
+    prompt_text += f"Position (FEN): {board.fen()}\n"
+    prompt_text += f"You play {side}, it is your move.\n"
+    recent = state.san_moves[-history:] if history else []
+    if recent:
+        prompt_text += f"Last moves: {' '.join(recent)}\n"
+    prompt_text += f"\nRespond ONLY with your move in standard algebraic notation (e.g. 'e4', 'Nf3')."
+    if retry_note:
+        prompt_text += f"\n\n{retry_note}"
+    return prompt_text
+
+
+# Strategy building the prompt text for each strategy name
+PROMPT_STRATEGIES = {
+    "full": full_prompt,
+    "compact": compact_prompt,
+    "fen": partial(compact_prompt, history=0),
+}
+
+
+def build_prompt(strategy: str, prompt: str, state, move_list=None, retry_note: str = None):
+    """
+    Builds the text sent to a model for its next benchmark move.
+
+    Args:
+        strategy (str): Name of a strategy in PROMPT_STRATEGIES
+        prompt (str): Model prompt from modelPrompt.py
+        state (GameState): State of the game
+        move_list (list): Moves of the opponent so far, used by the full strategy
+        retry_note (str): Explanation added when asking again after an illegal move
+
+    Returns:
+        str: The prompt text
+    """
+    builder = PROMPT_STRATEGIES.get(strategy)
+    if builder is None:
+        raise ValueError(f"Unknown prompt strategy: {strategy}")
+    return builder(prompt, state, move_list, retry_note)
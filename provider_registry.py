@@ -0,0 +1,126 @@
+"""
+Registry of the models and providers the game can play with.
+Every model name shown in the menus maps to one ModelSpec naming its
+provider, the model id sent to the API and its prompt, so adding a model
+means adding one entry here. Provider SDKs are heavy to import and are only
+imported when the first client of their provider is created; the time each
+import took is kept for reporting.
+"""
+
+import importlib
+import sys
+import threading
+import time
+from dataclasses import dataclass
+
+from modelPrompt import (CHAT_GPT_PROMPT, CLAUDE_SONNET_4_PROMPT, DEEPSEEK_R1_PROMPT,
+                         GEMINI_2_5_FLASH_PROMPT, LOCAL_MODEL_PROMPT)
+
+
+@dataclass(frozen=True)
+class ModelSpec:
+    """A model as offered in the menus"""
+    name: str
+    provider: str
+    # Model id sent to the provider's API, None for the local stand-in models
+    api_model: str
+    prompt: str
+    # Environment variable holding the API key, None if no key is needed
+    key_env: str = None
+    # Offered in the interactive menus
+    listed: bool = True
+
+
+MODELS = {spec.name: spec for spec in [
+    ModelSpec("gpt 4o", "openai", "gpt-4o", CHAT_GPT_PROMPT, "OPENAI_API_KEY"),
+    ModelSpec("chatgpt 4o", "openai", "gpt-4o", CHAT_GPT_PROMPT, "OPENAI_API_KEY", listed=False),
+    ModelSpec("claude sonnet 4", "anthropic", "claude-3-7-sonnet-latest", CLAUDE_SONNET_4_PROMPT,
+              "ANTHROPIC_API_KEY"),
+    ModelSpec("gemini 2.5 flash", "gemini", "gemini-2.5-flash", GEMINI_2_5_FLASH_PROMPT,
+              "GEMINI_API_KEY"),
+    ModelSpec("deepseek", "deepseek", "deepseek-chat", DEEPSEEK_R1_PROMPT, "DEEPSEEK_API_KEY"),
+    ModelSpec("local random", "local", None, LOCAL_MODEL_PROMPT),
+    ModelSpec("local scripted", "local", None, LOCAL_MODEL_PROMPT),
+]}
+
+# SDK module used by every remote provider. DeepSeek serves an OpenAI compatible API.
+PROVIDER_SDKS = {
+    "openai": "openai",
+    "anthropic": "anthropic",
+    "gemini": "google.genai",
+    "deepseek": "openai",
+}
+
+# Seconds each SDK module took to import in this process
+IMPORT_TIMES = {}
+_import_lock = threading.Lock()
+
+
+def get_model(model: str):
+    """
+    Looks up a model by the name shown in the menus.
+
+    Args:
+        model (str): Model name, e.g. "gpt 4o"
+
+    Returns:
+        ModelSpec: The model
+
+    Raises:
+        ValueError: If the model is unknown
+    """
+    spec = MODELS.get(model)
+    if spec is None:
+        raise ValueError(f"Unknown model: {model}")
+    return spec
+
+
+def model_names(provider: str = None, listed_only: bool = True):
+    """Names of the models, optionally only those served by one provider"""
+    return [spec.name for spec in MODELS.values()
+            if (provider is None or spec.provider == provider)
+            and (spec.listed or not listed_only)]
+
+
+def is_local(model: str):
+    """True for the local stand-in models, which need no API key or network"""
+    spec = MODELS.get(model)
+    return spec is not None and spec.provider == "local"
+
+
+def import_sdk(provider: str):
+    """
+    Imports the SDK module of a provider on first use.
+
+    Args:
+        provider (str): Provider name, e.g. "openai"
+
+    Returns:
+        module: The SDK module
+    """
+    module_name = PROVIDER_SDKS[provider]
+    module = sys.modules.get(module_name)
+    if module is not None:
+        return module
+    with _import_lock:
+        started = time.perf_counter()
+        module = importlib.import_module(module_name)
+        # A module imported meanwhile by another thread is not timed again
+        IMPORT_TIMES.setdefault(module_name, time.perf_counter() - started)
+    return module
+
+
+def import_times():
+    """Seconds each SDK module imported so far took to import"""
+    return dict(IMPORT_TIMES)
+
+
+if __name__ == "__main__":
+    # Measure the cold start of the game and the import time of every SDK
+    started = time.perf_counter()
+    import chess_game  # noqa: F401
+    print(f"chess_game: {time.perf_counter() - started:.3f}s")
+    for provider in PROVIDER_SDKS:
+        import_sdk(provider)
+    for module_name, seconds in import_times().items():
+        print(f"{module_name}: {seconds:.3f}s")
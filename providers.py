@@ -0,0 +1,243 @@
+"""
+Asynchronous provider layer for the AI models used in the chess game.
+Every provider is a coroutine taking the prompt text, the API key and
+whether to stream, and returning the raw text answer, so one event loop can
+keep many requests in flight at once. Streamed answers are only read until
+they hold a complete move. run_blocking lets synchronous code use the same
+coroutines.
+"""
+
+import asyncio
+import threading
+
+import cassette
+import local_provider
+import metrics
+import provider_registry
+import scheduler
+from client_registry import get_client
+from move_parser import MoveParser
+
+# Limit tokens to encourage brief responses
+MAX_OUTPUT_TOKENS = 50
+
+# Stream answers and stop reading once the move is complete
+STREAMING = False
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def configure_streaming(enabled: bool):
+    """Turns streaming with early cut-off on or off for all remote providers"""
+    global STREAMING
+    STREAMING = enabled
+
+
+async def _read_until_move(chunks):
+    """
+    Reads streamed text until it holds a complete move.
+
+    Args:
+        chunks: Async iterator of text pieces
+
+    Returns:
+        str: The text read so far, ending right after the move if one was found
+    """
+    parser = MoveParser()
+    call = metrics.current_call()
+    async for chunk in chunks:
+        if parser.feed(chunk):
+            if call is not None:
+                call.cut_off = True
+            break
+    return parser.text
+
+
+async def gpt_move_async(prompt_text: str, api_key: str, stream: bool = False,
+                         api_model: str = "gpt-4o", provider: str = "openai"):
+    client = get_client(provider, api_key)
+    if stream:
+        return await _gpt_stream(client, prompt_text, api_model)
+    response = await client.chat.completions.create(
+        model=api_model,
+        messages=[{"role": "user", "content": prompt_text}],
+        max_tokens=MAX_OUTPUT_TOKENS
+    )
+    if response.usage:
+        metrics.record_usage(response.usage.prompt_tokens, response.usage.completion_tokens)
+    return response.choices[0].message.content
+
+
+async def _gpt_stream(client, prompt_text: str, api_model: str):
+    response = await client.chat.completions.create(
+        model=api_model,
+        messages=[{"role": "user", "content": prompt_text}],
+        max_tokens=MAX_OUTPUT_TOKENS,
+        stream=True,
+        stream_options={"include_usage": True}
+    )
+
+    async def chunks():
+        async for chunk in response:
+            # The usage arrives in a last chunk without choices, unless the stream is cut off
+            if chunk.usage:
+                metrics.record_usage(chunk.usage.prompt_tokens, chunk.usage.completion_tokens)
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    try:
+        return await _read_until_move(chunks())
+    finally:
+        await response.close()
+
+
+async def deepseek_move_async(prompt_text: str, api_key: str, stream: bool = False,
+                              api_model: str = "deepseek-chat"):
+    # DeepSeek serves an OpenAI compatible API
+    return await gpt_move_async(prompt_text, api_key, stream, api_model, provider="deepseek")
+
+
+async def gemini_move_async(prompt_text: str, api_key: str, stream: bool = False,
+                            api_model: str = "gemini-2.5-flash"):
+    client = get_client("gemini", api_key)
+    if stream:
+        return await _gemini_stream(client, prompt_text, api_model)
+    response = await client.aio.models.generate_content(
+        model=api_model,
+        contents=prompt_text,
+        config={"max_output_tokens": MAX_OUTPUT_TOKENS}
+    )
+    usage = response.usage_metadata
+    if usage:
+        metrics.record_usage(usage.prompt_token_count, usage.candidates_token_count)
+    return response.text
+
+
+async def _gemini_stream(client, prompt_text: str, api_model: str):
+    response = await client.aio.models.generate_content_stream(
+        model=api_model,
+        contents=prompt_text,
+        config={"max_output_tokens": MAX_OUTPUT_TOKENS}
+    )
+
+    async def chunks():
+        async for chunk in response:
+            usage = chunk.usage_metadata
+            if usage:
+                metrics.record_usage(usage.prompt_token_count, usage.candidates_token_count)
+            if chunk.text:
+                yield chunk.text
+
+    try:
+        return await _read_until_move(chunks())
+    finally:
+        await response.aclose()
+
+
+async def claude_move_async(prompt_text: str, api_key: str, stream: bool = False,
+                            api_model: str = "claude-3-7-sonnet-latest"):
+    client = get_client("anthropic", api_key)
+    if stream:
+        return await _claude_stream(client, prompt_text, api_model)
+    response = await client.messages.create(
+        model=api_model,
+        messages=[{"role": "user", "content": prompt_text}],
+        max_tokens=MAX_OUTPUT_TOKENS
+    )
+    if response.usage:
+        metrics.record_usage(response.usage.input_tokens, response.usage.output_tokens)
+    return response.content[0].text
+
+
+async def _claude_stream(client, prompt_text: str, api_model: str):
+    async with client.messages.stream(
+        model=api_model,
+        messages=[{"role": "user", "content": prompt_text}],
+        max_tokens=MAX_OUTPUT_TOKENS
+    ) as stream:
+        text = await _read_until_move(stream.text_stream)
+        # Input tokens are known from the start, output tokens up to the cut-off
+        usage = stream.current_message_snapshot.usage
+        metrics.record_usage(usage.input_tokens, usage.output_tokens)
+        return text
+
+
+# Coroutine answering for each remote provider of the registry
+PROVIDERS = {
+    "openai": gpt_move_async,
+    "deepseek": deepseek_move_async,
+    "anthropic": claude_move_async,
+    "gemini": gemini_move_async,
+}
+
+
+async def request_move(model: str, prompt_text: str, api_key: str, board=None):
+    """
+    Sends the prompt to the provider serving the given model.
+    Remote calls go through the scheduler, which keeps them within the rate
+    limits of the provider and retries temporary failures. Every call is measured,
+    callers get the measurements through metrics.capture(). With a cassette the
+    call is recorded, or answered from the cassette when it is replaying.
+
+    Args:
+        model (str): Model name as shown in the menus, e.g. "gpt 4o"
+        prompt_text (str): Full prompt sent to the model
+        api_key (str): API key for the provider
+        board (chess.Board): Current position, only used by the local stand-in models
+
+    Returns:
+        str: Raw text answer of the model
+
+    Raises:
+        ValueError: If the model is not in the provider registry
+    """
+    spec = provider_registry.get_model(model)
+    recorder = cassette.get_cassette()
+    if spec.provider == "local":
+        with metrics.measure(model, "local") as call:
+            call.prompt_chars = len(prompt_text)
+            metrics.mark_sent()
+            if recorder is None:
+                return await local_provider.local_move_async(model, prompt_text, board)
+            return await recorder.call(
+                model, prompt_text,
+                lambda: local_provider.local_move_async(model, prompt_text, board), call)
+
+    provider = PROVIDERS[spec.provider]
+    with metrics.measure(model, spec.provider) as call:
+        call.prompt_chars = len(prompt_text)
+        call.streamed = STREAMING
+
+        def submit():
+            return scheduler.submit(
+                spec.provider, api_key,
+                lambda: provider(prompt_text, api_key, STREAMING, spec.api_model),
+                scheduler.estimate_tokens(prompt_text, MAX_OUTPUT_TOKENS))
+
+        if recorder is None:
+            return await submit()
+        if recorder.replaying:
+            metrics.mark_sent()
+        return await recorder.call(model, prompt_text, submit, call)
+
+
+def _background_loop():
+    """Get the event loop shared by all synchronous callers, starting it on first use"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever,
+                             name="provider-loop", daemon=True).start()
+    return _loop
+
+
+def run_blocking(coro):
+    """Run a coroutine on the shared provider loop and wait for its result"""
+    return asyncio.run_coroutine_threadsafe(coro, _background_loop()).result()
+
+
+def run_background(coro):
+    """Start a coroutine on the shared provider loop, returns a concurrent.futures.Future"""
+    return asyncio.run_coroutine_threadsafe(coro, _background_loop())
@@ -0,0 +1,378 @@
+"""
+Ratings of the models over many benchmark games.
+Game records are loaded into columnar NumPy arrays, one entry per game, and
+a Bradley-Terry model is fitted to the results. Its strengths are reported
+on the Elo scale, where a 400 point gap means 10:1 odds. Confidence
+intervals come from a bootstrap over games. Every bootstrap sample is
+fitted at once as one batch of arrays, so tens of thousands of games take
+seconds. Legality rate and average game length per model are reported
+alongside.
+
+Usage: python ratings.py tournament/ [more records, directories or globs]
+"""
+
+import argparse
+import glob
+import json
+import os
+from dataclasses import dataclass
+
+import numpy as np
+from rich.console import Console
+from rich.table import Table
+
+console = Console()
+
+# Mean rating of the models, ratings are only defined up to a shift
+BASE_RATING = 1500.0
+# Virtual games, drawn, added between every two models so that ratings stay finite
+# for models that won or lost every game
+PRIOR_GAMES = 1.0
+BOOTSTRAP_SAMPLES = 1000
+CONFIDENCE = 0.95
+MAX_ITERATIONS = 10000
+TOLERANCE = 1e-9
+
+# Points of the white player for each PGN result, games without one are unfinished
+WHITE_POINTS = {"1-0": 1.0, "1/2-1/2": 0.5, "0-1": 0.0}
+
+
+@dataclass
+class GameTable:
+    """Benchmark games as columns, one entry per game"""
+    models: list
+    # Index into models of the white and black player
+    white: np.ndarray
+    black: np.ndarray
+    # Points of white, NaN for unfinished games
+    score: np.ndarray
+    # Moves played on the board
+    plies: np.ndarray
+    # Legal answers and all answers of white and black, book moves left out
+    legal: np.ndarray
+    answers: np.ndarray
+
+    def __len__(self):
+        return len(self.white)
+
+    def finished(self):
+        """Mask of the games with a result"""
+        return ~np.isnan(self.score)
+
+
+def _read_game(path: str):
+    """
+    Reads what the ratings need from one game record.
+    Only the header and result lines are decoded. Ply lines are counted with
+    substring tests: json.dumps writes keys in a fixed form, and quotes inside
+    the raw answers are escaped, so the tests cannot match inside an answer.
+
+    Returns:
+        tuple: (header dict, result dict or None, legal, answers, plies),
+            legal and answers as [white, black], or None if the file is no game record
+    """
+    header, result = None, None
+    legal, answers = {1: 0, 2: 0}, {1: 0, 2: 0}
+    plies = 0
+    with open(path, "r", encoding="utf-8") as record_file:
+        for line in record_file:
+            if line.startswith('{"type": "ply"'):
+                is_legal = ('"legal": true' in line if '"legal": ' in line
+                            else '"san": null' not in line)
+                plies += is_legal
+                if '"book": true' in line:
+                    continue
+                player = 1 if '"player": 1,' in line else 2
+                answers[player] += 1
+                legal[player] += is_legal
+            elif line.startswith('{"type": "header"'):
+                header = json.loads(line)
+            elif line.startswith('{"type": "result"'):
+                try:
+                    result = json.loads(line)
+                except json.JSONDecodeError:
+                    pass
+            elif header is None:
+                return None
+    if header is None or len(header.get("players", [])) != 2:
+        return None
+
+    sides = {player["side"]: player["number"] for player in header["players"]}
+    order = (sides.get("white", 1), sides.get("black", 2))
+    return (header, result, [legal[number] for number in order],
+            [answers[number] for number in order], plies)
+
+
+def record_paths(paths):
+    """Expand directories and glob patterns into the game record files they contain"""
+    found = set()
+    for path in paths:
+        if os.path.isdir(path):
+            found.update(glob.glob(os.path.join(path, "**", "*.jsonl"), recursive=True))
+        else:
+            found.update(glob.glob(path) or [path])
+    return sorted(found)
+
+
+def load_games(paths):
+    """
+    Loads benchmark game records into a GameTable.
+
+    Args:
+        paths (list): Record files, directories or glob patterns
+
+    Returns:
+        GameTable: The games, files that are no game record are skipped
+    """
+    models = {}
+    white, black, score, plies, legal, answers = [], [], [], [], [], []
+    for path in record_paths(paths):
+        game = _read_game(path)
+        if game is None:
+            continue
+        header, result, game_legal, game_answers, game_plies = game
+        names = {player["side"]: player.get("model") or player["name"]
+                 for player in header["players"]}
+        white.append(models.setdefault(names.get("white"), len(models)))
+        black.append(models.setdefault(names.get("black"), len(models)))
+        score.append(WHITE_POINTS.get((result or {}).get("pgn_result"), np.nan))
+        plies.append(game_plies)
+        legal.append(game_legal)
+        answers.append(game_answers)
+
+    return GameTable(
+        models=list(models),
+        white=np.array(white, dtype=np.int32),
+        black=np.array(black, dtype=np.int32),
+        score=np.array(score, dtype=np.float64),
+        plies=np.array(plies, dtype=np.int32),
+        legal=np.array(legal, dtype=np.int64).reshape(-1, 2),
+        answers=np.array(answers, dtype=np.int64).reshape(-1, 2))
+
+
+def _outcome_cells(table: GameTable):
+    """
+    Groups the finished games by white, black and result.
+
+    Returns:
+        tuple: (wins, games, counts) with one row per group, wins and games as
+            flattened model x model matrices and counts the number of games in each
+    """
+    n = len(table.models)
+    mask = table.finished()
+    white, black, score = table.white[mask], table.black[mask], table.score[mask]
+    cells, counts = np.unique((white * n + black) * 3 + (score * 2).astype(np.int64),
+                              return_counts=True)
+    outcome, pair = cells % 3, cells // 3
+    cell_white, cell_black = pair // n, pair % n
+    rows = np.arange(len(cells))
+
+    wins = np.zeros((len(cells), n * n))
+    wins[rows, cell_white * n + cell_black] = outcome / 2
+    wins[rows, cell_black * n + cell_white] = 1 - outcome / 2
+    games = np.zeros((len(cells), n * n))
+    games[rows, cell_white * n + cell_black] = 1
+    games[rows, cell_black * n + cell_white] = 1
+    return wins, games, counts
+
+
+def _fit(wins, games, prior: float = PRIOR_GAMES, iterations: int = MAX_ITERATIONS,
+         tolerance: float = TOLERANCE):
+    """
+    Fits Bradley-Terry strengths with the MM algorithm (Hunter, 2004).
+
+    Args:
+        wins (np.ndarray): Points scored by row against column, shape (..., n, n)
+        games (np.ndarray): Games between row and column, same shape
+        prior (float): Drawn virtual games added between every two models
+        iterations (int): Maximum number of iterations
+        tolerance (float): Largest change of a log strength at which the fit stops
+
+    Returns:
+        np.ndarray: Ratings on the Elo scale, shape (..., n), averaging BASE_RATING
+    """
+    n = wins.shape[-1]
+    off_diagonal = 1 - np.eye(n)
+    wins = wins + off_diagonal * prior / 2
+    games = games + off_diagonal * prior
+    total_wins = wins.sum(axis=-1)
+
+    log_strength = np.zeros(wins.shape[:-1])
+    for _ in range(iterations):
+        strength = np.exp(log_strength)
+        expected = (games / (strength[..., :, None] + strength[..., None, :])).sum(axis=-1)
+        updated = np.log(np.maximum(total_wins, 1e-300)) - np.log(expected)
+        updated -= updated.mean(axis=-1, keepdims=True)
+        converged = np.max(np.abs(updated - log_strength), initial=0) < tolerance
+        log_strength = updated
+        if converged:
+            break
+    return BASE_RATING + 400 * log_strength / np.log(10)
+
+
+def fit_ratings(table: GameTable, prior: float = PRIOR_GAMES):
+    """
+    Fits the ratings of all models to the finished games.
+
+    Args:
+        table (GameTable): The games
+        prior (float): Drawn virtual games added between every two models
+
+    Returns:
+        np.ndarray: Rating of every model in table.models
+    """
+    n = len(table.models)
+    wins, games, counts = _outcome_cells(table)
+    return _fit((counts @ wins).reshape(n, n), (counts @ games).reshape(n, n), prior)
+
+
+def bootstrap_ratings(table: GameTable, samples: int = BOOTSTRAP_SAMPLES, seed: int = None,
+                      prior: float = PRIOR_GAMES):
+    """
+    Ratings fitted to resampled games.
+    Drawing the games again with replacement is the same as drawing how many
+    games fall into each group of white, black and result, so one multinomial
+    draw per sample replaces resampling game by game, and all samples are
+    fitted together.
+
+    Args:
+        table (GameTable): The games
+        samples (int): Number of bootstrap samples
+        seed (int): Seed of the resampling
+        prior (float): Drawn virtual games added between every two models
+
+    Returns:
+        np.ndarray: Ratings of shape (samples, number of models)
+    """
+    n = len(table.models)
+    wins, games, counts = _outcome_cells(table)
+    total = counts.sum()
+    if total == 0:
+        return np.full((samples, n), BASE_RATING)
+    draws = np.random.default_rng(seed).multinomial(total, counts / total, size=samples)
+    return _fit((draws @ wins).reshape(samples, n, n),
+                (draws @ games).reshape(samples, n, n), prior)
+
+
+def model_stats(table: GameTable):
+    """
+    Games, points, legality and game length of every model.
+
+    Args:
+        table (GameTable): The games
+
+    Returns:
+        dict: Arrays indexed like table.models
+    """
+    n = len(table.models)
+    finished = table.finished()
+    score = np.nan_to_num(table.score)
+
+    def per_model(white_values, black_values):
+        return (np.bincount(table.white, weights=white_values, minlength=n)
+                + np.bincount(table.black, weights=black_values, minlength=n))
+
+    games = per_model(np.ones(len(table)), np.ones(len(table)))
+    answers = per_model(table.answers[:, 0], table.answers[:, 1])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return {
+            "games": games,
+            "finished": per_model(finished, finished),
+            "points": per_model(score * finished, (1 - score) * finished),
+            "legal_rate": per_model(table.legal[:, 0], table.legal[:, 1]) / answers,
+            "average_plies": per_model(table.plies, table.plies) / games,
+        }
+
+
+def rate(table: GameTable, samples: int = BOOTSTRAP_SAMPLES, seed: int = None,
+         confidence: float = CONFIDENCE, prior: float = PRIOR_GAMES):
+    """
+    Ratings with confidence intervals and statistics of every model.
+
+    Args:
+        table (GameTable): The games
+        samples (int): Number of bootstrap samples, 0 to skip the intervals
+        seed (int): Seed of the bootstrap
+        confidence (float): Coverage of the confidence intervals
+        prior (float): Drawn virtual games added between every two models
+
+    Returns:
+        list: One dict per model, best rated first
+    """
+    ratings = fit_ratings(table, prior)
+    low = high = np.full(len(table.models), np.nan)
+    if samples:
+        tail = (1 - confidence) / 2 * 100
+        low, high = np.percentile(bootstrap_ratings(table, samples, seed, prior),
+                                  [tail, 100 - tail], axis=0)
+    stats = model_stats(table)
+
+    rows = []
+    for index in np.argsort(-ratings):
+        finished = stats["finished"][index]
+        rows.append({
+            "model": table.models[index],
+            "rating": float(ratings[index]),
+            "low": float(low[index]),
+            "high": float(high[index]),
+            "games": int(stats["games"][index]),
+            "score": float(stats["points"][index] / finished) if finished else None,
+            "legal_rate": float(np.nan_to_num(stats["legal_rate"][index])),
+            "average_plies": float(stats["average_plies"][index]),
+        })
+    return rows
+
+
+def ratings_table(rows, games: int = None):
+    """Rich table of the rows returned by rate"""
+    table = Table(title="Model ratings" + (f" over {games} games" if games is not None else ""))
+    table.add_column("Model", style="cyan")
+    table.add_column("Rating", justify="right", style="bold")
+    table.add_column("Interval", justify="right")
+    table.add_column("Games", justify="right")
+    table.add_column("Score", justify="right")
+    table.add_column("Legal", justify="right")
+    table.add_column("Avg plies", justify="right")
+    for row in rows:
+        interval = ("-" if np.isnan(row["low"])
+                    else f"{row['low']:.0f} to {row['high']:.0f}")
+        table.add_row(
+            row["model"], f"{row['rating']:.0f}", interval, str(row["games"]),
+            "-" if row["score"] is None else f"{row['score']:.1%}",
+            f"{row['legal_rate']:.1%}", f"{row['average_plies']:.1f}")
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Rate the models over benchmark game records")
+    parser.add_argument("paths", nargs="+",
+                        help="Game records (.jsonl), directories or glob patterns")
+    parser.add_argument("--samples", type=int, default=BOOTSTRAP_SAMPLES,
+                        help="Bootstrap samples for the confidence intervals, 0 to skip them")
+    parser.add_argument("--confidence", type=float, default=CONFIDENCE,
+                        help="Coverage of the confidence intervals")
+    parser.add_argument("--prior", type=float, default=PRIOR_GAMES,
+                        help="Drawn virtual games added between every two models")
+    parser.add_argument("--seed", type=int,
+                        help="Seed of the bootstrap")
+    parser.add_argument("--json", metavar="PATH",
+                        help="Also write the ratings to this JSON file")
+    args = parser.parse_args()
+
+    table = load_games(args.paths)
+    if not len(table):
+        console.print("[bold red]No game records found[/bold red]")
+        return
+    rows = rate(table, args.samples, args.seed, args.confidence, args.prior)
+    console.print(ratings_table(rows, len(table)))
+    unfinished = int((~table.finished()).sum())
+    if unfinished:
+        console.print(f"[dim]{unfinished} unfinished games count for legality and length only[/dim]")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as json_file:
+            json.dump(rows, json_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+"""
+Unattended entry point driven by a TOML config file.
+Runs benchmark tournaments and analyses of finished games without a
+terminal or any prompts, so batch jobs can run on servers and from cron.
+API keys are never read from the config, only from the environment
+variables named in the provider registry or in the [keys] section.
+
+Usage: python runner.py config.toml [--task benchmark|analysis]
+See benchmark.example.toml for every setting.
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    import tomli as tomllib
+
+from rich.console import Console
+from rich.markup import escape
+from rich.table import Table
+
+import cassette
+import chess_move_validator
+import client_registry
+import hedging
+import local_provider
+import move_cache
+import opening_book
+import position_index
+import prompt_strategies
+import provider_registry
+import providers
+import ratings
+import scheduler
+import tournament
+
+console = Console()
+
+# Settings accepted in every section, anything else is reported as a typo
+SETTINGS = {
+    "benchmark": {"models", "pairs", "games", "workers", "log_dir", "max_rounds", "max_retries",
+                  "prompt_strategy", "stream", "cache", "cache_path", "resume",
+                  "checkpoint_every"},
+    "opening": {"book", "book_plies", "model_book_plies", "seed_moves", "seed"},
+    "clients": {"max_connections", "max_keepalive_connections", "keepalive", "timeout"},
+    "rate_limits": set(provider_registry.PROVIDER_SDKS),
+    "local": {"illegal_rate", "garbled_rate", "latency_mean", "latency_sigma", "script", "seed"},
+    "keys": set(provider_registry.MODELS),
+    "analysis": {"files", "report", "ratings", "bootstrap_samples", "seed", "index"},
+    "engine": {"path", "depth", "time", "processes", "threads", "hash_mb", "cache_path"},
+    "cassette": {"path", "mode"},
+    "hedging": {"mode", "quantile", "delay", "min_samples", "samples", "vote"},
+}
+
+
+def load_config(path: str):
+    """
+    Reads and checks a config file.
+
+    Args:
+        path (str): Path of the TOML file
+
+    Returns:
+        dict: The settings, one dict per section
+
+    Raises:
+        ValueError: If the file contains an unknown section or setting
+    """
+    with open(path, "rb") as config_file:
+        config = tomllib.load(config_file)
+    check_config(config)
+    return config
+
+
+def check_config(config: dict):
+    """Raise ValueError for unknown sections and settings"""
+    for section, settings in config.items():
+        if section not in SETTINGS:
+            raise ValueError(f"Unknown section [{section}], expected one of: "
+                             f"{', '.join(SETTINGS)}")
+        unknown = sorted(set(settings) - SETTINGS[section])
+        if unknown:
+            raise ValueError(f"Unknown setting in [{section}]: {', '.join(unknown)}")
+
+
+def apply_settings(config: dict):
+    """Configure clients, rate limits, streaming, local models, cache, cassette and hedging"""
+    clients = config.get("clients", {})
+    client_registry.configure_clients(
+        max_connections=clients.get("max_connections"),
+        max_keepalive_connections=clients.get("max_keepalive_connections"),
+        keepalive_expiry=clients.get("keepalive"),
+        timeout=clients.get("timeout"))
+
+    for provider, limits in config.get("rate_limits", {}).items():
+        scheduler.configure_limits(provider, limits.get("requests_per_minute"),
+                                   limits.get("tokens_per_minute"))
+
+    if config.get("local"):
+        local_provider.configure_local_provider(**config["local"])
+
+    benchmark = config.get("benchmark", {})
+    providers.configure_streaming(benchmark.get("stream", False))
+    if benchmark.get("cache", True):
+        move_cache.set_cache(move_cache.MoveCache(
+            benchmark.get("cache_path", move_cache.DEFAULT_CACHE_PATH)))
+
+    if config.get("hedging"):
+        hedging.configure_hedging(**config["hedging"])
+
+    recording = config.get("cassette")
+    if recording:
+        cassette.configure_cassette(recording.get("path"), recording.get("mode", "record"))
+
+
+def opening_settings(config: dict):
+    """OpeningSettings from the [opening] section, or None if the book is not used"""
+    opening = config.get("opening")
+    if not opening:
+        return None
+    return opening_book.OpeningSettings(
+        book_plies=opening.get("book_plies", 0),
+        model_book_plies=opening.get("model_book_plies", {}),
+        seed_moves=opening.get("seed_moves", 0),
+        book_path=opening.get("book"),
+        seed=opening.get("seed"))
+
+
+def api_keys(models, key_env: dict = None):
+    """
+    Reads the API key of every model from the environment.
+
+    Args:
+        models (iterable): Model names
+        key_env (dict): Environment variable per model overriding the registry
+
+    Returns:
+        dict: API key per model
+
+    Raises:
+        ValueError: If a key is missing
+    """
+    key_env = key_env or {}
+    keys, missing = {}, []
+    recorder = cassette.get_cassette()
+    for model in models:
+        if provider_registry.is_local(model):
+            keys[model] = "local"
+            continue
+        if recorder is not None and recorder.replaying:
+            # Replayed answers come from the cassette, the key is never sent
+            keys[model] = "replay"
+            continue
+        env_name = key_env.get(model) or provider_registry.get_model(model).key_env
+        if env_name and os.environ.get(env_name):
+            keys[model] = os.environ[env_name]
+        else:
+            missing.append(f"{model} (set {env_name})")
+    if missing:
+        raise ValueError(f"No API key for: {', '.join(missing)}")
+    return keys
+
+
+def run_benchmark(config: dict):
+    """
+    Plays the tournament described by the [benchmark] and [opening] sections.
+
+    Args:
+        config (dict): Settings as returned by load_config
+
+    Returns:
+        list: One summary dict per game
+
+    Raises:
+        ValueError: If no pairing is given, a model is unknown or an API key is missing
+    """
+    benchmark = config.get("benchmark", {})
+    pairings = [tuple(pair) for pair in benchmark.get("pairs", [])]
+    pairings += tournament.round_robin(benchmark.get("models", []))
+    if not pairings:
+        raise ValueError("Give models or pairs in the [benchmark] section")
+
+    models = {model for pairing in pairings for model in pairing}
+    unknown = sorted(models - set(provider_registry.MODELS))
+    if unknown:
+        raise ValueError(f"Unknown models: {', '.join(unknown)}, "
+                         f"choose from: {', '.join(provider_registry.MODELS)}")
+
+    strategy = benchmark.get("prompt_strategy", prompt_strategies.DEFAULT_STRATEGY)
+    if strategy not in prompt_strategies.PROMPT_STRATEGIES:
+        raise ValueError(f"Unknown prompt strategy: {strategy}")
+
+    results = tournament.run_tournament(
+        pairings, benchmark.get("games", 1), api_keys(models, config.get("keys")),
+        max_workers=benchmark.get("workers", 8),
+        log_dir=benchmark.get("log_dir", "tournament"),
+        max_rounds=benchmark.get("max_rounds"),
+        use_cache=benchmark.get("cache", True),
+        max_retries=benchmark.get("max_retries", 2),
+        prompt_strategy=strategy,
+        opening=opening_settings(config),
+        resume=benchmark.get("resume", False),
+        checkpoint_every=benchmark.get("checkpoint_every", 1))
+    tournament.print_tournament_summary(results)
+    if provider_registry.import_times():
+        console.print("[dim]SDK import times: " + ", ".join(
+            f"{module} {seconds:.2f}s"
+            for module, seconds in provider_registry.import_times().items()) + "[/dim]")
+    return results
+
+
+def run_analysis(config: dict):
+    """
+    Validates the finished games matched by the [analysis] section and rates the models.
+
+    Args:
+        config (dict): Settings as returned by load_config
+
+    Returns:
+        dict: "games" with one summary dict per game record, "ratings" with
+            one dict per model, empty if ratings are turned off, and "move_quality"
+            with the engine analysis per model if the config has an [engine] section
+    """
+    analysis = config.get("analysis", {})
+    patterns = analysis.get("files", ["benchmark_*.jsonl"])
+    files = sorted({path for pattern in patterns for path in glob.glob(pattern)})
+
+    index = position_index.PositionIndex(analysis["index"]) if analysis.get("index") else None
+    summaries = []
+    for path in files:
+        validation = chess_move_validator.validate_chess_moves(path, index)
+        if not validation:
+            continue
+        results, player1_name, player2_name = validation
+        summary = {"file": path, "player1": player1_name, "player2": player2_name}
+        for number in (1, 2):
+            moves = [result for result in results if str(result[1]) == str(number)]
+            summary[f"player{number}_moves"] = len(moves)
+            summary[f"player{number}_legal"] = sum(1 for result in moves if result[3])
+        summaries.append(summary)
+
+    table = Table(title=f"Analysis of {len(summaries)} games")
+    table.add_column("Game", style="cyan")
+    table.add_column("Player 1", style="green")
+    table.add_column("Legal", justify="right")
+    table.add_column("Player 2", style="green")
+    table.add_column("Legal", justify="right")
+    for summary in summaries:
+        table.add_row(
+            os.path.basename(summary["file"]),
+            summary["player1"], f"{summary['player1_legal']}/{summary['player1_moves']}",
+            summary["player2"], f"{summary['player2_legal']}/{summary['player2_moves']}")
+    console.print(table)
+
+    report = {"games": summaries, "ratings": []}
+    if analysis.get("ratings", True) and files:
+        games = ratings.load_games(files)
+        if len(games):
+            report["ratings"] = ratings.rate(
+                games, analysis.get("bootstrap_samples", ratings.BOOTSTRAP_SAMPLES),
+                analysis.get("seed"))
+            console.print(ratings.ratings_table(report["ratings"], len(games)))
+
+    if "engine" in config and files:
+        # Imported here as only this task needs chess.engine
+        import engine_analysis
+
+        evaluations, evaluated, reused = engine_analysis.analyze_games(
+            files, engine_analysis.EngineSettings(**config["engine"]), index)
+        report["move_quality"] = engine_analysis.summarize(evaluations)
+        console.print(engine_analysis.quality_table(report["move_quality"]))
+        console.print(f"[dim]{evaluated} positions evaluated, "
+                      f"{reused} taken from the index or the cache[/dim]")
+
+    if index is not None:
+        index.close()
+
+    if analysis.get("report"):
+        with open(analysis["report"], "w", encoding="utf-8") as report_file:
+            json.dump(report, report_file, indent=2)
+        console.print(f"[dim]Analysis report written to {analysis['report']}[/dim]")
+    return report
+
+
+def run(config: dict, task: str = None):
+    """
+    Runs the tasks of a config.
+
+    Args:
+        config (dict): Settings as returned by load_config
+        task (str): "benchmark" or "analysis", by default every task with a section in the config
+    """
+    apply_settings(config)
+    if task in (None, "benchmark") and (task or "benchmark" in config):
+        run_benchmark(config)
+    if task in (None, "analysis") and (task or "analysis" in config):
+        run_analysis(config)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run benchmarks or analyses unattended from a TOML config file")
+    parser.add_argument("config", help="TOML config file, see benchmark.example.toml")
+    parser.add_argument("--task", choices=["benchmark", "analysis"],
+                        help="Run only this task instead of every task in the config")
+    args = parser.parse_args()
+
+    try:
+        run(load_config(args.config), args.task)
+    except (OSError, ValueError, tomllib.TOMLDecodeError) as e:
+        console.print(f"[bold red]Error: {escape(str(e))}[/bold red]")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""
+Rate limit aware scheduler for provider calls.
+Every call to a remote provider goes through submit(): it waits for room in
+the request and token budgets of its provider and API key, and retries the
+call when the provider is rate limiting or temporarily failing. Rate limit
+answers pause every call sharing the key for as long as the provider asks,
+other errors back off with jitter. Bad requests are not retried.
+"""
+
+import asyncio
+import email.utils
+import random
+import sys
+import threading
+import time
+
+import metrics
+
+# Default budgets per provider, per API key. Lower them to stay below the
+# limits of an account, raise them for higher usage tiers.
+DEFAULT_LIMITS = {
+    "openai": {"requests_per_minute": 500, "tokens_per_minute": 30000},
+    "anthropic": {"requests_per_minute": 50, "tokens_per_minute": 20000},
+    "gemini": {"requests_per_minute": 1000, "tokens_per_minute": 1000000},
+    "deepseek": {"requests_per_minute": 500, "tokens_per_minute": 100000},
+}
+
+# How many seconds of budget may be spent in a single burst
+BURST_SECONDS = 10
+
+# Attempts per call and the backoff between them
+MAX_ATTEMPTS = 8
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 60.0
+
+_buckets = {}
+_lock = threading.Lock()
+
+
+class TokenBucket:
+    """
+    Budget refilled at a constant rate. Callers reserve what they need up front
+    and wait until the budget covers it, so waiting callers are served in order.
+    """
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60
+        self.capacity = max(self.rate * BURST_SECONDS, 1)
+        self.level = self.capacity
+        self.paused_until = 0.0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount: float):
+        """Takes amount from the budget and returns the seconds to wait before using it"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.level -= min(amount, self.capacity)
+            wait = -self.level / self.rate if self.level < 0 else 0.0
+            return max(wait, self.paused_until - now)
+
+    def adjust(self, amount: float):
+        """Takes a correction from the budget, negative amounts give budget back"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.level = min(self.capacity, self.level - amount)
+
+    def pause(self, seconds: float):
+        """Lets no reservation through for the given number of seconds"""
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+def configure_limits(provider: str, requests_per_minute: float = None,
+                     tokens_per_minute: float = None):
+    """
+    Changes the budgets of a provider, for buckets created afterwards.
+
+    Args:
+        provider (str): Provider name, one of "openai", "deepseek", "anthropic" or "gemini"
+        requests_per_minute (float): Requests per minute and API key
+        tokens_per_minute (float): Input plus output tokens per minute and API key
+    """
+    limits = DEFAULT_LIMITS.setdefault(provider, {})
+    if requests_per_minute is not None:
+        limits["requests_per_minute"] = requests_per_minute
+    if tokens_per_minute is not None:
+        limits["tokens_per_minute"] = tokens_per_minute
+    with _lock:
+        for key in [key for key in _buckets if key[0] == provider]:
+            del _buckets[key]
+
+
+def _buckets_for(provider: str, api_key: str):
+    """Request and token bucket of a provider and API key, None where there is no limit"""
+    with _lock:
+        buckets = _buckets.get((provider, api_key))
+        if buckets is None:
+            limits = DEFAULT_LIMITS.get(provider, {})
+            buckets = tuple(
+                TokenBucket(limits[name]) if limits.get(name) else None
+                for name in ("requests_per_minute", "tokens_per_minute"))
+            _buckets[(provider, api_key)] = buckets
+    return buckets
+
+
+def estimate_tokens(prompt_text: str, max_output_tokens: int):
+    """Rough token count of a call, about four characters per prompt token"""
+    return len(prompt_text) // 4 + max_output_tokens
+
+
+def status_code(error: Exception):
+    """HTTP status of a failed provider call, or None if no answer was received"""
+    for name in ("status_code", "code"):
+        status = getattr(error, name, None)
+        if isinstance(status, int):
+            return status
+    return None
+
+
+def retry_after(error: Exception):
+    """Seconds the provider asked to wait before retrying, or None"""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(error: Exception):
+    """True for rate limits, server errors and failed connections, False for bad requests"""
+    if getattr(error, "code", None) == "insufficient_quota":
+        # Reported as a rate limit, but waiting does not help
+        return False
+    status = status_code(error)
+    if status is not None:
+        return status in (408, 409, 429) or status >= 500
+    # httpx is only loaded along with a provider SDK
+    httpx = sys.modules.get("httpx")
+    if httpx is not None and isinstance(error, httpx.TransportError):
+        return True
+    return (isinstance(error, (asyncio.TimeoutError, ConnectionError))
+            or type(error).__name__ in ("APIConnectionError", "APITimeoutError"))
+
+
+def backoff(attempt: int):
+    """Full jitter exponential backoff for the given attempt, counting from 0"""
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+
+async def submit(provider: str, api_key: str, call, estimated_tokens: int = 0):
+    """
+    Runs a provider call within the budgets of its provider and API key.
+
+    Args:
+        provider (str): Provider name, used to look up the budgets
+        api_key (str): API key the call is made with, every key has its own budgets
+        call: Coroutine function without arguments making the call, called once per attempt
+        estimated_tokens (int): Expected input plus output tokens of the call
+
+    Returns:
+        The result of the call
+
+    Raises:
+        Exception: The error of the last attempt, right away if it is not worth retrying
+    """
+    requests, tokens = _buckets_for(provider, api_key)
+
+    for attempt in range(MAX_ATTEMPTS):
+        wait = 0.0
+        if requests is not None:
+            wait = max(wait, requests.reserve(1))
+        if tokens is not None:
+            wait = max(wait, tokens.reserve(estimated_tokens))
+        if wait:
+            await asyncio.sleep(wait)
+
+        try:
+            result = await call()
+        except Exception as e:
+            if not is_retryable(e) or attempt == MAX_ATTEMPTS - 1:
+                raise
+            delay = retry_after(e)
+            if delay is None:
+                delay = backoff(attempt)
+            buckets = [bucket for bucket in (requests, tokens) if bucket is not None]
+            if status_code(e) == 429 and buckets:
+                # The whole key is over its limit, not just this call. The next
+                # reservation waits for the pause to end.
+                for bucket in buckets:
+                    bucket.pause(delay)
+            else:
+                await asyncio.sleep(delay)
+            continue
+
+        # Correct the estimate once the provider reported the real usage
+        call_metrics = metrics.current_call()
+        if tokens is not None and call_metrics is not None and call_metrics.tokens():
+            used = (call_metrics.input_tokens or 0) + (call_metrics.output_tokens or 0)
+            tokens.adjust(used - estimated_tokens)
+        return result
@@ -0,0 +1,220 @@
+"""
+Speculative model requests in games against a human.
+While the human thinks about a move, the most likely replies are predicted,
+from the opening book, from the answers stored in a position index and from
+recaptures and captures on the board. For each prediction the model is
+asked right away, with the prompt it would get after that move. If the
+human plays one of the predicted moves the answer is already on its way or
+done, and the others are cancelled. The number of speculative calls and the
+tokens they send are capped per game. Every game reports how many moves
+were predicted, what the speculation cost and how much waiting it saved.
+
+Speculation is off by default. configure_speculation turns it on, or
+CHESS_SPECULATE=1 in the environment.
+"""
+
+import asyncio
+import os
+import time
+from dataclasses import dataclass
+
+import chess
+
+import opening_book
+import providers
+import scheduler
+from game_state import GameState
+
+# Piece values used to rank captures when nothing better is known
+PIECE_VALUES = {chess.PAWN: 1, chess.KNIGHT: 3, chess.BISHOP: 3, chess.ROOK: 5,
+                chess.QUEEN: 9, chess.KING: 0}
+
+
+@dataclass
+class SpeculationSettings:
+    """When and how much to speculate"""
+    enabled: bool = False
+    # Predicted human moves asked about on every turn
+    replies: int = 2
+    # Caps of the speculative calls of one game and the tokens they may send
+    max_calls: int = 40
+    max_tokens: int = 100000
+    # Polyglot .bin file, the bundled table is used if None
+    book_path: str = None
+    # Position index whose stored answers count as move statistics, none if None
+    index_path: str = None
+
+
+config = SpeculationSettings(enabled=os.environ.get("CHESS_SPECULATE") == "1")
+
+
+def configure_speculation(**settings):
+    """
+    Changes how games against a human speculate.
+
+    Args:
+        **settings: Any field of SpeculationSettings, e.g. enabled=True or max_calls=20
+    """
+    global config
+    config = SpeculationSettings(**{**config.__dict__, **settings})
+
+
+def predict_replies(board: chess.Board, limit: int, book=None, index=None):
+    """
+    The moves most likely to be played in a position, best first.
+
+    Args:
+        board (chess.Board): Position of the side to move
+        limit (int): Number of moves wanted
+        book (OpeningBook): Book whose weights rank the moves
+        index (PositionIndex): Index whose stored answers rank the moves
+
+    Returns:
+        list: Up to limit legal chess.Move, fewer if nothing hints at more
+    """
+    scores = {}
+    if book is not None:
+        moves = book.moves(board)
+        total = sum(weight or 1 for _, weight in moves)
+        for move, weight in moves:
+            if board.is_legal(move):
+                scores[move] = scores.get(move, 0) + 2 * (weight or 1) / total
+    if index is not None:
+        known = index.position(board)
+        if known is not None:
+            answers = {}
+            for model_answers in known["answers"].values():
+                for answer, count in model_answers.items():
+                    try:
+                        move = board.parse_san(answer)
+                    except ValueError:
+                        continue
+                    answers[move] = answers.get(move, 0) + count
+            total = sum(answers.values())
+            for move, count in answers.items():
+                scores[move] = scores.get(move, 0) + count / total
+
+    if len(scores) < limit:
+        # Recaptures on the square just taken on first, then captures by value
+        last_move = board.move_stack[-1] if board.move_stack else None
+        for move in board.legal_moves:
+            victim = board.piece_at(move.to_square)
+            if victim is None or move in scores:
+                continue
+            attacker = board.piece_at(move.from_square)
+            score = (PIECE_VALUES[victim.piece_type]
+                     - PIECE_VALUES[attacker.piece_type] / 10) / 100
+            if last_move is not None and move.to_square == last_move.to_square:
+                score += 0.5
+            scores[move] = score
+
+    return sorted(scores, key=scores.get, reverse=True)[:limit]
+
+
+class Speculator:
+    """Speculative requests of one game between a human and a model"""
+
+    def __init__(self, state: GameState, human, computer, settings: SpeculationSettings = None):
+        self.state = state
+        self.human = human
+        self.computer = computer
+        self.settings = settings or config
+        self.book = opening_book.get_book(self.settings.book_path)
+        self.index = None
+        if self.settings.index_path and os.path.exists(self.settings.index_path):
+            from position_index import PositionIndex
+            self.index = PositionIndex(self.settings.index_path)
+        self.turns = 0
+        self.hits = 0
+        self.calls = 0
+        self.wasted = 0
+        self.tokens = 0
+        self.saved = 0.0
+        # Request of this turn per predicted move: its future and when it started and finished
+        self._pending = {}
+
+    def predict(self):
+        """Asks the model about the predicted human moves, called when the human is to move"""
+        self.cancel()
+        self.turns += 1
+        board = self.state.board
+        from chess_game import build_move_prompt
+        for move in predict_replies(board, self.settings.replies, self.book, self.index):
+            san = board.san(move)
+            position = GameState(self.state.players)
+            position.restore(self.state.snapshot())
+            position.play(self.human, san)
+            position.log(f"Your move: {san}")
+            prompt_text = build_move_prompt(san, self.computer.prompt, position)
+            tokens = scheduler.estimate_tokens(prompt_text, providers.MAX_OUTPUT_TOKENS)
+            if (self.calls >= self.settings.max_calls
+                    or self.tokens + tokens > self.settings.max_tokens):
+                break
+            self.calls += 1
+            self.tokens += tokens
+            request = {"started": time.perf_counter(), "finished": None}
+            request["future"] = providers.run_background(providers.request_move(
+                self.computer.model, prompt_text, self.computer.api_key, position.board))
+            request["future"].add_done_callback(
+                lambda _, request=request: request.__setitem__("finished", time.perf_counter()))
+            self._pending[move] = request
+
+    def claim(self, move: chess.Move):
+        """
+        Takes the speculative request of the move the human played and cancels the others.
+
+        Returns:
+            dict: The request, None if the move was not predicted
+        """
+        request = self._pending.pop(move, None)
+        self.cancel()
+        if request is not None:
+            self.hits += 1
+            request["claimed"] = time.perf_counter()
+        return request
+
+    async def answer(self, request):
+        """
+        The model's answer of a claimed request.
+
+        Returns:
+            str: Raw text answer, None if the speculative call failed
+        """
+        try:
+            response = await asyncio.wrap_future(request["future"])
+        except Exception:
+            return None
+        # Only the part of the call that ran while the human was thinking was saved
+        overlap_end = min(request["finished"] or request["claimed"], request["claimed"])
+        self.saved += overlap_end - request["started"]
+        return response
+
+    def cancel(self):
+        """Cancels the requests no longer needed"""
+        for request in self._pending.values():
+            request["future"].cancel()
+            self.wasted += 1
+        self._pending = {}
+
+    def close(self):
+        self.cancel()
+        if self.index is not None:
+            self.index.close()
+
+    def summary(self):
+        """
+        What speculation did in the game.
+
+        Returns:
+            dict: human turns, hits, hit_rate, calls, wasted calls, estimated tokens and
+                seconds saved
+        """
+        return {
+            "turns": self.turns,
+            "hits": self.hits,
+            "hit_rate": self.hits / self.turns if self.turns else 0.0,
+            "calls": self.calls,
+            "wasted": self.wasted,
+            "tokens": self.tokens,
+            "saved": self.saved,
+        }
@@ -0,0 +1,132 @@
+"""
+Terminal renderer shared by the menus and the game view.
+Everything is drawn on one Console. A new page is started with an escape
+code rather than by running the clear command. The parts that change while
+keys are pressed, like the selection of a menu, are redrawn in place with
+rich.live.Live, so the rest of the screen is left alone. The ASCII title is
+rendered once per terminal width and replayed from then on. The time from
+every keystroke to its finished redraw is recorded.
+"""
+
+import threading
+import time
+
+from rich.console import Console
+from rich.live import Live
+from rich.panel import Panel
+from rich.segment import Segment
+
+from metrics import percentile
+
+
+class CachedRenderable:
+    """Renderable drawn once per width, later draws replay its segments"""
+
+    def __init__(self, renderable):
+        self.renderable = renderable
+        self._width = None
+        self._lines = None
+
+    def __rich_console__(self, console, options):
+        if self._width != options.max_width:
+            self._lines = console.render_lines(self.renderable, options, pad=False)
+            self._width = options.max_width
+        for line in self._lines:
+            yield from line
+            yield Segment.line()
+
+
+class Screen:
+    """One terminal screen: a page with the title and a region redrawn in place"""
+
+    def __init__(self, console: Console = None):
+        self.console = console or Console()
+        # Seconds from a keystroke to the end of its redraw
+        self.latencies = []
+        self._titles = {}
+        self._live = None
+
+    def title(self, title_content: str):
+        """The title panel, rendered once"""
+        title = self._titles.get(title_content)
+        if title is None:
+            title = self._titles[title_content] = CachedRenderable(
+                Panel(title_content, border_style="green", expand=False))
+        return title
+
+    def page(self, title_content: str, additional_content=None):
+        """
+        Starts a new page showing the title.
+
+        Args:
+            title_content (str): ASCII art title
+            additional_content: Optional renderable shown below the title
+        """
+        self.stop()
+        self.console.clear()
+        self.console.print(self.title(title_content))
+        if additional_content:
+            self.console.print(additional_content)
+
+    def live(self, renderable):
+        """Shows a renderable below the page that update then redraws in place"""
+        self.stop()
+        self._live = Live(renderable, console=self.console, auto_refresh=False)
+        self._live.start(refresh=True)
+
+    def update(self, renderable, since: float = None):
+        """
+        Redraws the live region.
+
+        Args:
+            renderable: New content of the region
+            since (float): time.time() of the keystroke causing the redraw, if any
+        """
+        if self._live is None:
+            self.live(renderable)
+        else:
+            self._live.update(renderable, refresh=True)
+        if since is not None:
+            self.latencies.append(time.time() - since)
+
+    def stop(self):
+        """Leaves the live region on screen as it is and goes back to plain output"""
+        if self._live is not None:
+            self._live.stop()
+            self._live = None
+
+    def latency_summary(self):
+        """
+        Keystroke to redraw latency.
+
+        Returns:
+            dict: keystrokes, p50, p95 and max in seconds, None if no key was pressed
+        """
+        if not self.latencies:
+            return None
+        return {
+            "keystrokes": len(self.latencies),
+            "p50": percentile(self.latencies, 50),
+            "p95": percentile(self.latencies, 95),
+            "max": max(self.latencies),
+        }
+
+
+_screen = None
+_screen_lock = threading.Lock()
+
+
+def get_screen():
+    """Get the process wide screen, creating it on first use"""
+    global _screen
+    with _screen_lock:
+        if _screen is None:
+            _screen = Screen()
+    return _screen
+
+
+def set_screen(screen: Screen):
+    """Replace the process wide screen, e.g. to draw on another console"""
+    global _screen
+    with _screen_lock:
+        _screen = screen
@@ -0,0 +1,21 @@
+import pytest
+
+from game_state import GameState, Player
+
+
+def new_state():
+    return GameState([Player(1, "White", "white"), Player(2, "Black", "black")])
+
+
+@pytest.mark.parametrize("move", ["--", "0000", "Z0"])
+def test_parse_rejects_null_move(move):
+    state = new_state()
+    assert state.parse(move) is None
+    assert state.play(state.player(1), move) is None
+    assert not state.in_sync
+    assert state.board.move_stack == []
+
+
+@pytest.mark.parametrize("move", ["e4", "e2e4", "e4!"])
+def test_parse_accepts_san_and_uci(move):
+    assert new_state().parse(move) == new_state().board.parse_san("e4")
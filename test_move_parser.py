@@ -0,0 +1,42 @@
+import pytest
+
+from move_parser import MoveParser, extract_move
+
+
+@pytest.mark.parametrize("response, move", [
+    ("e4", "e4"),
+    ("  Nf3\n", "Nf3"),
+    ("O-O", "O-O"),
+    ("e2e4", "e2e4"),
+    ("exd5+", "exd5+"),
+])
+def test_extract_move_plain(response, move):
+    assert extract_move(response) == move
+
+
+@pytest.mark.parametrize("response, move", [
+    ("I will play Nf3.", "Nf3"),
+    ("My move is: e4", "e4"),
+    ("Sure! Qxd7# wins", "Qxd7#"),
+    ("The game is over, checkmate", "checkmate"),
+])
+def test_extract_move_after_prose(response, move):
+    assert extract_move(response) == move
+
+
+@pytest.mark.parametrize("response, move", [(None, None), ("", ""), ("  \n", "")])
+def test_extract_move_empty(response, move):
+    assert extract_move(response) == move
+
+
+def test_extract_move_without_move_keeps_first_word():
+    # Illegal answers are still recorded as given
+    assert extract_move("Hello there") == "Hello"
+
+
+def test_streamed_answer_matches_complete_answer():
+    parser = MoveParser()
+    assert parser.feed("I play e") is None
+    assert parser.feed("2") is None
+    assert parser.feed("e4 now") == "e2e4"
+    assert extract_move("I play e2e4 now") == "e2e4"
@@ -0,0 +1,371 @@
+"""
+Headless tournament runner for AI vs AI benchmark games.
+Plays many benchmark games at once on a single event loop, with a bound
+on the number of games in flight, and writes every game to its own log
+file inside the tournament directory.
+"""
+
+import argparse
+import asyncio
+import dataclasses
+import itertools
+import os
+import time
+
+from rich.console import Console
+from rich.table import Table
+
+import checkpoint
+import chess_game
+import chess_move_validator
+import client_registry
+import game_record
+import hedging
+import metrics
+import move_cache
+import opening_book
+import prompt_strategies
+import provider_registry
+
+console = Console()
+
+
+class SilentConsole(Console):
+    """Console for headless games, drops output without rendering it"""
+
+    def print(self, *objects, **kwargs):
+        pass
+
+
+def round_robin(models):
+    """Build every pairing of the given models, each model playing every other once"""
+    return list(itertools.combinations(models, 2))
+
+
+def _finished_game(log_filename):
+    """Summary of a game played by an earlier run, rebuilt from its record"""
+    header, plies, result = game_record.read_record(log_filename)
+    players = {player["number"]: player for player in header["players"]}
+    metrics_file = game_record.metrics_path(log_filename)
+    return {
+        "log_file": log_filename,
+        "pgn_file": game_record.pgn_path(log_filename),
+        "metrics_file": metrics_file,
+        "calls": metrics.load_calls(metrics_file) if os.path.exists(metrics_file) else [],
+        "book_plies": game_record.book_plies(plies),
+        "player1": players[1]["model"],
+        "player2": players[2]["model"],
+        "player1_side": players[1]["side"],
+        "rounds": result.get("rounds", 0),
+        "result": result["result"],
+        "loser": result["loser"],
+        "resumed": False,
+        "checkpoint_file": None,
+        "skipped": True,
+    }
+
+
+async def _play_game(game_id, model1, model2, api_keys, log_dir, max_rounds, use_cache,
+                     max_retries, prompt_strategy, opening, resume=False, checkpoint_every=1):
+    """Play and validate a single tournament game, or reuse it if resume finds it finished"""
+    base_name = chess_game.benchmark_log_filename(model1, model2, game_id)
+    log_filename = os.path.join(log_dir, base_name)
+    if resume and checkpoint.is_finished(log_filename):
+        result = _finished_game(log_filename)
+        result["game_id"] = game_id
+        result["duration"] = 0.0
+    else:
+        result = await _play_new_game(game_id, model1, model2, api_keys, log_filename,
+                                      max_rounds, use_cache, max_retries, prompt_strategy,
+                                      opening, resume, checkpoint_every)
+
+    validation = chess_move_validator.validate_chess_moves(log_filename)
+    moves = validation[0] if validation else []
+    result["moves"] = len(moves)
+    result["legal_moves"] = sum(1 for move in moves if move[3])
+    return result
+
+
+async def _play_new_game(game_id, model1, model2, api_keys, log_filename, max_rounds,
+                         use_cache, max_retries, prompt_strategy, opening, resume,
+                         checkpoint_every):
+    """Play a tournament game, continuing it from its checkpoint on resume"""
+    if opening is not None and opening.seed is not None:
+        # Every game gets its own, reproducible book choices
+        opening = dataclasses.replace(opening, seed=f"{opening.seed}:{game_id}")
+
+    started = time.perf_counter()
+    result = await chess_game.play_benchmark_game_async(
+        model1, api_keys[model1], model2, api_keys[model2],
+        log_filename=log_filename,
+        max_rounds=max_rounds, round_delay=0, console=SilentConsole(),
+        use_cache=use_cache, max_retries=max_retries, prompt_strategy=prompt_strategy,
+        opening=opening, resume=resume, checkpoint_every=checkpoint_every)
+    result["game_id"] = game_id
+    result["duration"] = time.perf_counter() - started
+    return result
+
+
+def run_tournament(pairings, games: int, api_keys: dict, max_workers: int = 8,
+                   log_dir: str = "tournament", max_rounds: int = None, use_cache: bool = True,
+                   max_retries: int = 2,
+                   prompt_strategy: str = prompt_strategies.DEFAULT_STRATEGY,
+                   opening: opening_book.OpeningSettings = None, resume: bool = False,
+                   checkpoint_every: int = 1):
+    """Blocking wrapper around run_tournament_async"""
+    return asyncio.run(run_tournament_async(
+        pairings, games, api_keys, max_workers, log_dir, max_rounds, use_cache, max_retries,
+        prompt_strategy, opening, resume, checkpoint_every))
+
+
+async def run_tournament_async(pairings, games: int, api_keys: dict, max_workers: int = 8,
+                               log_dir: str = "tournament", max_rounds: int = None,
+                               use_cache: bool = True, max_retries: int = 2,
+                               prompt_strategy: str = prompt_strategies.DEFAULT_STRATEGY,
+                               opening: opening_book.OpeningSettings = None,
+                               resume: bool = False, checkpoint_every: int = 1):
+    """
+    Runs a tournament of benchmark games, at most max_workers at a time.
+
+    Args:
+        pairings (list): List of (model1, model2) tuples to play
+        games (int): Number of games played for every pairing
+        api_keys (dict): API key for every model, keyed by model name
+        max_workers (int): Maximum number of games played at the same time
+        log_dir (str): Directory receiving one log file per game
+        max_rounds (int): Optional cap on the number of rounds per game
+        use_cache (bool): Reuse cached answers for known positions
+        max_retries (int): Extra tries after an illegal move before a model forfeits
+        prompt_strategy (str): Name of the prompt strategy used in every game
+        opening (OpeningSettings): Optional use of the opening book in every game
+        resume (bool): Keep the games an earlier run of the same tournament finished and go
+            on with the ones it left unfinished from their last checkpoint
+        checkpoint_every (int): Plies between syncs of every game's checkpoint to disk
+
+    The measurements of every provider call are written to metrics.json in log_dir.
+
+    Returns:
+        list: One summary dict per game, in the order the games finished
+    """
+    missing = {model for pairing in pairings for model in pairing} - set(api_keys)
+    if missing:
+        raise ValueError(f"No API key for: {', '.join(sorted(missing))}")
+
+    os.makedirs(log_dir, exist_ok=True)
+    # The hedging table of the summary covers this tournament only
+    hedging.stats.reset()
+    jobs = []
+    for pairing_index, (model1, model2) in enumerate(pairings):
+        for game_index in range(games):
+            jobs.append((f"{pairing_index:03d}_{game_index:04d}", model1, model2))
+
+    console.print(
+        f"[bold blue]Running {len(jobs)} games with {max_workers} workers...[/bold blue]")
+
+    results = []
+    slots = asyncio.Semaphore(max_workers)
+
+    async def run_job(game_id, model1, model2):
+        async with slots:
+            try:
+                result = await _play_game(
+                    game_id, model1, model2, api_keys, log_dir, max_rounds, use_cache,
+                    max_retries, prompt_strategy, opening, resume, checkpoint_every)
+            except Exception as e:
+                console.print(
+                    f"[bold red]Game {game_id} failed: {str(e)}[/bold red]")
+                return
+        results.append(result)
+        # A game stopped by a provider outage keeps its checkpoint and has no result yet
+        stopped = result["checkpoint_file"] is not None
+        console.print(
+            f"[dim]Game {game_id} {'stopped' if stopped else 'finished'} "
+            f"({len(results)}/{len(jobs)}): {model1} vs {model2} - {result['result']}"
+            f"{' (finished earlier)' if result.get('skipped') else ''}"
+            f"{', resume to continue' if stopped else ''}[/dim]")
+
+    # Tasks inherit the capture, so calls of failed games are measured too
+    with metrics.capture() as calls:
+        try:
+            await asyncio.gather(*(run_job(*job) for job in jobs))
+        finally:
+            await client_registry.close_clients()
+    # Calls made by an earlier run, for the games it finished or got part way through
+    measured = {id(call) for call in calls}
+    calls = calls + [call for result in results for call in result["calls"]
+                     if id(call) not in measured]
+    metrics.export_metrics(calls, os.path.join(log_dir, "metrics.json"),
+                           games=len(jobs),
+                           finished=sum(1 for result in results
+                                        if result["checkpoint_file"] is None),
+                           sdk_import_seconds=provider_registry.import_times())
+    return results
+
+
+def print_tournament_summary(results):
+    """Print a per-pairing summary of the tournament results"""
+    table = Table(title="Tournament Results")
+    table.add_column("Pairing", style="magenta")
+    table.add_column("Games", style="cyan")
+    table.add_column("Avg rounds", style="yellow")
+    table.add_column("Legal moves", style="green")
+    table.add_column("Avg duration", style="blue")
+
+    by_pairing = {}
+    for result in results:
+        by_pairing.setdefault(
+            (result["player1"], result["player2"]), []).append(result)
+
+    for (model1, model2), games in sorted(by_pairing.items()):
+        moves = sum(game["moves"] for game in games)
+        legal = sum(game["legal_moves"] for game in games)
+        table.add_row(
+            f"{model1} vs {model2}",
+            str(len(games)),
+            f"{sum(game['rounds'] for game in games) / len(games):.1f}",
+            f"{legal}/{moves} ({legal / moves * 100 if moves else 0:.1f}%)",
+            f"{sum(game['duration'] for game in games) / len(games):.1f}s")
+
+    console.print(table)
+
+    stopped = sum(1 for result in results if result["checkpoint_file"] is not None)
+    if stopped:
+        console.print(f"[yellow]{stopped} games stopped unfinished, run the tournament "
+                      f"again with --resume to continue them[/yellow]")
+
+    book_plies = sum(result["book_plies"] for result in results)
+    if book_plies:
+        console.print(f"[dim]{book_plies} plies were taken from the opening book "
+                      f"instead of asking a model[/dim]")
+
+    calls = [call for result in results for call in result["calls"]]
+    if calls:
+        console.print(metrics.metrics_table(calls))
+        console.print(metrics.prompt_size_table(calls))
+    hedged = hedging.hedging_table()
+    if hedged is not None:
+        console.print(hedged)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run a headless AI vs AI chess tournament")
+    parser.add_argument("--models", nargs="+",
+                        help="Models playing a round robin, e.g. \"gpt 4o\" \"claude sonnet 4\"")
+    parser.add_argument("--pair", nargs=2, action="append", metavar=("MODEL1", "MODEL2"),
+                        help="Explicit pairing, may be given several times")
+    parser.add_argument("--games", type=int, default=1,
+                        help="Games per pairing")
+    parser.add_argument("--workers", type=int, default=8,
+                        help="Maximum number of games played at once")
+    parser.add_argument("--log-dir", default="tournament",
+                        help="Directory for the game logs")
+    parser.add_argument("--max-rounds", type=int,
+                        help="Optional cap on the number of rounds per game")
+    parser.add_argument("--max-retries", type=int, default=2,
+                        help="Extra tries after an illegal move before a model forfeits")
+    parser.add_argument("--max-connections", type=int,
+                        help="Connection pool size of each provider client")
+    parser.add_argument("--keepalive", type=float,
+                        help="Seconds idle provider connections are kept open")
+    parser.add_argument("--rate-limit", nargs=3, action="append", default=[],
+                        metavar=("PROVIDER", "RPM", "TPM"),
+                        help="Requests and tokens per minute allowed per API key of a provider "
+                             "(openai, deepseek, anthropic or gemini), may be given several times")
+    parser.add_argument("--prompt-strategy", default=prompt_strategies.DEFAULT_STRATEGY,
+                        choices=sorted(prompt_strategies.PROMPT_STRATEGIES),
+                        help="How the position is described to the models")
+    parser.add_argument("--stream", action="store_true",
+                        help="Stream answers and stop reading once the move is complete")
+    parser.add_argument("--book", metavar="PATH",
+                        help="Polyglot opening book, the bundled book is used if omitted")
+    parser.add_argument("--book-plies", type=int, default=0,
+                        help="Plies every model takes from the opening book before it is asked")
+    parser.add_argument("--model-book-plies", nargs=2, action="append", default=[],
+                        metavar=("MODEL", "PLIES"),
+                        help="Book plies for one model, may be given several times")
+    parser.add_argument("--seed-moves", type=int, default=0,
+                        help="Full moves of a random book line played before every game")
+    parser.add_argument("--book-seed",
+                        help="Seed making the opening book choices reproducible")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Ask the models for fresh answers instead of using the move cache")
+    parser.add_argument("--cache-path", default=move_cache.DEFAULT_CACHE_PATH,
+                        help="SQLite file of the persistent move cache")
+    parser.add_argument("--local-illegal-rate", type=float, default=0.0,
+                        help="Share of illegal answers of the local stand-in models")
+    parser.add_argument("--local-garbled-rate", type=float, default=0.0,
+                        help="Share of garbled answers of the local stand-in models")
+    parser.add_argument("--local-latency", type=float, default=0.0,
+                        help="Mean simulated latency of the local stand-in models in seconds")
+    parser.add_argument("--local-script", nargs="+", default=[],
+                        help="SAN moves played by \"local scripted\", e.g. e4 e5 Nf3")
+    parser.add_argument("--resume", action="store_true",
+                        help="Skip the games already finished in the log directory and "
+                             "continue unfinished ones from their checkpoint")
+    parser.add_argument("--checkpoint-every", type=int, default=1, metavar="N",
+                        help="Sync the checkpoints to disk every N plies instead of after each, "
+                             "a crash of the machine may lose up to N plies of a game")
+    parser.add_argument("--hedge", action="store_true",
+                        help="Send a second request when a move takes longer than the model's p90")
+    parser.add_argument("--samples", type=int, default=1,
+                        help="Request this many answers per move at once, the first legal one wins")
+    parser.add_argument("--vote", action="store_true",
+                        help="With --samples, play the move most legal answers agree on")
+    parser.add_argument("--cassette", metavar="PATH",
+                        help="Record every prompt and answer to this cassette file")
+    parser.add_argument("--replay", action="store_true",
+                        help="Answer from the cassette instead of calling the providers")
+    parser.add_argument("--seed", type=int,
+                        help="Seed of the local stand-in models")
+    args = parser.parse_args()
+
+    # The flags are turned into a config so they take the same path as a config file
+    import runner
+
+    config = {
+        "benchmark": {
+            "models": args.models or [], "pairs": args.pair or [], "games": args.games,
+            "workers": args.workers, "log_dir": args.log_dir, "max_rounds": args.max_rounds,
+            "max_retries": args.max_retries, "prompt_strategy": args.prompt_strategy,
+            "stream": args.stream, "cache": not args.no_cache, "cache_path": args.cache_path,
+            "resume": args.resume, "checkpoint_every": args.checkpoint_every,
+        },
+        "clients": {"max_connections": args.max_connections, "keepalive": args.keepalive},
+        "rate_limits": {
+            provider: {"requests_per_minute": float(requests_per_minute),
+                       "tokens_per_minute": float(tokens_per_minute)}
+            for provider, requests_per_minute, tokens_per_minute in args.rate_limit},
+        "local": {
+            "illegal_rate": args.local_illegal_rate, "garbled_rate": args.local_garbled_rate,
+            "latency_mean": args.local_latency, "script": args.local_script, "seed": args.seed,
+        },
+    }
+    if args.checkpoint_every < 1:
+        parser.error("--checkpoint-every must be at least 1")
+    if args.hedge and args.samples > 1:
+        parser.error("--hedge and --samples cannot be combined")
+    if args.vote and args.samples < 2:
+        parser.error("--vote needs --samples of 2 or more")
+    if args.hedge or args.samples > 1:
+        config["hedging"] = {"mode": "hedge" if args.hedge else "fanout",
+                             "samples": args.samples, "vote": args.vote}
+    if args.cassette:
+        config["cassette"] = {"path": args.cassette, "mode": "replay" if args.replay else "record"}
+    elif args.replay:
+        parser.error("--replay needs --cassette")
+    if args.book or args.book_plies or args.model_book_plies or args.seed_moves:
+        config["opening"] = {
+            "book": args.book, "book_plies": args.book_plies,
+            "model_book_plies": {model: int(plies) for model, plies in args.model_book_plies},
+            "seed_moves": args.seed_moves, "seed": args.book_seed,
+        }
+    try:
+        runner.check_config(config)
+        runner.run(config, "benchmark")
+    except ValueError as e:
+        parser.error(str(e))
+
+
+if __name__ == "__main__":
+    main()